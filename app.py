@@ -2,9 +2,27 @@ import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 import pandas as pd
+import numpy as np
 import io
+import os
+import hashlib
+import tempfile
+
+import rates
+from cache import SCENARIO_CACHE, scenario_key
+from calculations import START_DATE, calculate_break_even
+from cashflow import build_schedule, schedule_from_result
+from export import EXPORT_FORMATS, available_formats, cash_flow_frame, export_bytes, export_to_temp_file, frame_chunks, record_chunks, simulation_chunks
+from jobs import JOBS
+from lengths import LengthDistribution, read_lengths
+import metrics
+from metrics import Metrics, set_recorder
+from ledger import LEDGER_COLUMNS, calculation_inputs, compare_to_forecast, ingest_ledger
+from portfolio import DEFAULT_HORIZON, evaluate_portfolio, load_projects, portfolio_summary
+from sensitivity import sensitivity_analysis
+from solver import DURATION_UNKNOWNS, RATE_UNKNOWNS, goal_seek
+from store import open_store
 
 # Your information
 about_info = {
@@ -15,195 +33,25 @@ about_info = {
     "last_updated": "July 2025"
 }
 
-def water_connection_value(size, length):
-    value = 0
-    if size == 25:
-        connection = 2200
-        water_meter = 750
-        meter_box = 170
-        value = connection + water_meter + meter_box
-        if length > 5:
-            value += (length - 5) * 190
-    elif size == 32:
-        connection = 2300
-        water_meter = 950
-        meter_box = 170
-        value = connection + water_meter + meter_box
-        if length > 5:
-            value += (length - 5) * 195
-    return value
-
-def sewer_connection_value(type_, length):
-    value = 0
-    if type_ == "mainline":
-        connection = 4700
-        cleanout = 1600
-        value = connection + cleanout
-        if length > 5:
-            value += (length - 5) * 360
-    elif type_ == "manhole":
-        connection = 4200
-        cleanout = 1600
-        value = connection + cleanout
-        if length > 5:
-            value += (length - 5) * 360
-    return value
-
-def water_connection_material_cost(size, length, pipe_cost, meter_cost, asphalt_cost, bedding_cost):
-    total_length = length + 1.5
-    pipe_cost = total_length * pipe_cost
-    meter_cost = meter_cost
-    fitting_cost = 0.2 * pipe_cost
-    asphalt_cost = 0.8 * 0.85 * length * 0.417 * asphalt_cost
-    bedding_cost = ((size / 1000) + 0.15) * 0.8 * length * 44
-    total_cost = (pipe_cost + meter_cost + fitting_cost + asphalt_cost + bedding_cost) * 1.15
-    return total_cost
-
-def sewer_connection_material_cost(length, pipe_cost, asphalt_cost, bedding_cost):
-    total_length = length + 1.5
-    pipe_cost = total_length * pipe_cost
-    fitting_cost = 0.2 * pipe_cost
-    asphalt_cost = 0.8 * 0.85 * length * 0.417 * asphalt_cost
-    bedding_cost = (0.15) * 0.8 * length * 44
-    total_cost = (pipe_cost + fitting_cost + asphalt_cost + bedding_cost) * 1.15
-    return total_cost
-
-def calculate_break_even(current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost, connection_rate=None, duration_months=None, prob_water=50, prob_25mm=50, prob_mainline=50):
-    prob_water = prob_water / 100
-    prob_25mm = prob_25mm / 100
-    prob_mainEOL = prob_mainline / 100
-
-    if prob_water < 0 or prob_water > 1 or prob_25mm < 0 or prob_25mm > 1 or prob_mainline < 0 or prob_mainline > 1:
-        return {"error": "Proportions and probabilities must be between 0 and 100"}
-    if current_expenses < 0 or invoices_received < 0 or store_stock_value < 0 or monthly_direct_cost < 0 or monthly_indirect_cost < 0:
-        return {"error": "Expenses, invoices, stock value, and costs must be positive"}
-    if (connection_rate is None and duration_months is None) or (connection_rate is not None and duration_months is not None):
-        return {"error": "Provide either connection rate or duration, not both or neither"}
-    if connection_rate is not None and connection_rate <= 0:
-        return {"error": "Connection rate must be positive"}
-    if duration_months is not None and duration_months <= 0:
-        return {"error": "Duration must be positive"}
-    if water_params['min_length'] < 0 or water_params['max_length'] < water_params['min_length']:
-        return {"error": "Connection lengths must be positive, and max_length must be at least min_length"}
-    if sewer_params['min_length'] < 0 or sewer_params['max_length'] < sewer_params['min_length']:
-        return {"error": "Connection lengths must be positive, and max_length must be at least min_length"}
-
-    net_current_expenses = current_expenses - invoices_received - store_stock_value
-    if net_current_expenses < 0:
-        return {"error": "Invoices received and store stock value cannot exceed current expenses"}
-
-    avg_water_length = (water_params['min_length'] + water_params['max_length']) / 2
-    avg_sewer_length = (sewer_params['min_length'] + sewer_params['max_length']) / 2
-
-    water_value_25 = water_connection_value(25, avg_water_length)
-    water_value_32 = water_connection_value(32, avg_water_length)
-    avg_water_value = (prob_25mm * water_value_25) + ((1 - prob_25mm) * water_value_32)
-    water_material_cost_25 = water_connection_material_cost(
-        25, avg_water_length, water_params['pipe_cost_25'], water_params['meter_cost_25'],
-        water_params['asphalt_cost'], water_params['bedding_cost']
-    )
-    water_material_cost_32 = water_connection_material_cost(
-        32, avg_water_length, water_params['pipe_cost_32'], water_params['meter_cost_32'],
-        water_params['asphalt_cost'], water_params['bedding_cost']
-    )
-    avg_water_material_cost = (prob_25mm * water_material_cost_25) + ((1 - prob_25mm) * water_material_cost_32)
+# Argument order of calculate_break_even, for turning the form inputs into a scenario dict
+SCENARIO_ARGUMENTS = ['current_expenses', 'invoices_received', 'store_stock_value', 'water_params', 'sewer_params',
+                      'monthly_direct_cost', 'monthly_indirect_cost', 'connection_rate', 'duration_months',
+                      'prob_water', 'prob_25mm', 'prob_mainline']
 
-    sewer_value_mainline = sewer_connection_value('mainline', avg_sewer_length)
-    sewer_value_manhole = sewer_connection_value('manhole', avg_sewer_length)
-    avg_sewer_value = (prob_mainline * sewer_value_mainline) + ((1 - prob_mainline) * sewer_value_manhole)
-    sewer_material_cost_mainline = sewer_connection_material_cost(
-        avg_sewer_length, sewer_params['pipe_cost'], sewer_params['asphalt_cost'], sewer_params['bedding_cost']
-    )
-    sewer_material_cost_manhole = sewer_connection_material_cost(
-        avg_sewer_length, sewer_params['pipe_cost'], sewer_params['asphalt_cost'], sewer_params['bedding_cost']
-    )
-    avg_sewer_material_cost = (prob_mainline * sewer_material_cost_mainline) + ((1 - prob_mainline) * sewer_material_cost_manhole)
-
-    avg_value_per_connection = (prob_water * avg_water_value) + ((1 - prob_water) * avg_sewer_value)
-    avg_material_cost_per_connection = (prob_water * avg_water_material_cost) + ((1 - prob_water) * avg_sewer_material_cost)
-
-    max_connection_rate = 50
-    min_direct_cost = monthly_direct_cost / max_connection_rate
-    min_indirect_cost = monthly_indirect_cost / max_connection_rate
-    min_total_cost = avg_material_cost_per_connection + min_direct_cost + min_indirect_cost
-    min_net_revenue = avg_value_per_connection - min_total_cost
-    min_break_even_connections = net_current_expenses / min_net_revenue if min_net_revenue > 0 else float('inf')
-    min_duration = min_break_even_connections / max_connection_rate if min_break_even_connections != float('inf') else float('inf')
-
-    if connection_rate is not None:
-        direct_cost_per_connection = monthly_direct_cost / connection_rate
-        indirect_cost_per_connection = monthly_indirect_cost / connection_rate
-        total_cost_per_connection = avg_material_cost_per_connection + direct_cost_per_connection + indirect_cost_per_connection
-        net_revenue_per_connection = avg_value_per_connection - total_cost_per_connection
-        if net_revenue_per_connection <= 0:
-            return {
-                "error": (
-                    f"Average value per connection (SAR {avg_value_per_connection:,.2f}) "
-                    f"must exceed total cost per connection (SAR {total_cost_per_connection:,.2f}). "
-                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
-                    f"Try reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}) "
-                    f"or increasing connection value."
-                )
-            }
-        break_even_connections = net_current_expenses / net_revenue_per_connection
-        break_even_connections_rounded = round(break_even_connections)
-        break_even_months = break_even_connections / connection_rate
-    else:
-        break_even_connections = (net_current_expenses + (monthly_direct_cost + monthly_indirect_cost) * duration_months) / (avg_value_per_connection - avg_material_cost_per_connection)
-        connection_rate = break_even_connections / duration_months
-        if connection_rate <= 0:
-            return {
-                "error": (
-                    f"Required connection rate ({connection_rate:,.2f} connections/month) is infeasible for the given duration ({duration_months} months). "
-                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
-                    f"Try increasing duration, reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}), "
-                    f"or increasing connection value."
-                )
-            }
-        direct_cost_per_connection = monthly_direct_cost / connection_rate
-        indirect_cost_per_connection = monthly_indirect_cost / connection_rate
-        total_cost_per_connection = avg_material_cost_per_connection + direct_cost_per_connection + indirect_cost_per_connection
-        net_revenue_per_connection = avg_value_per_connection - total_cost_per_connection
-        if net_revenue_per_connection <= 0:
-            return {
-                "error": (
-                    f"Average value per connection (SAR {avg_value_per_connection:,.2f}) "
-                    f"must exceed total cost per connection (SAR {total_cost_per_connection:,.2f}) for the given duration ({duration_months} months). "
-                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
-                    f"Try increasing duration, reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}), "
-                    f"or increasing connection value."
-                )
-            }
-        break_even_connections_rounded = round(break_even_connections)
-        break_even_months = duration_months
-
-    start_date = datetime(2025, 8, 1)
-    break_even_date = start_date + relativedelta(months=int(break_even_months), days=round((break_even_months % 1) * 30))
-    total_expenses = net_current_expenses + (break_even_connections_rounded * total_cost_per_connection)
-
-    return {
-        'current_expenses': current_expenses,
-        'invoices_received': invoices_received,
-        'store_stock_value': store_stock_value,
-        'net_current_expenses': net_current_expenses,
-        'avg_water_value': avg_water_value,
-        'avg_sewer_value': avg_sewer_value,
-        'avg_value_per_connection': avg_value_per_connection,
-        'avg_water_material_cost': avg_water_material_cost,
-        'avg_sewer_material_cost': avg_sewer_material_cost,
-        'avg_material_cost_per_connection': avg_material_cost_per_connection,
-        'direct_cost_per_connection': direct_cost_per_connection,
-        'indirect_cost_per_connection': indirect_cost_per_connection,
-        'total_cost_per_connection': total_cost_per_connection,
-        'net_revenue_per_connection': net_revenue_per_connection,
-        'connection_rate': connection_rate,
-        'break_even_connections': break_even_connections,
-        'break_even_connections_rounded': break_even_connections_rounded,
-        'break_even_months': break_even_months,
-        'break_even_date': break_even_date.strftime('%B %Y'),
-        'total_expenses_at_break_even': total_expenses,
-        'total_revenue_at_break_even': break_even_connections_rounded * avg_value_per_connection
-    }
+MAX_PLOT_POINTS = 500
+MONTH_ABBREVIATIONS = [datetime(2000, m, 1).strftime('%b') for m in range(1, 13)]
+
+# How often a panel with an unfinished background job refreshes itself
+JOB_REFRESH_SECONDS = 1.0
+# Processes per portfolio evaluation, so the jobs running at once share the CPUs
+PORTFOLIO_WORKERS = max(1, (os.cpu_count() or 1) // JOBS.max_workers)
+
+# Large exports are written here; the directory is removed when the server exits
+EXPORT_DIRECTORY = tempfile.TemporaryDirectory(prefix="break-even-exports-")
+
+def month_label(months_from_start):
+    month = START_DATE.month - 1 + months_from_start
+    return f"{MONTH_ABBREVIATIONS[month % 12]} {START_DATE.year + month // 12}"
 
 def plot_break_even(result):
     if "error" in result:
@@ -217,15 +65,16 @@ def plot_break_even(result):
         vertical_spacing=0.15
     )
 
-    # Data for plots
-    connections = list(range(0, int(result['break_even_connections_rounded'] * 1.5) + 1))
-    revenue = [c * result['avg_value_per_connection'] for c in connections]
-    total_expenses = [result['net_current_expenses'] + (c * result['total_cost_per_connection']) for c in connections]
-    start_date = datetime(2025, 8, 1)
-    months = [c / result['connection_rate'] for c in connections]
-    month_labels = [(start_date + relativedelta(months=int(m))).strftime('%b %Y') for m in months]
-    month_ticks = months[::max(1, int(len(months)/5))]
-    month_labels_ticks = month_labels[::max(1, int(len(months)/5))]
+    # Data for plots. Both series are straight lines, so a fixed number of
+    # evenly spaced connection counts draws them exactly at any project size.
+    last_connection = int(result['break_even_connections_rounded'] * 1.5)
+    connections = np.unique(np.linspace(0, last_connection, min(last_connection + 1, MAX_PLOT_POINTS)).round().astype(int))
+    revenue = connections * result['avg_value_per_connection']
+    total_expenses = result['net_current_expenses'] + (connections * result['total_cost_per_connection'])
+    months = connections / result['connection_rate']
+    tick_step = max(1, int((last_connection + 1) / 5))
+    month_ticks = np.arange(0, last_connection + 1, tick_step) / result['connection_rate']
+    month_labels_ticks = [month_label(int(m)) for m in month_ticks]
 
     # Plot 1: Revenue and Expenses by Connections
     fig.add_trace(
@@ -290,6 +139,312 @@ def plot_break_even(result):
 
     return fig
 
+def plot_tornado(analysis, top=12):
+    rows = [row for row in analysis['rows'] if row['swing'] > 0][:top][::-1]
+    # Inputs at 0 are moved by an absolute amount, shown in their label
+    # Inputs at a bound of their range only move one way; show how far
+    labels = [row['input'].replace('_', ' ') + (f" ({row['low_value']:,.4g} to {row['high_value']:,.4g})"
+                                                if row['base_value'] in (row['low_value'], row['high_value']) else "") for row in rows]
+    base = analysis['base']
+    step = int(analysis['step'] * 100)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        y=labels, x=[row['low'] - base for row in rows], base=base, orientation='h',
+        name=f"Input -{step}%", marker_color='#1f77b4'
+    ))
+    fig.add_trace(go.Bar(
+        y=labels, x=[row['high'] - base for row in rows], base=base, orientation='h',
+        name=f"Input +{step}%", marker_color='#ff7f0e'
+    ))
+    fig.add_vline(x=base, line=dict(color='#333333', width=1))
+    fig.update_layout(
+        title=dict(text=f"Sensitivity of {analysis['metric'].replace('_', ' ')} (±{step}% per input)", x=0.5, xanchor="center"),
+        barmode='overlay', template="plotly_white", height=max(300, 40 * len(rows) + 120),
+        legend=dict(orientation='h', y=-0.15), margin=dict(t=60, b=60, l=160, r=40)
+    )
+    return fig
+
+def cached_figure(key, make_figure):
+    # The shared cache keeps the figure as a plain spec; every caller gets its
+    # own Figure built from it, so no session can change another's chart
+    spec = SCENARIO_CACHE.get_or_compute(key, lambda: (lambda fig: fig.to_dict() if fig is not None else None)(make_figure()))
+    return go.Figure(spec) if spec is not None else None
+
+def build_figure(result):
+    with metrics.timer('figure_build', connections=result.get('break_even_connections_rounded')):
+        return plot_break_even(result)
+
+def results_csv(result):
+    with metrics.timer('serialization', format='csv', rows=1):
+        return export_bytes(record_chunks([result]), 'csv')
+
+def calculate(inputs, **lengths):
+    with metrics.timer('calculation', lengths=bool(lengths)):
+        return calculate_break_even(*inputs, **lengths)
+
+def diagnostics_panel(recorded):
+    stats = recorded.stats()
+    st.subheader("Diagnostics")
+    if not stats['stages']:
+        st.caption("No timings recorded yet; submit the form to time each stage.")
+    else:
+        st.dataframe(pd.DataFrame.from_dict(stats['stages'], orient='index').round(3), use_container_width=True)
+    if stats['counters']:
+        st.caption(", ".join(f"{name}: {value:,}" for name, value in stats['counters'].items()))
+    st.download_button("Download diagnostics log (JSON lines)", data=recorded.to_jsonl(), file_name="break_even_metrics.jsonl",
+                       mime="application/x-ndjson", key="diagnostics_log")
+    if st.button("Reset diagnostics", key="diagnostics_reset"):
+        recorded.reset()
+
+def export_panel(name, make_export, key):
+    # The file is written chunk by chunk to a temporary file only when the
+    # button is clicked, so building the export never holds it in memory.
+    # st.download_button only serves from memory, so the finished file is
+    # read back once for the download. Formats whose writer is not installed
+    # are not offered.
+    file_format = st.selectbox("Export format", available_formats(), key=f"export_format_{key}",
+                               format_func=lambda f: {'csv': "CSV", 'parquet': "Parquet (compressed)", 'xlsx': "Excel"}[f])
+    mime, extension = EXPORT_FORMATS[file_format]
+
+    def data():
+        chunks, cash_flow = make_export()
+        with metrics.timer('serialization', format=file_format, export=name):
+            path = export_to_temp_file(chunks, file_format, cash_flow, directory=EXPORT_DIRECTORY.name)
+        try:
+            with open(path, 'rb') as exported:
+                return exported.read()
+        finally:
+            os.remove(path)
+
+    st.download_button(f"Download {name}", data=data, file_name=f"{key}{extension}", mime=mime, key=f"export_{key}")
+
+def show_simulation(simulation, context):
+    st.subheader("Monte Carlo Simulation")
+    st.write(f"**Simulated Connections**: {simulation['simulated_connections']:,} over {simulation['trials']:,} projects")
+    st.write(f"**Mean Value per Connection**: SAR {simulation['mean_value_per_connection']:,.2f}")
+    st.write(f"**Mean Material Cost per Connection**: SAR {simulation['mean_material_cost_per_connection']:,.2f}")
+    for p in (10, 50, 90):
+        if np.isinf(simulation[f'break_even_connections_p{p}']):
+            st.write(f"**P{p} Break Even**: Never, within the simulated connections")
+            continue
+        st.write(f"**P{p} Break Even**: {simulation[f'break_even_connections_p{p}']:,.0f} connections, "
+                 f"{simulation[f'break_even_months_p{p}']:,.2f} months ({simulation[f'break_even_date_p{p}']})")
+    if simulation['never_break_even']:
+        st.warning(f"{simulation['never_break_even']:,} simulated projects did not break even.")
+
+def show_actuals(actuals, context):
+    result, inputs = context
+    (current_expenses, invoices_received, store_stock_value, water_params, sewer_params,
+     monthly_direct_cost, monthly_indirect_cost, connection_rate, duration_months,
+     prob_water, prob_25mm, prob_mainline) = inputs
+    st.subheader("Actual vs. Forecast")
+    st.write(f"**Completed Connections**: {actuals['connections']:,} "
+             f"({actuals['water_connections']:,} water, {actuals['sewer_connections']:,} sewer; "
+             f"{actuals['skipped_rows']:,} rows skipped)")
+    if actuals['unpriced_rows']:
+        st.warning(f"{actuals['unpriced_rows']:,} ledger rows have a water size or sewer type that tariff "
+                   f"{rates.RATES['version']} has no price for; they were skipped.")
+    st.dataframe(pd.DataFrame(compare_to_forecast(actuals, result, prob_water, prob_25mm, prob_mainline)), hide_index=True)
+    updated = calculation_inputs(actuals, water_params, sewer_params)
+    # Price the actual length histograms exactly rather than their mean length
+    rerun = calculate_break_even(
+        current_expenses, invoices_received, store_stock_value, updated['water_params'], updated['sewer_params'],
+        monthly_direct_cost, monthly_indirect_cost, connection_rate, duration_months,
+        updated.get('prob_water', prob_water), updated.get('prob_25mm', prob_25mm), updated.get('prob_mainline', prob_mainline),
+        water_lengths=LengthDistribution.from_ledger(actuals['water_length']) if actuals['water_connections'] else None,
+        sewer_lengths=LengthDistribution.from_ledger(actuals['sewer_length']) if actuals['sewer_connections'] else None
+    )
+    if "error" in rerun:
+        st.warning("With the actual mix and lengths: " + rerun["error"])
+    else:
+        st.write(f"**Break-Even with Actual Mix and Lengths**: {rerun['break_even_connections_rounded']} connections, "
+                 f"{rerun['break_even_months']:,.2f} months ({rerun['break_even_date']})")
+
+def start_job(kind, key, fn, *args, description="", context=None, **kwargs):
+    # Each session follows at most one job of each kind. Identical jobs are
+    # shared between sessions; a job nobody follows any more is cancelled.
+    jobs = st.session_state.setdefault('jobs', {})
+    current = jobs.get(kind)
+    if current is not None and current[0].key == key and current[0].status not in ('failed', 'cancelled'):
+        # The key only covers what the job computes; what its result is shown
+        # against (e.g. the forecast for actuals) is always the latest
+        jobs[kind] = (current[0], context)
+        return current[0]
+    job = JOBS.submit(key, fn, *args, description=description, **kwargs)
+    if current is not None:
+        JOBS.release(current[0])
+    jobs[kind] = (job, context)
+    return job
+
+def stop_job(kind):
+    current = st.session_state.get('jobs', {}).pop(kind, None)
+    if current is not None:
+        JOBS.release(current[0])
+
+def show_job(kind, polling=False):
+    entry = st.session_state.get('jobs', {}).get(kind)
+    if entry is None:
+        return
+    job, context = entry
+    if polling and job.finished:
+        # A fragment keeps the refresh interval it was started with; a full
+        # rerun shows the result in a panel that no longer refreshes
+        st.rerun()
+    if job.status == 'done':
+        JOB_RENDERERS[kind](job.result, context)
+        if kind in JOB_EXPORTS:
+            name, make_export = JOB_EXPORTS[kind]
+            export_panel(name, lambda: make_export(job.result), kind)
+    elif job.status == 'failed':
+        st.error(f"{job.description} failed: {job.error}")
+    elif job.status == 'cancelled':
+        st.warning(f"{job.description} was cancelled.")
+    else:
+        if job.status == 'queued':
+            st.info(f"{job.description} is queued (position {JOBS.queue_position(job)}; {JOBS.max_workers} jobs run at a time).")
+        elif job.total:
+            st.progress(job.progress, text=f"{job.description}: {job.done:,} of {job.total:,} ({job.elapsed:,.0f} s)")
+        else:
+            st.progress(0.0, text=f"{job.description}: {job.done:,} processed ({job.elapsed:,.0f} s)")
+        if st.button("Cancel", key=f"cancel_job_{kind}"):
+            stop_job(kind)
+            return
+        if job.partial is not None:
+            st.caption("Partial results so far")
+            JOB_RENDERERS[kind](job.partial, context)
+
+def job_panel(kind):
+    # Shows a job's progress or result in place; while the job is unfinished
+    # only this panel reruns, so the rest of the page stays responsive
+    entry = st.session_state.get('jobs', {}).get(kind)
+    if entry is None:
+        return
+    polling = not entry[0].finished
+    st.fragment(show_job, run_every=JOB_REFRESH_SECONDS if polling else None)(kind, polling)
+
+def cash_flow_section():
+    base = st.session_state.get('cash_flow_base')
+    if base is None:
+        return
+    result, monthly_direct_cost, monthly_indirect_cost = base
+
+    st.subheader("Monthly Cash Flow")
+    with st.expander("Schedule settings"):
+        default_months = min(240, max(12, int(result['break_even_months'] * 1.5) + 1))
+        months = st.number_input("Schedule length (months)", min_value=1, max_value=240, value=default_months, step=1)
+        ramp_up_months = st.number_input("Ramp-up period (months)", min_value=0, max_value=24, value=0, step=1)
+        slow_months = st.multiselect("Slow calendar months (e.g., Ramadan, summer)", list(range(1, 13)),
+                                     format_func=lambda m: datetime(2000, m, 1).strftime('%B'))
+        slow_factor = st.slider("Connection rate in slow months (%)", 0, 100, 50) / 100
+
+    # Rebuild the schedule only when the settings change; table edits update it in place
+    key = (result['net_current_expenses'], result['avg_value_per_connection'], result['avg_material_cost_per_connection'],
+           result['connection_rate'], monthly_direct_cost, monthly_indirect_cost, months, ramp_up_months, tuple(slow_months), slow_factor)
+    if st.session_state.get('cash_flow_key') != key:
+        st.session_state['cash_flow'] = schedule_from_result(result, *build_schedule(
+            months, result['connection_rate'], monthly_direct_cost, monthly_indirect_cost,
+            ramp_up_months=ramp_up_months, slow_months=slow_months, slow_factor=slow_factor
+        ))
+        st.session_state['cash_flow_key'] = key
+        st.session_state['cash_flow_table'] = st.session_state.get('cash_flow_table', 0) + 1
+    schedule = st.session_state['cash_flow']
+
+    columns = ['Connections', 'Direct Cost (SAR)', 'Indirect Cost (SAR)']
+    table = pd.DataFrame({
+        'Month': schedule.month_labels(),
+        'Connections': schedule.connection_rates,
+        'Direct Cost (SAR)': schedule.direct_costs,
+        'Indirect Cost (SAR)': schedule.indirect_costs
+    })
+    edited = st.data_editor(table, disabled=['Month'], hide_index=True, key=f"cash_flow_table_{st.session_state['cash_flow_table']}")
+    changed = (edited[columns].to_numpy() != table[columns].to_numpy()).any(axis=1).nonzero()[0]
+    if changed.size:
+        first = int(changed[0])
+        try:
+            schedule.update(first, *(edited[c].to_numpy()[first:] for c in columns))
+        except ValueError as e:
+            st.error(str(e))
+
+    cash_flow = schedule.break_even()
+    if "error" in cash_flow:
+        st.warning(cash_flow["error"])
+    else:
+        st.write(f"**Break-Even Month**: {cash_flow['break_even_date']} ({cash_flow['break_even_months']:,.2f} months)")
+        st.write(f"**Connections at Break Even**: {cash_flow['break_even_connections_rounded']}")
+        st.write(f"**Maximum Cash Exposure**: SAR {cash_flow['max_cash_exposure']:,.2f}")
+    if 'xlsx' in available_formats():
+        st.download_button(
+            label="Download Results with Monthly Cash Flow (Excel)",
+            data=lambda: export_bytes(record_chunks([result]), 'xlsx', cash_flow=cash_flow_frame(schedule)),
+            file_name="breakeven_cash_flow.xlsx",
+            mime=EXPORT_FORMATS['xlsx'][0]
+        )
+    st.line_chart(pd.DataFrame({
+        'Cumulative Revenue': schedule.cumulative_revenue,
+        'Cumulative Expenses': schedule.cumulative_expenses
+    }, index=pd.Index(range(1, len(schedule) + 1), name='Month')))
+
+def run_portfolio(text, progress=None):
+    records = load_projects(io.StringIO(text))
+    results = evaluate_portfolio(records, workers=PORTFOLIO_WORKERS, progress=progress)
+    return results, portfolio_summary(results)
+
+def show_portfolio(evaluated, context):
+    results, summary = evaluated
+    st.dataframe(pd.DataFrame(summary), hide_index=True)
+    st.line_chart(pd.DataFrame(results['timelines'], index=pd.Index(range(1, DEFAULT_HORIZON + 1), name='Month')))
+    st.dataframe(pd.DataFrame({k: v for k, v in results.items() if k != 'timelines'}), hide_index=True)
+
+def portfolio_section():
+    with st.expander("Portfolio: evaluate many projects at once"):
+        projects_file = st.file_uploader("Project definitions (JSON or CSV, same fields as the form)", type=["json", "jsonl", "csv"], key="portfolio_file")
+        if projects_file is None:
+            stop_job('portfolio')
+            return
+        portfolio_key = ('portfolio', hashlib.sha1(projects_file.getvalue()).hexdigest(), rates.RATES['version'])
+        start_job('portfolio', portfolio_key, run_portfolio, projects_file.getvalue().decode("utf-8"), description="Portfolio evaluation")
+        job_panel('portfolio')
+
+def saved_scenarios_section(store):
+    with st.expander("Saved scenarios"):
+        projects = store.projects()
+        if not projects:
+            st.write("Calculated scenarios are saved here.")
+            return
+        project = st.selectbox("Project", ["All"] + projects, key="saved_project")
+        feasible_only = st.checkbox("Only scenarios that break even", key="saved_feasible")
+        max_months = st.number_input("Break even within (months, 0 for any)", min_value=0.0, value=0.0, step=1.0, key="saved_max_months")
+        saved = store.list(project=None if project == "All" else project, feasible=True if feasible_only else None,
+                           break_even_months=(None, max_months or None), limit=200)
+        st.dataframe(pd.DataFrame(saved), hide_index=True)
+        ids = [row['id'] for row in saved]
+
+        reload_id = st.selectbox("Reload scenario", ["None"] + ids, key="saved_reload")
+        if reload_id != "None":
+            # Stored results are shown as saved, without recalculating
+            scenario = store.load(reload_id)
+            result = scenario['result']
+            if "error" in result:
+                st.error(result["error"])
+            else:
+                st.dataframe(pd.DataFrame([result]), hide_index=True)
+                fig = cached_figure(('saved_figure', store.path, reload_id, scenario['created_at']), lambda: build_figure(result))
+                if fig:
+                    st.plotly_chart(fig, use_container_width=True)
+                if st.session_state.get('saved_reloaded') != reload_id:
+                    inputs = scenario['inputs']
+                    st.session_state['cash_flow_base'] = (result, inputs['monthly_direct_cost'], inputs['monthly_indirect_cost'])
+            st.session_state['saved_reloaded'] = reload_id
+
+        compared = st.multiselect("Compare two scenarios", ids, max_selections=2, key="saved_compare")
+        if len(compared) == 2:
+            differences = store.diff(*compared)
+            if differences:
+                # Values mix numbers and text (dates, errors), so show them as text
+                st.dataframe(pd.DataFrame(differences).astype({'first': str, 'second': str}), hide_index=True)
+            else:
+                st.write("The two scenarios are identical.")
+
 def main():
     st.title("Break-Even Calculator for House Connection Project")
     st.write("Enter project details to calculate the break-even point for a water and sewer connection project in Saudi Arabia (all monetary values in SAR).")
@@ -302,8 +457,22 @@ def main():
         st.write(f"**Contact**: {about_info['contact']}")
         st.write(f"**Project**: {about_info['project']}")
         st.write(f"**Last Updated**: {about_info['last_updated']}")
+        st.write(f"**Tariff Version**: {rates.RATES['version']}")
+        cache_caption = st.empty()
+        jobs_caption = st.empty()
+        # Each session with diagnostics on records into its own Metrics; the
+        # others record nothing (unless BREAK_EVEN_METRICS turns on METRICS)
+        if st.checkbox("Show diagnostics", key="show_diagnostics", help="Time each calculation stage and export the timings as a log"):
+            set_recorder(st.session_state.setdefault('metrics', Metrics(enabled=True)))
+        else:
+            set_recorder(None)
+        diagnostics = st.container()
+
+    store = open_store()
 
     with st.form("input_form"):
+        project_name = st.text_input("Project name", value="Default")
+
         st.subheader("Project Expenses")
         current_expenses = st.number_input("Current project expenses (SAR)", min_value=0.0, step=1000.0, format="%.2f")
         invoices_received = st.number_input("Invoices already received (SAR)", min_value=0.0, step=1000.0, format="%.2f")
@@ -312,6 +481,9 @@ def main():
         st.subheader("Connection Lengths")
         min_connection_length = st.number_input("Minimum connection length (meters)", min_value=0.0, step=1.0, format="%.2f")
         max_connection_length = st.number_input("Maximum connection length (meters)", min_value=0.0, step=1.0, format="%.2f")
+        survey_file = st.file_uploader("Surveyed connection lengths (optional CSV)", type=["csv"],
+                                       help="Either a length column (optionally count and connection_type), "
+                                            "or a histogram with low, high and count columns")
 
         st.subheader("Material Costs")
         water_pipe_cost_25 = st.number_input("Water pipe cost for 25mm (SAR/meter)", min_value=0.0, step=10.0, format="%.2f")
@@ -340,6 +512,27 @@ def main():
         else:
             duration_months = st.number_input("Desired break-even duration (months)", min_value=0.01, step=1.0, format="%.2f")
 
+        st.subheader("Simulation")
+        run_simulation = st.checkbox("Simulate connection length and mix uncertainty (Monte Carlo)")
+        simulation_trials = st.number_input("Number of simulated projects", min_value=100, max_value=100000, value=10000, step=1000)
+        simulation_seed = st.number_input("Random seed", min_value=0, value=0, step=1)
+
+        st.subheader("Goal Seek")
+        # With a connection rate the goal is a break-even time; with a duration
+        # it is the connection rate that duration needs
+        if connection_rate is not None:
+            goal_unknowns, goal_metric = RATE_UNKNOWNS, 'break_even_months'
+            goal_label, goal_default = "Target break-even time (months)", 24.0
+        else:
+            goal_unknowns, goal_metric = DURATION_UNKNOWNS, 'connection_rate'
+            goal_label, goal_default = "Target connection rate (connections per month)", 50.0
+        goal_unknown = st.selectbox("Solve for", ["None"] + goal_unknowns, format_func=lambda name: name.replace('_', ' ').capitalize())
+        goal_target = st.number_input(goal_label, min_value=0.01, value=goal_default, step=1.0, format="%.2f")
+
+        st.subheader("Actuals")
+        ledger_file = st.file_uploader("Completed-connection ledger (CSV or Parquet)", type=["csv", "parquet"],
+                                       help="Columns: " + ", ".join(f"{k} ({v})" for k, v in LEDGER_COLUMNS.items()))
+
         submitted = st.form_submit_button("Calculate Break-Even")
 
     water_params = {
@@ -361,15 +554,30 @@ def main():
     }
 
     if submitted:
-        result = calculate_break_even(
+        metrics.count('submissions')
+        st.session_state['calculated'] = True
+
+    # Form values only change on submit, so the results of the last submit
+    # stay on the page when anything else reruns it (all steps are cached)
+    if st.session_state.get('calculated'):
+        inputs = (
             current_expenses, invoices_received, store_stock_value, water_params, sewer_params,
             monthly_direct_cost, monthly_indirect_cost, connection_rate, duration_months,
             prob_water, prob_25mm, prob_mainline
         )
+        key = scenario_key(rates.RATES['version'], *inputs)
+        # Every run is saved; a scenario already in the store is not recalculated
+        result = SCENARIO_CACHE.get_or_compute(('result', key, project_name), lambda: store.get_or_compute(
+            dict(zip(SCENARIO_ARGUMENTS, inputs)), rates.RATES['version'], lambda: calculate(inputs), project_name or "Default"
+        ))
 
         if "error" in result:
             st.error(result["error"])
+            st.session_state.pop('cash_flow_base', None)
+            stop_job('ledger')
+            stop_job('simulation')
         else:
+            st.session_state['cash_flow_base'] = (result, monthly_direct_cost, monthly_indirect_cost)
             st.subheader("Break-Even Analysis Results")
             st.write(f"**Current Project Expenses**: SAR {result['current_expenses']:,.2f}")
             st.write(f"**Invoices Already Received**: SAR {result['invoices_received']:,.2f}")
@@ -393,21 +601,117 @@ def main():
             st.write(f"**Total Expenses at Break Even**: SAR {result['total_expenses_at_break_even']:,.2f}")
             st.write(f"**Total Revenue at Break Even**: SAR {result['total_revenue_at_break_even']:,.2f}")
 
-            fig = plot_break_even(result)
+            fig = cached_figure(('figure', key), lambda: build_figure(result))
             if fig:
                 st.plotly_chart(fig, use_container_width=True)
             else:
                 st.warning("Plot could not be generated. Please check input values.")
 
-            df = pd.DataFrame([result])
-            buffer = io.StringIO()
-            df.to_csv(buffer, index=False)
+            if survey_file is not None:
+                survey_key = hashlib.sha1(survey_file.getvalue()).hexdigest()
+                try:
+                    surveyed = SCENARIO_CACHE.get_or_compute(('lengths', survey_key), lambda: read_lengths(io.BytesIO(survey_file.getvalue())))
+                except (ValueError, KeyError) as e:
+                    st.error(f"Could not read length survey: {e}")
+                else:
+                    exact = SCENARIO_CACHE.get_or_compute(
+                        ('result', key, 'lengths', survey_key),
+                        lambda: calculate(inputs, water_lengths=surveyed['water'], sewer_lengths=surveyed['sewer'])
+                    )
+                    st.subheader("Pricing with Surveyed Lengths")
+                    st.write(f"**Surveyed Connections**: {surveyed['water'].count:,.0f} water "
+                             f"(mean {surveyed['water'].mean:,.2f} m), {surveyed['sewer'].count:,.0f} sewer "
+                             f"(mean {surveyed['sewer'].mean:,.2f} m)")
+                    if "error" in exact:
+                        st.warning("With the surveyed lengths: " + exact["error"])
+                    else:
+                        st.dataframe(pd.DataFrame({
+                            'measure': ['Value per connection (SAR)', 'Material cost per connection (SAR)', 'Break-even connections', 'Break-even months'],
+                            'midpoint length': [result['avg_value_per_connection'], result['avg_material_cost_per_connection'],
+                                                result['break_even_connections'], result['break_even_months']],
+                            'surveyed lengths': [exact['avg_value_per_connection'], exact['avg_material_cost_per_connection'],
+                                                 exact['break_even_connections'], exact['break_even_months']]
+                        }), hide_index=True)
+                        st.write(f"**Break-Even Date with Surveyed Lengths**: {exact['break_even_date']}")
+
+            if ledger_file is not None:
+                ledger_key = hashlib.sha1(ledger_file.getvalue()).hexdigest()
+                start_job('ledger', ('ledger', ledger_key, scenario_key(water_params, sewer_params)), ingest_ledger,
+                          io.BytesIO(ledger_file.getvalue()), water_params, sewer_params,
+                          file_format='parquet' if ledger_file.name.lower().endswith('.parquet') else 'csv',
+                          description="Ledger import", context=(result, inputs))
+            else:
+                stop_job('ledger')
+
+            analysis = SCENARIO_CACHE.get_or_compute(('sensitivity', key), lambda: sensitivity_analysis(dict(zip(SCENARIO_ARGUMENTS, inputs))))
+            if "error" not in analysis:
+                st.subheader("Sensitivity")
+                st.plotly_chart(cached_figure(('tornado', key), lambda: plot_tornado(analysis)), use_container_width=True)
+                st.dataframe(pd.DataFrame(analysis['rows'][:12]), hide_index=True)
+                if analysis['infeasible']:
+                    st.caption("Inputs whose change makes the scenario infeasible")
+                    st.dataframe(pd.DataFrame(analysis['infeasible'])[['input', 'base_value', 'low_value', 'high_value', 'error']], hide_index=True)
+
+            if run_simulation:
+                from simulation import simulate_break_even
+                start_job('simulation', ('simulation', key, int(simulation_trials), int(simulation_seed)), simulate_break_even,
+                          *inputs, trials=int(simulation_trials), seed=int(simulation_seed), description="Monte Carlo simulation")
+            else:
+                stop_job('simulation')
+
             st.download_button(
                 label="Download Results as CSV",
-                data=buffer.getvalue(),
+                data=SCENARIO_CACHE.get_or_compute(('csv', key), lambda: results_csv(result)),
                 file_name="breakeven_results.csv",
                 mime="text/csv"
             )
 
+        if goal_unknown != "None":
+            scenario = dict(zip(SCENARIO_ARGUMENTS, inputs))
+            goal = SCENARIO_CACHE.get_or_compute(('goal_seek', key, goal_unknown, goal_metric, goal_target),
+                                                 lambda: goal_seek(scenario, goal_unknown, goal_target, goal_metric))
+            st.subheader("Goal Seek")
+            if "error" in goal:
+                st.error(goal["error"])
+            else:
+                bound = "Highest" if goal['direction'] == 'maximum' else "Lowest"
+                goal_text = (f"to break even within {goal_target:,.2f} months" if goal_metric == 'break_even_months'
+                             else f"to need at most {goal_target:,.2f} connections per month")
+                st.write(f"**{bound} {goal_unknown.replace('_', ' ')} {goal_text}**: {goal['value']:,.2f}")
+                st.write(f"**Break-Even Date at this Value**: {goal['result']['break_even_date']} "
+                         f"({goal['result']['break_even_months']:,.2f} months)")
+                if goal_metric == 'connection_rate':
+                    st.write(f"**Connection Rate Needed at this Value**: {goal['result']['connection_rate']:,.2f} connections/month")
+                st.caption(f"Solved in {goal['iterations']} batched iterations ({goal['evaluations']} evaluations).")
+
+    # Background job results stay on the page until a submit replaces them
+    job_panel('ledger')
+    job_panel('simulation')
+    saved_scenarios_section(store)
+    cash_flow_section()
+    portfolio_section()
+
+    job_stats = JOBS.stats()
+    jobs_caption.caption(f"Background jobs: {job_stats['running']} running, {job_stats['queued']} queued "
+                         f"({job_stats['max_workers']} at a time)")
+
+    cache_stats = SCENARIO_CACHE.stats()
+    cache_caption.caption(f"Scenario cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                          f"{cache_stats['entries']}/{cache_stats['maxsize']} entries, "
+                          f"{cache_stats['bytes'] / 2**20:,.1f}/{cache_stats['maxbytes'] / 2**20:,.0f} MiB")
+    if st.session_state.get('show_diagnostics'):
+        with diagnostics:
+            diagnostics_panel(st.session_state['metrics'])
+
+JOB_RENDERERS = {'simulation': show_simulation, 'ledger': show_actuals, 'portfolio': show_portfolio}
+# Job results that can be downloaded: label and a function returning (chunks, per-month cash flow)
+JOB_EXPORTS = {
+    'simulation': ("simulated projects", lambda simulation: (simulation_chunks(simulation), None)),
+    'portfolio': ("portfolio results", lambda evaluated: (
+        frame_chunks(evaluated[0]),
+        pd.DataFrame({'month': np.arange(1, DEFAULT_HORIZON + 1), **evaluated[0]['timelines']})
+    ))
+}
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,239 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from calculations import START_DATE, WATER_PARAM_KEYS, SEWER_PARAM_KEYS
+from metrics import recorder
+from rates import water_connection_value, sewer_connection_value, water_connection_material_cost, sewer_connection_material_cost
+
+# Per-row error codes, checked in the same order as calculate_break_even
+ERROR_NONE = 0
+ERROR_PROBABILITY = 1
+ERROR_NEGATIVE_COST = 2
+ERROR_RATE_OR_DURATION = 3
+ERROR_RATE = 4
+ERROR_DURATION = 5
+ERROR_WATER_LENGTH = 6
+ERROR_SEWER_LENGTH = 7
+ERROR_NET_EXPENSES = 8
+ERROR_RATE_NET_REVENUE = 9
+ERROR_DURATION_RATE = 10
+ERROR_DURATION_NET_REVENUE = 11
+
+ERROR_MESSAGES = {
+    ERROR_PROBABILITY: "Proportions and probabilities must be between 0 and 100",
+    ERROR_NEGATIVE_COST: "Expenses, invoices, stock value, and costs must be positive",
+    ERROR_RATE_OR_DURATION: "Provide either connection rate or duration, not both or neither",
+    ERROR_RATE: "Connection rate must be positive",
+    ERROR_DURATION: "Duration must be positive",
+    ERROR_WATER_LENGTH: "Connection lengths must be positive, and max_length must be at least min_length",
+    ERROR_SEWER_LENGTH: "Connection lengths must be positive, and max_length must be at least min_length",
+    ERROR_NET_EXPENSES: "Invoices received and store stock value cannot exceed current expenses",
+    ERROR_RATE_NET_REVENUE: "Average value per connection must exceed total cost per connection",
+    ERROR_DURATION_RATE: "Required connection rate is infeasible for the given duration",
+    ERROR_DURATION_NET_REVENUE: "Average value per connection must exceed total cost per connection for the given duration",
+}
+
+RESULT_KEYS = [
+    'current_expenses', 'invoices_received', 'store_stock_value', 'net_current_expenses',
+    'avg_water_value', 'avg_sewer_value', 'avg_value_per_connection',
+    'avg_water_material_cost', 'avg_sewer_material_cost', 'avg_material_cost_per_connection',
+    'direct_cost_per_connection', 'indirect_cost_per_connection', 'total_cost_per_connection',
+    'net_revenue_per_connection', 'connection_rate', 'break_even_connections',
+    'break_even_connections_rounded', 'break_even_months', 'break_even_date',
+    'total_expenses_at_break_even', 'total_revenue_at_break_even'
+]
+
+START_MONTH = np.datetime64(START_DATE, 'M')
+MAX_DATE_MONTHS = (9999 - START_DATE.year) * 12
+
+
+def _as_float(value):
+    if value is None:
+        return np.array(np.nan)
+    return np.asarray(value, dtype=float)
+
+
+def format_break_even_dates(break_even_months):
+    # relativedelta(months=int(m), days=round((m % 1) * 30)) from 1 August 2025, formatted once per distinct month
+    months = np.asarray(break_even_months, dtype=float)
+    dates = np.full(months.shape, None, dtype=object)
+    # Dates past year 9999 cannot be represented by datetime, so they stay None
+    valid = np.isfinite(months) & (months < MAX_DATE_MONTHS)
+    if not valid.any():
+        return dates
+    m = months[valid]
+    whole = np.floor(m).astype(np.int64)
+    days = np.round(np.mod(m, 1) * 30).astype(np.int64)
+    day = (START_MONTH + whole).astype('datetime64[D]') + days
+    month_index = day.astype('datetime64[M]')
+    unique_months, inverse = np.unique(month_index, return_inverse=True)
+    labels = np.array([datetime(int(u.astype(int)) // 12 + 1970, int(u.astype(int)) % 12 + 1, 1).strftime('%B %Y') for u in unique_months], dtype=object)
+    dates[valid] = labels[inverse.reshape(-1)]
+    return dates
+
+
+def calculate_break_even_batch(current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost, connection_rate=None, duration_months=None, prob_water=50, prob_25mm=50, prob_mainline=50):
+    # Same arguments as calculate_break_even, but every number (including the
+    # water_params/sewer_params values) may be an array. None or NaN in
+    # connection_rate/duration_months means "not given" for that row.
+    metrics = recorder()
+    start = metrics is not None and time.perf_counter()
+    names = ['current_expenses', 'invoices_received', 'store_stock_value', 'monthly_direct_cost', 'monthly_indirect_cost',
+             'connection_rate', 'duration_months', 'prob_water', 'prob_25mm', 'prob_mainline']
+    values = [current_expenses, invoices_received, store_stock_value, monthly_direct_cost, monthly_indirect_cost,
+              connection_rate, duration_months, prob_water, prob_25mm, prob_mainline]
+    names += ['water_' + k for k in WATER_PARAM_KEYS] + ['sewer_' + k for k in SEWER_PARAM_KEYS]
+    values += [water_params[k] for k in WATER_PARAM_KEYS] + [sewer_params[k] for k in SEWER_PARAM_KEYS]
+    x = dict(zip(names, np.broadcast_arrays(*[_as_float(v) for v in values])))
+    shape = x['current_expenses'].shape
+
+    prob_water = x['prob_water'] / 100
+    prob_25mm = x['prob_25mm'] / 100
+    # calculate_break_even compares and weights prob_mainline without dividing by 100
+    prob_mainline = x['prob_mainline']
+    current_expenses = x['current_expenses']
+    invoices_received = x['invoices_received']
+    store_stock_value = x['store_stock_value']
+    monthly_direct_cost = x['monthly_direct_cost']
+    monthly_indirect_cost = x['monthly_indirect_cost']
+    connection_rate = x['connection_rate']
+    duration_months = x['duration_months']
+    has_rate = ~np.isnan(connection_rate)
+    has_duration = ~np.isnan(duration_months)
+
+    error = np.zeros(shape, dtype=np.int8)
+
+    def flag(code, condition):
+        error[(error == ERROR_NONE) & condition] = code
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        flag(ERROR_PROBABILITY, (prob_water < 0) | (prob_water > 1) | (prob_25mm < 0) | (prob_25mm > 1) | (prob_mainline < 0) | (prob_mainline > 1))
+        flag(ERROR_NEGATIVE_COST, (current_expenses < 0) | (invoices_received < 0) | (store_stock_value < 0) | (monthly_direct_cost < 0) | (monthly_indirect_cost < 0))
+        flag(ERROR_RATE_OR_DURATION, has_rate == has_duration)
+        flag(ERROR_RATE, has_rate & (connection_rate <= 0))
+        flag(ERROR_DURATION, has_duration & (duration_months <= 0))
+        flag(ERROR_WATER_LENGTH, (x['water_min_length'] < 0) | (x['water_max_length'] < x['water_min_length']))
+        flag(ERROR_SEWER_LENGTH, (x['sewer_min_length'] < 0) | (x['sewer_max_length'] < x['sewer_min_length']))
+
+        net_current_expenses = current_expenses - invoices_received - store_stock_value
+        flag(ERROR_NET_EXPENSES, net_current_expenses < 0)
+
+        avg_water_length = (x['water_min_length'] + x['water_max_length']) / 2
+        avg_sewer_length = (x['sewer_min_length'] + x['sewer_max_length']) / 2
+
+        water_value_25 = water_connection_value(25, avg_water_length)
+        water_value_32 = water_connection_value(32, avg_water_length)
+        avg_water_value = (prob_25mm * water_value_25) + ((1 - prob_25mm) * water_value_32)
+        water_material_cost_25 = water_connection_material_cost(
+            25, avg_water_length, x['water_pipe_cost_25'], x['water_meter_cost_25'],
+            x['water_asphalt_cost'], x['water_bedding_cost']
+        )
+        water_material_cost_32 = water_connection_material_cost(
+            32, avg_water_length, x['water_pipe_cost_32'], x['water_meter_cost_32'],
+            x['water_asphalt_cost'], x['water_bedding_cost']
+        )
+        avg_water_material_cost = (prob_25mm * water_material_cost_25) + ((1 - prob_25mm) * water_material_cost_32)
+
+        sewer_value_mainline = sewer_connection_value('mainline', avg_sewer_length)
+        sewer_value_manhole = sewer_connection_value('manhole', avg_sewer_length)
+        avg_sewer_value = (prob_mainline * sewer_value_mainline) + ((1 - prob_mainline) * sewer_value_manhole)
+        sewer_material_cost = sewer_connection_material_cost(
+            avg_sewer_length, x['sewer_pipe_cost'], x['sewer_asphalt_cost'], x['sewer_bedding_cost']
+        )
+        avg_sewer_material_cost = (prob_mainline * sewer_material_cost) + ((1 - prob_mainline) * sewer_material_cost)
+
+        avg_value_per_connection = (prob_water * avg_water_value) + ((1 - prob_water) * avg_sewer_value)
+        avg_material_cost_per_connection = (prob_water * avg_water_material_cost) + ((1 - prob_water) * avg_sewer_material_cost)
+
+        # Option 2 rows solve for the connection rate first
+        duration_break_even = (net_current_expenses + (monthly_direct_cost + monthly_indirect_cost) * duration_months) / (avg_value_per_connection - avg_material_cost_per_connection)
+        duration_rate = duration_break_even / duration_months
+        flag(ERROR_DURATION_RATE, has_duration & ~(duration_rate > 0))
+        connection_rate = np.where(has_rate, connection_rate, duration_rate)
+
+        direct_cost_per_connection = monthly_direct_cost / connection_rate
+        indirect_cost_per_connection = monthly_indirect_cost / connection_rate
+        total_cost_per_connection = avg_material_cost_per_connection + direct_cost_per_connection + indirect_cost_per_connection
+        net_revenue_per_connection = avg_value_per_connection - total_cost_per_connection
+        flag(ERROR_RATE_NET_REVENUE, has_rate & (net_revenue_per_connection <= 0))
+        flag(ERROR_DURATION_NET_REVENUE, has_duration & (net_revenue_per_connection <= 0))
+
+        break_even_connections = np.where(has_rate, net_current_expenses / net_revenue_per_connection, duration_break_even)
+        break_even_connections_rounded = np.round(break_even_connections)
+        break_even_months = np.where(has_rate, break_even_connections / connection_rate, duration_months)
+        total_expenses = net_current_expenses + (break_even_connections_rounded * total_cost_per_connection)
+        total_revenue = break_even_connections_rounded * avg_value_per_connection
+
+    ok = error == ERROR_NONE
+    break_even_months = np.where(ok, break_even_months, np.nan)
+    columns = {
+        'current_expenses': current_expenses,
+        'invoices_received': invoices_received,
+        'store_stock_value': store_stock_value,
+        'net_current_expenses': net_current_expenses,
+        'avg_water_value': avg_water_value,
+        'avg_sewer_value': avg_sewer_value,
+        'avg_value_per_connection': avg_value_per_connection,
+        'avg_water_material_cost': avg_water_material_cost,
+        'avg_sewer_material_cost': avg_sewer_material_cost,
+        'avg_material_cost_per_connection': avg_material_cost_per_connection,
+        'direct_cost_per_connection': direct_cost_per_connection,
+        'indirect_cost_per_connection': indirect_cost_per_connection,
+        'total_cost_per_connection': total_cost_per_connection,
+        'net_revenue_per_connection': net_revenue_per_connection,
+        'connection_rate': connection_rate,
+        'break_even_connections': break_even_connections,
+        'break_even_connections_rounded': break_even_connections_rounded,
+        'break_even_months': break_even_months,
+        'total_expenses_at_break_even': total_expenses,
+        'total_revenue_at_break_even': total_revenue
+    }
+    result = {}
+    for key in RESULT_KEYS:
+        if key == 'break_even_date':
+            result[key] = format_break_even_dates(break_even_months)
+        elif key in ('current_expenses', 'invoices_received', 'store_stock_value'):
+            result[key] = columns[key].copy()
+        else:
+            result[key] = np.where(ok, columns[key], np.nan)
+    result['error_code'] = error
+    if start:
+        metrics.lap('batch', start)
+        metrics.count('batch_rows', error.size)
+    return result
+
+
+def calculate_break_even_frame(scenarios):
+    # One scenario per row. Water and sewer parameters are read from columns
+    # prefixed with "water_" and "sewer_" (e.g. water_pipe_cost_25, sewer_min_length).
+    import pandas as pd
+
+    def column(name, default=None):
+        if name in scenarios:
+            return scenarios[name].to_numpy(dtype=float)
+        return default
+
+    water_params = {k: column('water_' + k) for k in WATER_PARAM_KEYS}
+    sewer_params = {k: column('sewer_' + k) for k in SEWER_PARAM_KEYS}
+    result = calculate_break_even_batch(
+        column('current_expenses'), column('invoices_received'), column('store_stock_value'),
+        water_params, sewer_params, column('monthly_direct_cost'), column('monthly_indirect_cost'),
+        column('connection_rate'), column('duration_months'),
+        column('prob_water', 50), column('prob_25mm', 50), column('prob_mainline', 50)
+    )
+    frame = pd.DataFrame(result, index=scenarios.index)
+    frame['error'] = frame['error_code'].map(ERROR_MESSAGES)
+    return frame
+
+
+def batch_row(result, i):
+    # Pull one scenario back out of a batch result in the shape calculate_break_even returns
+    code = int(result['error_code'][i])
+    if code != ERROR_NONE:
+        return {"error": ERROR_MESSAGES[code]}
+    row = {key: result[key][i] for key in RESULT_KEYS}
+    row = {key: value.item() if isinstance(value, np.generic) else value for key, value in row.items()}
+    row['break_even_connections_rounded'] = int(row['break_even_connections_rounded'])
+    return row
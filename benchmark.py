@@ -0,0 +1,349 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import rates
+from calculations import calculate_break_even, evaluate_record
+from batch import calculate_break_even_batch, batch_row
+from metrics import METRICS
+from portfolio import evaluate_portfolio
+from server import PooledHTTPServer
+from store import ScenarioStore
+
+
+def random_scenarios(n, seed=0):
+    rng = np.random.default_rng(seed)
+    min_length = rng.uniform(0, 10, n)
+    scenarios = {
+        'current_expenses': rng.uniform(1e5, 5e6, n),
+        'invoices_received': rng.uniform(0, 5e4, n),
+        'store_stock_value': rng.uniform(0, 5e4, n),
+        'water_params': {
+            'min_length': min_length,
+            'max_length': min_length + rng.uniform(0, 10, n),
+            'pipe_cost_25': rng.uniform(5, 30, n),
+            'pipe_cost_32': rng.uniform(10, 40, n),
+            'meter_cost_25': rng.uniform(200, 600, n),
+            'meter_cost_32': rng.uniform(300, 800, n),
+            'asphalt_cost': rng.uniform(20, 80, n),
+            'bedding_cost': rng.uniform(10, 40, n)
+        },
+        'sewer_params': {
+            'min_length': min_length,
+            'max_length': min_length + rng.uniform(0, 10, n),
+            'pipe_cost': rng.uniform(20, 90, n),
+            'asphalt_cost': rng.uniform(20, 80, n),
+            'bedding_cost': rng.uniform(10, 40, n)
+        },
+        'monthly_direct_cost': rng.uniform(1e4, 3e5, n),
+        'monthly_indirect_cost': rng.uniform(1e4, 2e5, n),
+        'connection_rate': np.where(rng.random(n) < 0.5, rng.uniform(1, 200, n), np.nan),
+        'prob_water': rng.uniform(0, 100, n),
+        'prob_25mm': rng.uniform(0, 100, n),
+        # calculate_break_even only accepts prob_mainline in [0, 1]
+        'prob_mainline': rng.uniform(0, 1, n)
+    }
+    scenarios['duration_months'] = np.where(np.isnan(scenarios['connection_rate']), rng.uniform(1, 60, n), np.nan)
+    return scenarios
+
+
+def scenario_row(scenarios, i):
+    row = {}
+    for key, value in scenarios.items():
+        if isinstance(value, dict):
+            row[key] = {k: float(v[i]) for k, v in value.items()}
+        else:
+            row[key] = None if np.isnan(value[i]) else float(value[i])
+    return row
+
+
+def bench_batch(n=200_000, scalar_rows=20_000):
+    scenarios = random_scenarios(n)
+
+    start = time.perf_counter()
+    scalar_results = [calculate_break_even(**scenario_row(scenarios, i)) for i in range(scalar_rows)]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_result = calculate_break_even_batch(**scenarios)
+    batch_seconds = time.perf_counter() - start
+
+    for i, expected in enumerate(scalar_results):
+        actual = batch_row(batch_result, i)
+        if "error" in expected:
+            assert "error" in actual, (i, expected, actual)
+        else:
+            assert actual == expected, (i, expected, actual)
+
+    scalar_rate = scalar_rows / scalar_seconds
+    batch_rate = n / batch_seconds
+    print(f"scalar: {scalar_rate:,.0f} rows/sec ({scalar_rows:,} rows)")
+    print(f"batch:  {batch_rate:,.0f} rows/sec ({n:,} rows)")
+    print(f"speedup: {batch_rate / scalar_rate:,.1f}x, {scalar_rows:,} rows identical")
+
+
+def bench_cold_start(repeat=5):
+    # Fresh interpreter each time so no module is already imported
+    for module in ("calculations", "app"):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import {module}"], check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        print(f"import {module}: {min(times) * 1000:,.0f} ms (best of {repeat})")
+
+
+def bench_http(requests_per_client=500, clients=8, workers=8):
+    server = PooledHTTPServer(("127.0.0.1", 0), workers=workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    row = scenario_row(random_scenarios(1), 0)
+    body = json.dumps(row).encode()
+    headers = {"Content-Type": "application/json"}
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        for _ in range(requests_per_client):
+            connection.request("POST", "/break-even", body, headers)
+            response = connection.getresponse()
+            assert response.status == 200, response.status
+            response.read()
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    total = requests_per_client * clients
+    print(f"http: {total / seconds:,.0f} requests/sec ({total:,} requests, {clients} clients, {workers} workers)")
+
+
+def portfolio_records(projects=2000, variants=3):
+    scenarios = random_scenarios(projects, seed=3)
+    records = []
+    for i in range(projects):
+        row = scenario_row(scenarios, i)
+        row['connection_rate'] = row['connection_rate'] or 100.0
+        row['duration_months'] = None
+        for v in range(variants):
+            records.append({**row, 'id': i, 'variant': f"variant {v}", 'monthly_direct_cost': row['monthly_direct_cost'] * (1 + 0.1 * v)})
+    return records
+
+
+def bench_portfolio(projects=2000, variants=3):
+    records = portfolio_records(projects, variants)
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        evaluate_portfolio(records, workers=workers)
+        seconds = time.perf_counter() - start
+        print(f"portfolio: {len(records) / seconds:,.0f} projects/sec with {workers} worker(s) ({len(records):,} project variants)")
+
+
+def bench_store(n=50_000, projects=5):
+    scenarios = random_scenarios(n, seed=4)
+    runs = []
+    for i in range(n):
+        row = scenario_row(scenarios, i)
+        runs.append((row, evaluate_record(row)))
+    with tempfile.TemporaryDirectory() as directory:
+        store = ScenarioStore(os.path.join(directory, "scenarios.db"))
+        start = time.perf_counter()
+        per_project = n // projects
+        for p in range(projects):
+            store.save_many(runs[p * per_project:(p + 1) * per_project], "bench", project=f"Project {p}")
+        print(f"store: saved {n:,} scenarios in {time.perf_counter() - start:,.2f} s")
+        queries = {
+            'project': dict(project="Project 2", limit=50),
+            'months range': dict(break_even_months=(10, 12), limit=50),
+            'feasible by months': dict(project="Project 1", feasible=True, order_by='break_even_months', descending=False, limit=20)
+        }
+        for name, query in queries.items():
+            start = time.perf_counter()
+            store.list(**query)
+            print(f"store: list by {name}: {(time.perf_counter() - start) * 1000:,.2f} ms")
+        start = time.perf_counter()
+        store.find(runs[n // 2][0], "bench", f"Project {(n // 2) // per_project}")
+        print(f"store: find by inputs: {(time.perf_counter() - start) * 1000:,.2f} ms")
+        store.close()
+
+
+# Representative scenarios for the regression suite
+SMALL_SCENARIO = {
+    'current_expenses': 3_000_000.0, 'invoices_received': 0.0, 'store_stock_value': 0.0,
+    'water_params': {'min_length': 2.0, 'max_length': 12.0, 'pipe_cost_25': 10.0, 'pipe_cost_32': 12.0,
+                     'meter_cost_25': 300.0, 'meter_cost_32': 400.0, 'asphalt_cost': 30.0, 'bedding_cost': 20.0},
+    'sewer_params': {'min_length': 2.0, 'max_length': 12.0, 'pipe_cost': 40.0, 'asphalt_cost': 30.0, 'bedding_cost': 20.0},
+    'monthly_direct_cost': 100_000.0, 'monthly_indirect_cost': 50_000.0, 'connection_rate': 50.0, 'duration_months': None,
+    'prob_water': 50.0, 'prob_25mm': 50.0, 'prob_mainline': 0.5
+}
+# A city-wide programme: about 300,000 connections to break even
+CITY_SCENARIO = {**SMALL_SCENARIO, 'current_expenses': 500_000_000.0, 'monthly_direct_cost': 2_000_000.0,
+                 'monthly_indirect_cost': 1_000_000.0, 'connection_rate': 2_500.0}
+
+
+def case_small():
+    # One form submission: calculation, figure, CSV download and cash flow
+    from app import build_figure, results_csv
+    from cashflow import build_schedule, schedule_from_result
+    result = calculate_break_even(**SMALL_SCENARIO)
+    build_figure(result)
+    results_csv(result)
+    schedule_from_result(result, *build_schedule(120, result['connection_rate'], 100_000.0, 50_000.0)).break_even()
+    return result['break_even_connections_rounded']
+
+
+def case_city():
+    # A large project plus the analyses run on it: figure, sensitivity, goal
+    # seek, a 200,000-row sweep and its Parquet export
+    from app import build_figure
+    from export import batch_chunks, export_to_temp_file
+    from sensitivity import sensitivity_analysis
+    from solver import goal_seek
+    result = calculate_break_even(**CITY_SCENARIO)
+    build_figure(result)
+    sensitivity_analysis(CITY_SCENARIO)
+    goal_seek(CITY_SCENARIO, 'monthly_indirect_cost', 120)
+    sweep = calculate_break_even_batch(**{**CITY_SCENARIO, 'current_expenses': np.linspace(1e8, 1e9, 200_000)})
+    os.remove(export_to_temp_file(batch_chunks(sweep), 'parquet'))
+    return result['break_even_connections_rounded']
+
+
+def case_portfolio():
+    from export import export_to_temp_file, frame_chunks
+    from portfolio import portfolio_summary
+    results = evaluate_portfolio(SUITE_RECORDS.setdefault('portfolio', portfolio_records()), workers=1)
+    portfolio_summary(results)
+    os.remove(export_to_temp_file(frame_chunks(results), 'csv'))
+    return int(np.nansum(results['break_even_connections']))
+
+
+SUITE = {'small': case_small, 'city': case_city, 'portfolio': case_portfolio}
+# Inputs built once, outside the timed runs
+SUITE_RECORDS = {}
+
+
+def measure(case, repeat):
+    # Best wall time of `repeat` runs, the per-stage timings METRICS records
+    # in one more run, and peak traced memory of a last one (tracing slows
+    # everything down, so it is kept out of the timings)
+    case()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connections = case()
+        times.append(time.perf_counter() - start)
+    enabled = METRICS.enabled
+    METRICS.reset()
+    METRICS.enabled = True
+    try:
+        case()
+    finally:
+        METRICS.enabled = enabled
+    tracemalloc.start()
+    try:
+        case()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stages = {stage: round(values['mean_ms'], 4) for stage, values in METRICS.stats()['stages'].items()}
+    return {'seconds': min(times), 'peak_mb': peak / 1e6, 'connections': int(connections), 'stages': stages}
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        expected = baseline.get('results', {}).get(name)
+        if expected is None:
+            continue
+        if result['seconds'] > expected['seconds'] * (1 + tolerance):
+            found.append(f"{name}: {result['seconds']:.3f} s against {expected['seconds']:.3f} s")
+        # Small absolute slack so a few allocations do not fail tiny cases
+        if result['peak_mb'] > expected['peak_mb'] * (1 + tolerance) + 1:
+            found.append(f"{name}: peak {result['peak_mb']:.1f} MB against {expected['peak_mb']:.1f} MB")
+    return found
+
+
+def run_suite(cases=None, repeat=3, baseline=None, save_baseline=None, history=None, tolerance=0.25):
+    # Runs the small, city and portfolio cases and prints runtime, peak
+    # memory and stage timings. Compared against a baseline file it returns
+    # False when any case got slower or bigger by more than `tolerance`.
+    results = {}
+    for name in cases or SUITE:
+        results[name] = measure(SUITE[name], repeat)
+        r = results[name]
+        print(f"{name}: {r['seconds'] * 1000:,.1f} ms, peak {r['peak_mb']:,.1f} MB, "
+              f"{r['connections']:,} connections to break even")
+        for stage, ms in r['stages'].items():
+            print(f"    {stage}: {ms:,.3f} ms")
+    record = {'time': datetime.now().isoformat(timespec='seconds'), 'commit': commit(), 'tariff_version': rates.RATES['version'],
+              'python': platform.python_version(), 'results': results}
+    if history:
+        with open(history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(record, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            found = regressions(results, json.load(f), tolerance)
+        for message in found:
+            print("REGRESSION " + message)
+        return not found
+    return True
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'cold-start': bench_cold_start,
+    'http': bench_http,
+    'portfolio': bench_portfolio,
+    'store': bench_store
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks and the regression suite")
+    parser.add_argument("benchmarks", nargs="*", choices=["suite"] + list(BENCHMARKS), metavar="benchmark",
+                        help=f"suite or any of: {', '.join(BENCHMARKS)} (default: all of them)")
+    parser.add_argument("--case", action="append", choices=list(SUITE), help="Suite case to run (repeatable; default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="Fail if a suite case is slower or uses more memory than in this file")
+    parser.add_argument("--save-baseline", help="Write the suite results to this file")
+    parser.add_argument("--history", help="Append the suite results as one JSON line to this file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    passed = True
+    for name in args.benchmarks or list(BENCHMARKS) + ["suite"]:
+        if name == "suite":
+            passed = run_suite(args.case, args.repeat, args.baseline, args.save_baseline, args.history, args.tolerance)
+        else:
+            BENCHMARKS[name]()
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def normalize(value):
+    # Hashable, order-independent form of form inputs: dicts become sorted
+    # tuples and numbers become floats, so 50 and 50.0 share an entry
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def scenario_key(*args, **kwargs):
+    return normalize(args) + normalize(tuple(sorted(kwargs.items())))
+
+
+def approximate_size(value):
+    # Bytes held by a cached value: arrays by their buffers, containers by
+    # their items; good enough to keep the cache within a memory budget
+    if isinstance(value, np.ndarray):
+        return value.nbytes + (sum(approximate_size(v) for v in value.flat) if value.dtype == object else 0)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approximate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    # Thread-safe LRU cache. It lives at module level, so every Streamlit
+    # session served by the same process shares it; cached values must not
+    # be mutated by the caller. Bounded both by entry count and by the
+    # approximate size of the values; a value larger than maxbytes is
+    # returned without being cached.
+
+    def __init__(self, maxsize=256, maxbytes=DEFAULT_MAX_BYTES):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Computed outside the lock so one slow scenario does not block others
+        value = compute()
+        size = approximate_size(value)
+        if size > self.maxbytes:
+            return value
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize or self.bytes > self.maxbytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'maxsize': self.maxsize,
+                    'bytes': self.bytes, 'maxbytes': self.maxbytes}
+
+
+SCENARIO_CACHE = ResultCache()
@@ -0,0 +1,270 @@
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+from lengths import expected_water_value, expected_sewer_value
+from metrics import recorder
+from records import InvalidRecord
+from rates import water_connection_value, sewer_connection_value, water_connection_material_cost, sewer_connection_material_cost
+
+WATER_PARAM_KEYS = ['min_length', 'max_length', 'pipe_cost_25', 'pipe_cost_32', 'meter_cost_25', 'meter_cost_32', 'asphalt_cost', 'bedding_cost']
+SEWER_PARAM_KEYS = ['min_length', 'max_length', 'pipe_cost', 'asphalt_cost', 'bedding_cost']
+# Month 0 of every project: break-even dates and cash-flow months count from here
+START_DATE = datetime(2025, 8, 1)
+
+SCENARIO_KEYS = ['current_expenses', 'invoices_received', 'store_stock_value', 'monthly_direct_cost', 'monthly_indirect_cost',
+                 'connection_rate', 'duration_months', 'prob_water', 'prob_25mm', 'prob_mainline']
+
+
+def _number(value, name):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"{name} must be a number, not {value!r}")
+
+
+def scenario_kwargs(record):
+    # Turns one scenario record into keyword arguments for calculate_break_even.
+    # Water and sewer parameters may be nested dicts ("water_params") or flat
+    # "water_"/"sewer_" prefixed fields as in a CSV row; values may be strings.
+    water_params = record.get('water_params') or {k: record.get('water_' + k) for k in WATER_PARAM_KEYS}
+    sewer_params = record.get('sewer_params') or {k: record.get('sewer_' + k) for k in SEWER_PARAM_KEYS}
+    kwargs = {k: _number(record[k], k) for k in SCENARIO_KEYS if k in record}
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    water = {k: _number(water_params.get(k), 'water_' + k) for k in WATER_PARAM_KEYS}
+    sewer = {k: _number(sewer_params.get(k), 'sewer_' + k) for k in SEWER_PARAM_KEYS}
+    missing = [k for k in SCENARIO_KEYS[:5] if k not in kwargs]
+    missing += ['water_' + k for k, v in water.items() if v is None]
+    missing += ['sewer_' + k for k, v in sewer.items() if v is None]
+    if missing:
+        raise ValueError("Missing scenario fields: " + ", ".join(missing))
+    kwargs['water_params'] = water
+    kwargs['sewer_params'] = sewer
+    return kwargs
+
+
+def connection_economics(current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost, connection_rate=None, duration_months=None, prob_water=50, prob_25mm=50, prob_mainline=50, water_lengths=None, sewer_lengths=None):
+    # Validation and pricing stages of calculate_break_even: what a connection
+    # is worth and costs in materials, and the expenses to recover, whether or
+    # not the project can ever recover them. Stage timings go to the current
+    # recorder when diagnostics are on.
+    metrics = recorder()
+    start = metrics is not None and time.perf_counter()
+    prob_water = prob_water / 100
+    prob_25mm = prob_25mm / 100
+    prob_mainEOL = prob_mainline / 100
+
+    if prob_water < 0 or prob_water > 1 or prob_25mm < 0 or prob_25mm > 1 or prob_mainline < 0 or prob_mainline > 1:
+        return {"error": "Proportions and probabilities must be between 0 and 100"}
+    if current_expenses < 0 or invoices_received < 0 or store_stock_value < 0 or monthly_direct_cost < 0 or monthly_indirect_cost < 0:
+        return {"error": "Expenses, invoices, stock value, and costs must be positive"}
+    if (connection_rate is None and duration_months is None) or (connection_rate is not None and duration_months is not None):
+        return {"error": "Provide either connection rate or duration, not both or neither"}
+    if connection_rate is not None and connection_rate <= 0:
+        return {"error": "Connection rate must be positive"}
+    if duration_months is not None and duration_months <= 0:
+        return {"error": "Duration must be positive"}
+    if water_params['min_length'] < 0 or water_params['max_length'] < water_params['min_length']:
+        return {"error": "Connection lengths must be positive, and max_length must be at least min_length"}
+    if sewer_params['min_length'] < 0 or sewer_params['max_length'] < sewer_params['min_length']:
+        return {"error": "Connection lengths must be positive, and max_length must be at least min_length"}
+
+    net_current_expenses = current_expenses - invoices_received - store_stock_value
+    if net_current_expenses < 0:
+        return {"error": "Invoices received and store stock value cannot exceed current expenses"}
+    if start:
+        start = metrics.lap('validation', start)
+
+    avg_water_length = (water_params['min_length'] + water_params['max_length']) / 2
+    avg_sewer_length = (sewer_params['min_length'] + sewer_params['max_length']) / 2
+    # With surveyed lengths (LengthDistribution), connections are priced at
+    # their exact expected value instead of at the midpoint length; material
+    # cost is linear in length, so the mean length prices it exactly
+    if water_lengths is not None:
+        avg_water_length = water_lengths.mean
+    if sewer_lengths is not None:
+        avg_sewer_length = sewer_lengths.mean
+
+    if water_lengths is None:
+        water_value_25 = water_connection_value(25, avg_water_length)
+        water_value_32 = water_connection_value(32, avg_water_length)
+    else:
+        water_value_25 = expected_water_value(25, water_lengths)
+        water_value_32 = expected_water_value(32, water_lengths)
+    avg_water_value = (prob_25mm * water_value_25) + ((1 - prob_25mm) * water_value_32)
+    water_material_cost_25 = water_connection_material_cost(
+        25, avg_water_length, water_params['pipe_cost_25'], water_params['meter_cost_25'],
+        water_params['asphalt_cost'], water_params['bedding_cost']
+    )
+    water_material_cost_32 = water_connection_material_cost(
+        32, avg_water_length, water_params['pipe_cost_32'], water_params['meter_cost_32'],
+        water_params['asphalt_cost'], water_params['bedding_cost']
+    )
+    avg_water_material_cost = (prob_25mm * water_material_cost_25) + ((1 - prob_25mm) * water_material_cost_32)
+
+    if sewer_lengths is None:
+        sewer_value_mainline = sewer_connection_value('mainline', avg_sewer_length)
+        sewer_value_manhole = sewer_connection_value('manhole', avg_sewer_length)
+    else:
+        sewer_value_mainline = expected_sewer_value('mainline', sewer_lengths)
+        sewer_value_manhole = expected_sewer_value('manhole', sewer_lengths)
+    avg_sewer_value = (prob_mainline * sewer_value_mainline) + ((1 - prob_mainline) * sewer_value_manhole)
+    sewer_material_cost_mainline = sewer_connection_material_cost(
+        avg_sewer_length, sewer_params['pipe_cost'], sewer_params['asphalt_cost'], sewer_params['bedding_cost']
+    )
+    sewer_material_cost_manhole = sewer_connection_material_cost(
+        avg_sewer_length, sewer_params['pipe_cost'], sewer_params['asphalt_cost'], sewer_params['bedding_cost']
+    )
+    avg_sewer_material_cost = (prob_mainline * sewer_material_cost_mainline) + ((1 - prob_mainline) * sewer_material_cost_manhole)
+
+    avg_value_per_connection = (prob_water * avg_water_value) + ((1 - prob_water) * avg_sewer_value)
+    avg_material_cost_per_connection = (prob_water * avg_water_material_cost) + ((1 - prob_water) * avg_sewer_material_cost)
+    if start:
+        metrics.lap('pricing', start)
+    return {
+        'net_current_expenses': net_current_expenses,
+        'avg_water_value': avg_water_value,
+        'avg_sewer_value': avg_sewer_value,
+        'avg_value_per_connection': avg_value_per_connection,
+        'avg_water_material_cost': avg_water_material_cost,
+        'avg_sewer_material_cost': avg_sewer_material_cost,
+        'avg_material_cost_per_connection': avg_material_cost_per_connection
+    }
+
+
+def calculate_break_even(current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost, connection_rate=None, duration_months=None, prob_water=50, prob_25mm=50, prob_mainline=50, water_lengths=None, sewer_lengths=None):
+    economics = connection_economics(
+        current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost,
+        connection_rate, duration_months, prob_water, prob_25mm, prob_mainline, water_lengths, sewer_lengths
+    )
+    if "error" in economics:
+        return economics
+    metrics = recorder()
+    start = metrics is not None and time.perf_counter()
+    net_current_expenses = economics['net_current_expenses']
+    avg_value_per_connection = economics['avg_value_per_connection']
+    avg_material_cost_per_connection = economics['avg_material_cost_per_connection']
+
+    max_connection_rate = 50
+    min_direct_cost = monthly_direct_cost / max_connection_rate
+    min_indirect_cost = monthly_indirect_cost / max_connection_rate
+    min_total_cost = avg_material_cost_per_connection + min_direct_cost + min_indirect_cost
+    min_net_revenue = avg_value_per_connection - min_total_cost
+    min_break_even_connections = net_current_expenses / min_net_revenue if min_net_revenue > 0 else float('inf')
+    min_duration = min_break_even_connections / max_connection_rate if min_break_even_connections != float('inf') else float('inf')
+
+    if connection_rate is not None:
+        direct_cost_per_connection = monthly_direct_cost / connection_rate
+        indirect_cost_per_connection = monthly_indirect_cost / connection_rate
+        total_cost_per_connection = avg_material_cost_per_connection + direct_cost_per_connection + indirect_cost_per_connection
+        net_revenue_per_connection = avg_value_per_connection - total_cost_per_connection
+        if net_revenue_per_connection <= 0:
+            return {
+                "error": (
+                    f"Average value per connection (SAR {avg_value_per_connection:,.2f}) "
+                    f"must exceed total cost per connection (SAR {total_cost_per_connection:,.2f}). "
+                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
+                    f"Try reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}) "
+                    f"or increasing connection value."
+                )
+            }
+        break_even_connections = net_current_expenses / net_revenue_per_connection
+        break_even_connections_rounded = round(break_even_connections)
+        break_even_months = break_even_connections / connection_rate
+    else:
+        break_even_connections = (net_current_expenses + (monthly_direct_cost + monthly_indirect_cost) * duration_months) / (avg_value_per_connection - avg_material_cost_per_connection)
+        connection_rate = break_even_connections / duration_months
+        if connection_rate <= 0:
+            return {
+                "error": (
+                    f"Required connection rate ({connection_rate:,.2f} connections/month) is infeasible for the given duration ({duration_months} months). "
+                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
+                    f"Try increasing duration, reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}), "
+                    f"or increasing connection value."
+                )
+            }
+        direct_cost_per_connection = monthly_direct_cost / connection_rate
+        indirect_cost_per_connection = monthly_indirect_cost / connection_rate
+        total_cost_per_connection = avg_material_cost_per_connection + direct_cost_per_connection + indirect_cost_per_connection
+        net_revenue_per_connection = avg_value_per_connection - total_cost_per_connection
+        if net_revenue_per_connection <= 0:
+            return {
+                "error": (
+                    f"Average value per connection (SAR {avg_value_per_connection:,.2f}) "
+                    f"must exceed total cost per connection (SAR {total_cost_per_connection:,.2f}) for the given duration ({duration_months} months). "
+                    f"Minimum feasible duration with {max_connection_rate} connections/month: {min_duration:,.2f} months. "
+                    f"Try increasing duration, reducing monthly costs (direct: SAR {monthly_direct_cost:,.2f}, indirect: SAR {monthly_indirect_cost:,.2f}), "
+                    f"or increasing connection value."
+                )
+            }
+        break_even_connections_rounded = round(break_even_connections)
+        break_even_months = duration_months
+
+    break_even_date = START_DATE + relativedelta(months=int(break_even_months), days=round((break_even_months % 1) * 30))
+    total_expenses = net_current_expenses + (break_even_connections_rounded * total_cost_per_connection)
+    if start:
+        metrics.lap('break_even_solve', start)
+
+    return {
+        'current_expenses': current_expenses,
+        'invoices_received': invoices_received,
+        'store_stock_value': store_stock_value,
+        'net_current_expenses': net_current_expenses,
+        'avg_water_value': economics['avg_water_value'],
+        'avg_sewer_value': economics['avg_sewer_value'],
+        'avg_value_per_connection': avg_value_per_connection,
+        'avg_water_material_cost': economics['avg_water_material_cost'],
+        'avg_sewer_material_cost': economics['avg_sewer_material_cost'],
+        'avg_material_cost_per_connection': avg_material_cost_per_connection,
+        'direct_cost_per_connection': direct_cost_per_connection,
+        'indirect_cost_per_connection': indirect_cost_per_connection,
+        'total_cost_per_connection': total_cost_per_connection,
+        'net_revenue_per_connection': net_revenue_per_connection,
+        'connection_rate': connection_rate,
+        'break_even_connections': break_even_connections,
+        'break_even_connections_rounded': break_even_connections_rounded,
+        'break_even_months': break_even_months,
+        'break_even_date': break_even_date.strftime('%B %Y'),
+        'total_expenses_at_break_even': total_expenses,
+        'total_revenue_at_break_even': break_even_connections_rounded * avg_value_per_connection
+    }
+
+
+def _read_record(record):
+    # (calculate_break_even keyword arguments, None) for a readable record,
+    # else (None, why it cannot be read as a scenario at all)
+    if isinstance(record, InvalidRecord):
+        return None, record.error
+    if not isinstance(record, dict):
+        return None, "A scenario must be an object"
+    for name in ('water_params', 'sewer_params'):
+        if record.get(name) is not None and not isinstance(record[name], dict):
+            return None, f"{name} must be an object"
+    try:
+        return scenario_kwargs(record), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def record_error(record):
+    # Why a record is not a scenario (missing or non-numeric fields, ...), as
+    # opposed to a scenario the model finds infeasible; None if it is one
+    return _read_record(record)[1]
+
+
+def evaluate_record(record):
+    # calculate_break_even for one scenario record, with any "id" field passed through
+    kwargs, error = _read_record(record)
+    if error:
+        result = {"error": error}
+    else:
+        try:
+            result = calculate_break_even(**kwargs)
+        except (ValueError, TypeError) as e:
+            result = {"error": str(e)}
+    if isinstance(record, dict) and 'id' in record:
+        result = {'id': record['id'], **result}
+    return result
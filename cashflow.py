@@ -0,0 +1,132 @@
+import math
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from calculations import START_DATE
+
+
+def build_schedule(months, connection_rate, monthly_direct_cost, monthly_indirect_cost, ramp_up_months=0, slow_months=(), slow_factor=0.5, start_date=START_DATE):
+    # Per-month connection rates and costs for a typical job: a linear ramp up
+    # to `connection_rate` over the first `ramp_up_months`, and output scaled
+    # by `slow_factor` in the calendar months listed in `slow_months`
+    # (e.g. (7, 8) for summer). Costs stay flat; edit them per month afterwards.
+    index = np.arange(months)
+    rates = np.full(months, float(connection_rate))
+    if ramp_up_months > 0:
+        rates *= np.minimum((index + 1) / ramp_up_months, 1.0)
+    if slow_months:
+        calendar_month = (start_date.month - 1 + index) % 12 + 1
+        rates = np.where(np.isin(calendar_month, list(slow_months)), rates * slow_factor, rates)
+    return rates, np.full(months, float(monthly_direct_cost)), np.full(months, float(monthly_indirect_cost))
+
+
+class CashFlowSchedule:
+    # Month-by-month revenue and expenses for a project. Cumulative totals are
+    # kept as arrays, so changing month k only recomputes months k onwards.
+
+    def __init__(self, net_current_expenses, value_per_connection, material_cost_per_connection, connection_rates, direct_costs, indirect_costs, start_date=START_DATE):
+        self.net_current_expenses = float(net_current_expenses)
+        self.value_per_connection = float(value_per_connection)
+        self.material_cost_per_connection = float(material_cost_per_connection)
+        self.start_date = start_date
+        self.connection_rates = np.array(connection_rates, dtype=float)
+        self.direct_costs = np.array(direct_costs, dtype=float)
+        self.indirect_costs = np.array(indirect_costs, dtype=float)
+        if not (len(self.connection_rates) == len(self.direct_costs) == len(self.indirect_costs)):
+            raise ValueError("Connection rates, direct costs and indirect costs must cover the same months")
+        if (self.connection_rates < 0).any() or (self.direct_costs < 0).any() or (self.indirect_costs < 0).any():
+            raise ValueError("Connection rates and monthly costs must be positive")
+
+        months = len(self.connection_rates)
+        self.cumulative_connections = np.empty(months)
+        self.cumulative_revenue = np.empty(months)
+        self.cumulative_expenses = np.empty(months)
+        self.net = np.empty(months)
+        self._best_net = np.empty(months)
+        self._recompute(0)
+
+    def __len__(self):
+        return len(self.connection_rates)
+
+    def _recompute(self, start):
+        end = len(self)
+        if start >= end:
+            return
+        rates = self.connection_rates[start:]
+        revenue = rates * self.value_per_connection
+        expenses = rates * self.material_cost_per_connection + self.direct_costs[start:] + self.indirect_costs[start:]
+        if start == 0:
+            connections_before, revenue_before, expenses_before = 0.0, 0.0, self.net_current_expenses
+            best_before = -math.inf
+        else:
+            connections_before = self.cumulative_connections[start - 1]
+            revenue_before = self.cumulative_revenue[start - 1]
+            expenses_before = self.cumulative_expenses[start - 1]
+            best_before = self._best_net[start - 1]
+        np.cumsum(rates, out=self.cumulative_connections[start:])
+        self.cumulative_connections[start:] += connections_before
+        np.cumsum(revenue, out=self.cumulative_revenue[start:])
+        self.cumulative_revenue[start:] += revenue_before
+        np.cumsum(expenses, out=self.cumulative_expenses[start:])
+        self.cumulative_expenses[start:] += expenses_before
+        np.subtract(self.cumulative_revenue[start:], self.cumulative_expenses[start:], out=self.net[start:])
+        # Running maximum of net position, non-decreasing so the first
+        # break-even month can be found by binary search
+        np.maximum.accumulate(np.maximum(self.net[start:], best_before), out=self._best_net[start:])
+
+    def update(self, month, connection_rate=None, direct_cost=None, indirect_cost=None):
+        # Changes the inputs for months `month`, `month + 1`, ... (scalars set
+        # one month, arrays set consecutive months) and recomputes from there
+        for values, target in ((connection_rate, self.connection_rates), (direct_cost, self.direct_costs), (indirect_cost, self.indirect_costs)):
+            if values is None:
+                continue
+            values = np.atleast_1d(np.asarray(values, dtype=float))
+            if (values < 0).any():
+                raise ValueError("Connection rates and monthly costs must be positive")
+            if month < 0 or month + len(values) > len(self):
+                raise ValueError(f"Months {month} to {month + len(values) - 1} are outside the {len(self)}-month schedule")
+            target[month:month + len(values)] = values
+        self._recompute(month)
+
+    def month_labels(self):
+        return [(self.start_date + relativedelta(months=i)).strftime('%b %Y') for i in range(len(self))]
+
+    def break_even(self):
+        # First month in which cumulative revenue covers cumulative expenses,
+        # interpolated linearly within that month
+        month = int(np.searchsorted(self._best_net, 0.0, side='left'))
+        if month >= len(self):
+            return {"error": f"Project does not break even within the {len(self)}-month schedule"}
+
+        if month > 0:
+            net_before = self.net[month - 1]
+            connections_before = self.cumulative_connections[month - 1]
+            revenue_before = self.cumulative_revenue[month - 1]
+            expenses_before = self.cumulative_expenses[month - 1]
+        else:
+            net_before = -self.net_current_expenses
+            connections_before, revenue_before, expenses_before = 0.0, 0.0, self.net_current_expenses
+        change = float(self.net[month] - net_before)
+        fraction = float(-net_before / change) if change > 0 else 0.0
+        break_even_months = month + fraction
+        break_even_connections = float(connections_before + fraction * self.connection_rates[month])
+        break_even_date = self.start_date + relativedelta(months=int(break_even_months), days=round((break_even_months % 1) * 30))
+        return {
+            'break_even_month_index': month,
+            'break_even_months': break_even_months,
+            'break_even_connections': break_even_connections,
+            'break_even_connections_rounded': round(break_even_connections),
+            'break_even_date': break_even_date.strftime('%B %Y'),
+            'total_expenses_at_break_even': float(expenses_before + fraction * (self.cumulative_expenses[month] - expenses_before)),
+            'total_revenue_at_break_even': float(revenue_before + fraction * (self.cumulative_revenue[month] - revenue_before)),
+            'max_cash_exposure': max(self.net_current_expenses, -float(self.net[:month + 1].min()))
+        }
+
+
+def schedule_from_result(result, connection_rates, direct_costs, indirect_costs, start_date=START_DATE):
+    # Reuses the per-connection value and material cost of a calculate_break_even result
+    return CashFlowSchedule(
+        result['net_current_expenses'], result['avg_value_per_connection'], result['avg_material_cost_per_connection'],
+        connection_rates, direct_costs, indirect_costs, start_date
+    )
@@ -0,0 +1,75 @@
+import argparse
+import csv
+import json
+import sys
+
+from calculations import evaluate_record
+from records import read_records
+
+RESULT_FIELDS = [
+    'id', 'current_expenses', 'invoices_received', 'store_stock_value', 'net_current_expenses',
+    'avg_water_value', 'avg_sewer_value', 'avg_value_per_connection',
+    'avg_water_material_cost', 'avg_sewer_material_cost', 'avg_material_cost_per_connection',
+    'direct_cost_per_connection', 'indirect_cost_per_connection', 'total_cost_per_connection',
+    'net_revenue_per_connection', 'connection_rate', 'break_even_connections',
+    'break_even_connections_rounded', 'break_even_months', 'break_even_date',
+    'total_expenses_at_break_even', 'total_revenue_at_break_even', 'error'
+]
+
+
+def run(input_stream, output_stream, input_format="auto", output_format="jsonl"):
+    if output_format in ("parquet", "xlsx"):
+        # Binary formats are written in chunks through the export module;
+        # output_stream must be a path or a binary stream
+        from export import export, record_chunks, result_schema
+        results = (evaluate_record(record) for record in read_records(input_stream, input_format))
+        schema = result_schema(RESULT_FIELDS) if output_format == "parquet" else None
+        return export(record_chunks(results, columns=RESULT_FIELDS), output_stream, output_format, schema=schema)
+    writer = None
+    if output_format == "csv":
+        writer = csv.DictWriter(output_stream, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+    count = 0
+    for record in read_records(input_stream, input_format):
+        result = evaluate_record(record)
+        if writer:
+            writer.writerow(result)
+        else:
+            output_stream.write(json.dumps(result) + "\n")
+        output_stream.flush()
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Break-even calculations without the Streamlit UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Read scenarios from stdin and stream results to stdout")
+    run_parser.add_argument("--input-format", choices=["auto", "json", "csv"], default="auto")
+    run_parser.add_argument("--output-format", choices=["jsonl", "csv", "parquet", "xlsx"], default="jsonl")
+    run_parser.add_argument("--output", help="Write results to this file instead of stdout")
+
+    serve_parser = commands.add_parser("serve", help="Serve calculations over HTTP as JSON")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8502)
+    serve_parser.add_argument("--workers", type=int, default=8)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if args.output and args.output_format in ("parquet", "xlsx"):
+            run(sys.stdin, args.output, args.input_format, args.output_format)
+        elif args.output:
+            with open(args.output, "w", newline="") as output:
+                run(sys.stdin, output, args.input_format, args.output_format)
+        elif args.output_format in ("parquet", "xlsx"):
+            run(sys.stdin, sys.stdout.buffer, args.input_format, args.output_format)
+        else:
+            run(sys.stdin, sys.stdout, args.input_format, args.output_format)
+    else:
+        from server import serve
+        serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
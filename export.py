@@ -0,0 +1,245 @@
+import importlib.util
+import io
+import itertools
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from batch import ERROR_MESSAGES, ERROR_NONE, RESULT_KEYS
+
+# Format name: (MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ("text/csv", ".csv"),
+    'parquet': ("application/vnd.apache.parquet", ".parquet"),
+    'xlsx': ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
+}
+
+# Optional package each format's writer needs
+FORMAT_PACKAGES = {'parquet': 'pyarrow', 'xlsx': 'openpyxl'}
+
+# Columns of result rows that hold text; the others are numbers
+TEXT_COLUMNS = ('id', 'error', 'break_even_date')
+
+DEFAULT_CHUNK_ROWS = 100_000
+# Rows per worksheet in Excel, including the header
+XLSX_MAX_ROWS = 1_048_576
+
+
+def available_formats():
+    # The export formats whose writer can be imported here
+    return [f for f in EXPORT_FORMATS if f not in FORMAT_PACKAGES or importlib.util.find_spec(FORMAT_PACKAGES[f]) is not None]
+
+
+def frame_chunks(columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # DataFrames of at most chunk_rows rows from a dict of equal-length arrays
+    # (a batch or portfolio result); values that are not 1-d arrays are skipped
+    columns = {k: v for k, v in columns.items() if isinstance(v, np.ndarray) and v.ndim == 1}
+    rows = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, rows, chunk_rows):
+        yield pd.DataFrame({k: v[start:start + chunk_rows] for k, v in columns.items()})
+
+
+def record_chunks(records, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None):
+    # DataFrames from any iterable of dicts, e.g. results streamed by cli.run
+    records = iter(records)
+    while True:
+        block = list(itertools.islice(records, chunk_rows))
+        if not block:
+            return
+        yield pd.DataFrame.from_records(block, columns=columns)
+
+
+def batch_chunks(result, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # calculate_break_even_batch output with the error message of every row
+    # that failed in place of its numbers
+    codes = result['error_code']
+    for start in range(0, len(codes), chunk_rows):
+        code = codes[start:start + chunk_rows]
+        chunk = pd.DataFrame({key: result[key][start:start + chunk_rows] for key in RESULT_KEYS})
+        chunk['error'] = pd.Series([ERROR_MESSAGES[c] if c != ERROR_NONE else None for c in code.tolist()], dtype=object)
+        yield chunk
+
+
+def simulation_chunks(simulation, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # One row per simulated project of a simulate_break_even result
+    connections = simulation['break_even_connections_samples']
+    for start in range(0, len(connections), chunk_rows):
+        block = connections[start:start + chunk_rows]
+        yield pd.DataFrame({
+            'trial': np.arange(start, start + len(block)),
+            'break_even_connections': block,
+            'break_even_months': block / simulation['connection_rate']
+        })
+
+
+def cash_flow_frame(schedule):
+    # The per-month sheet of an XLSX export for a CashFlowSchedule
+    return pd.DataFrame({
+        'month': schedule.month_labels(),
+        'connections': schedule.connection_rates,
+        'direct_cost': schedule.direct_costs,
+        'indirect_cost': schedule.indirect_costs,
+        'cumulative_connections': schedule.cumulative_connections,
+        'cumulative_revenue': schedule.cumulative_revenue,
+        'cumulative_expenses': schedule.cumulative_expenses,
+        'net_position': schedule.net
+    })
+
+
+def _report(progress, rows):
+    if progress is not None:
+        progress(rows, None)
+
+
+def write_csv(chunks, target, progress=None):
+    stream = open(target, 'w', newline='') if isinstance(target, (str, os.PathLike)) else target
+    text = stream if isinstance(stream, io.TextIOBase) else io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    rows = 0
+    try:
+        for chunk in chunks:
+            chunk.to_csv(text, header=rows == 0, index=False)
+            rows += len(chunk)
+            _report(progress, rows)
+    finally:
+        if text is not stream:
+            text.flush()
+            text.detach()
+        if stream is not target:
+            stream.close()
+    return rows
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet exports requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def result_schema(columns, text_columns=TEXT_COLUMNS):
+    # Parquet schema for result rows whose types cannot be told from the first
+    # chunk: a chunk without errors has an all-NaN (float) error column
+    pa, _ = _pyarrow()
+    return pa.schema([(column, pa.string() if column in text_columns else pa.float64()) for column in columns])
+
+
+def _conform(chunk, schema):
+    # Text columns as strings (NaN becomes null), float columns as numbers
+    pa, _ = _pyarrow()
+    columns = {}
+    for field in schema:
+        values = chunk[field.name]
+        if pa.types.is_string(field.type) and values.dtype != object:
+            columns[field.name] = values.astype(str).where(values.notna(), None)
+        elif pa.types.is_string(field.type):
+            columns[field.name] = values.map(lambda v: None if v is None or v != v else str(v))
+        elif pa.types.is_floating(field.type) and not pd.api.types.is_float_dtype(values):
+            columns[field.name] = pd.to_numeric(values, errors='coerce').astype(float)
+    return chunk.assign(**columns) if columns else chunk
+
+
+def write_parquet(chunks, target, compression='zstd', progress=None, schema=None):
+    # One row group per chunk, compressed column by column. Without a schema
+    # it is taken from the first chunk; every chunk is converted to it.
+    pa, pq = _pyarrow()
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                if schema is None:
+                    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    # Columns that are empty in the first chunk (e.g. no errors yet) hold text
+                    for i, field in enumerate(schema):
+                        if pa.types.is_null(field.type):
+                            schema = schema.set(i, field.with_type(pa.string()))
+                writer = pq.ParquetWriter(target, schema, compression=compression)
+            chunk = _conform(chunk, writer.schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+            rows += len(chunk)
+            _report(progress, rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _cell(value):
+    # Excel cells cannot hold NaN or infinity
+    if isinstance(value, (float, np.floating)) and not np.isfinite(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def write_xlsx(chunks, target, cash_flow=None, progress=None):
+    # Rows go to "Results" sheets (a new one every XLSX_MAX_ROWS rows) and the
+    # optional per-month cash flow DataFrame to a "Cash Flow" sheet. The
+    # write-only workbook streams rows to disk instead of keeping them.
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("Writing Excel exports requires openpyxl (pip install openpyxl)")
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    rows = 0
+    for chunk in chunks:
+        for record in chunk.itertuples(index=False, name=None):
+            if sheet is None or sheet_rows == XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet("Results" if sheet is None else f"Results {len(workbook.worksheets) + 1}")
+                sheet.append(list(chunk.columns))
+                sheet_rows = 1
+            sheet.append([_cell(v) for v in record])
+            sheet_rows += 1
+        rows += len(chunk)
+        _report(progress, rows)
+    if sheet is None:
+        workbook.create_sheet("Results")
+    if cash_flow is not None:
+        cash_flow_sheet = workbook.create_sheet("Cash Flow")
+        cash_flow_sheet.append(list(cash_flow.columns))
+        for record in cash_flow.itertuples(index=False, name=None):
+            cash_flow_sheet.append([_cell(v) for v in record])
+    workbook.save(target)
+    return rows
+
+
+def export(chunks, target, file_format, cash_flow=None, compression='zstd', progress=None, schema=None):
+    # Writes DataFrame chunks to a path or binary stream and returns the row
+    # count. Only one chunk is held at a time (plus the writer's buffers), so
+    # memory does not grow with the number of rows. `schema` fixes the
+    # Parquet column types (see result_schema).
+    if file_format == 'csv':
+        return write_csv(chunks, target, progress)
+    if file_format == 'parquet':
+        return write_parquet(chunks, target, compression, progress, schema)
+    if file_format == 'xlsx':
+        return write_xlsx(chunks, target, cash_flow, progress)
+    raise ValueError(f"Unknown export format {file_format}; choose one of {', '.join(EXPORT_FORMATS)}")
+
+
+def export_bytes(chunks, file_format, cash_flow=None, compression='zstd'):
+    buffer = io.BytesIO()
+    export(chunks, buffer, file_format, cash_flow, compression)
+    return buffer.getvalue()
+
+
+def export_to_temp_file(chunks, file_format, cash_flow=None, directory=None, compression='zstd', progress=None):
+    # Writes the export to a new temporary file and returns its path, for
+    # serving large results from disk; the caller deletes the file
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {file_format}; choose one of {', '.join(EXPORT_FORMATS)}")
+    descriptor, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[file_format][1], prefix="break-even-", dir=directory)
+    os.close(descriptor)
+    try:
+        export(chunks, path, file_format, cash_flow, compression, progress)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
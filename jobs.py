@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS_ENV = "BREAK_EVEN_JOB_WORKERS"
+DEFAULT_JOB_WORKERS = 4
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # One background computation. The function it runs receives job.report
+    # as its `progress` callback: every call records progress and the latest
+    # partial result, and raises JobCancelled once the job is cancelled, so
+    # work stops at the next chunk boundary.
+
+    def __init__(self, key, description=""):
+        self.key = key
+        self.description = description
+        self.status = 'queued'
+        self.done = 0
+        self.total = None
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.subscribers = 0
+        self._cancelled = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def progress(self):
+        # Fraction complete, or None while the total is unknown
+        if self.status == 'done':
+            return 1.0
+        return min(1.0, self.done / self.total) if self.total else None
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def report(self, done, total=None, partial=None):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        self.done = done
+        self.total = total
+        if partial is not None:
+            self.partial = partial
+
+
+class JobManager:
+    # Runs jobs on a bounded thread pool shared by every session served by
+    # the process, so concurrent heavy runs queue instead of oversubscribing
+    # the server. Submitting a key that is queued, running or finished
+    # returns the existing job; failed and cancelled jobs, and jobs being
+    # cancelled, are started again.
+
+    def __init__(self, max_workers=None, keep_finished=64):
+        self.max_workers = max_workers or int(os.environ.get(JOB_WORKERS_ENV) or DEFAULT_JOB_WORKERS)
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="break-even-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, description="", **kwargs):
+        with self._lock:
+            job = self._jobs.get(key)
+            # A job being cancelled (e.g. released by its last session) is not reused
+            if job is not None and job.status not in ('failed', 'cancelled') and not job._cancelled.is_set():
+                job.subscribers += 1
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key, description)
+            job.subscribers = 1
+            self._jobs[key] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job._cancelled.is_set():
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.traceback = traceback.format_exc()
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        # Forget the oldest finished jobs; queued and running jobs are kept
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[key]
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, job):
+        job._cancelled.set()
+        with self._lock:
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+
+    def release(self, job):
+        # A session no longer wants the job; it is cancelled once nobody does
+        with self._lock:
+            job.subscribers = max(0, job.subscribers - 1)
+            unwanted = job.subscribers == 0 and not job.finished
+        if unwanted:
+            self.cancel(job)
+
+    def queue_position(self, job):
+        with self._lock:
+            queued = [j for j in self._jobs.values() if j.status == 'queued']
+        queued.sort(key=lambda j: j.submitted_at)
+        return queued.index(job) + 1 if job in queued else 0
+
+    def stats(self):
+        with self._lock:
+            counts = {status: 0 for status in ('queued', 'running') + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts['max_workers'] = self.max_workers
+        return counts
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self.cancel(job)
+        self._executor.shutdown(wait=True)
+
+
+JOBS = JobManager()
@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+import rates
+from rates import water_connection_value, sewer_connection_value, water_connection_material_cost, sewer_connection_material_cost
+
+# Ledger columns: one completed connection per row
+LEDGER_COLUMNS = {
+    'connection_type': "water or sewer",
+    'size': "water service size in mm (e.g. 25, 32)",
+    'sewer_type': "mainline or manhole",
+    'length': "connection length in meters",
+    'cost': "actual material cost in SAR"
+}
+
+# Length histograms use fixed bins so memory does not grow with the ledger
+LENGTH_BIN_WIDTH = 0.25
+MAX_BINNED_LENGTH = 100.0
+
+
+def read_ledger_chunks(source, chunk_size=50_000, file_format=None):
+    # Yields DataFrames of at most chunk_size rows from a CSV or Parquet file
+    # (path or file-like object), never holding the whole ledger in memory
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    if file_format is None:
+        file_format = 'parquet' if str(name).lower().endswith('.parquet') else 'csv'
+    if file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet ledgers requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+class LedgerSummary:
+    # Running aggregates over any number of ledger chunks
+
+    def __init__(self):
+        bins = int(MAX_BINNED_LENGTH / LENGTH_BIN_WIDTH) + 1
+        self.rows = 0
+        self.skipped = 0
+        self.unpriced = 0
+        self.water = 0
+        self.water_25mm = 0
+        self.sewer = 0
+        self.sewer_mainline = 0
+        self.value = 0.0
+        self.cost = 0.0
+        self.forecast_cost = 0.0
+        self.length_sum = {'water': 0.0, 'sewer': 0.0}
+        self.length_min = {'water': np.inf, 'sewer': np.inf}
+        self.length_max = {'water': -np.inf, 'sewer': -np.inf}
+        self.length_histogram = {'water': np.zeros(bins, dtype=np.int64), 'sewer': np.zeros(bins, dtype=np.int64)}
+
+    def add(self, chunk, water_params=None, sewer_params=None):
+        # Prices one chunk with the tariff and, when forecast parameters are
+        # given, with the forecast unit material prices at the actual lengths
+        connection_type = chunk['connection_type'].astype(str).str.strip().str.lower().to_numpy()
+        length = pd.to_numeric(chunk['length'], errors='coerce').to_numpy(dtype=float)
+        size = pd.to_numeric(chunk['size'], errors='coerce').to_numpy(dtype=float) if 'size' in chunk else np.full(len(chunk), np.nan)
+        # Hash-map sewer type names to tariff codes; much faster than sorting strings
+        sewer_codes = rates.RATES['sewer_codes']
+        unknown_code = len(rates.RATES['sewer_types'])
+        if 'sewer_type' in chunk:
+            sewer_type = chunk['sewer_type'].astype(str).str.strip().str.lower().map(sewer_codes).fillna(unknown_code).to_numpy(dtype=np.intp)
+        else:
+            sewer_type = np.full(len(chunk), unknown_code)
+        cost = pd.to_numeric(chunk['cost'], errors='coerce').to_numpy(dtype=float) if 'cost' in chunk else np.zeros(len(chunk))
+
+        is_water = (connection_type == "water") & ~np.isnan(size)
+        is_sewer = connection_type == "sewer"
+        # Sizes and sewer types missing from the tariff cannot be priced; they
+        # are skipped (and counted) rather than taken as free connections
+        priced = np.where(is_water, np.isin(size, rates.RATES['water_sizes']), sewer_type < unknown_code)
+        usable = (is_water | is_sewer) & priced & (length >= 0) & ~np.isnan(cost)
+        self.unpriced += int(((is_water | is_sewer) & ~priced).sum())
+        is_water &= usable
+        is_sewer &= usable
+        self.rows += len(chunk)
+        self.skipped += int((~usable).sum())
+
+        water_length, water_size = length[is_water], size[is_water]
+        sewer_length = length[is_sewer]
+        self.water += int(is_water.sum())
+        self.water_25mm += int((water_size == 25).sum())
+        self.sewer += int(is_sewer.sum())
+        self.sewer_mainline += int((sewer_type[is_sewer] == sewer_codes.get("mainline")).sum())
+        self.value += float(np.sum(water_connection_value(water_size, water_length)))
+        self.value += float(np.sum(sewer_connection_value(sewer_type[is_sewer], sewer_length)))
+        self.cost += float(cost[usable].sum())
+
+        if water_params is not None and sewer_params is not None:
+            is_25mm = water_size == 25
+            self.forecast_cost += float(np.sum(water_connection_material_cost(
+                water_size, water_length,
+                np.where(is_25mm, water_params['pipe_cost_25'], water_params['pipe_cost_32']),
+                np.where(is_25mm, water_params['meter_cost_25'], water_params['meter_cost_32']),
+                water_params['asphalt_cost'], water_params['bedding_cost']
+            )))
+            self.forecast_cost += float(np.sum(sewer_connection_material_cost(
+                sewer_length, sewer_params['pipe_cost'], sewer_params['asphalt_cost'], sewer_params['bedding_cost']
+            )))
+
+        for kind, lengths in (('water', water_length), ('sewer', sewer_length)):
+            if lengths.size == 0:
+                continue
+            self.length_sum[kind] += float(lengths.sum())
+            self.length_min[kind] = min(self.length_min[kind], float(lengths.min()))
+            self.length_max[kind] = max(self.length_max[kind], float(lengths.max()))
+            bins = np.minimum((lengths / LENGTH_BIN_WIDTH).astype(np.int64), len(self.length_histogram[kind]) - 1)
+            self.length_histogram[kind] += np.bincount(bins, minlength=len(self.length_histogram[kind]))
+
+    def length_percentile(self, kind, q):
+        histogram = self.length_histogram[kind]
+        total = histogram.sum()
+        if total == 0:
+            return float('nan')
+        index = int(np.searchsorted(np.cumsum(histogram), q / 100 * total))
+        return min((index + 0.5) * LENGTH_BIN_WIDTH, self.length_max[kind])
+
+    def length_distribution(self, kind):
+        count = self.water if kind == 'water' else self.sewer
+        return {
+            'count': count,
+            'mean': self.length_sum[kind] / count if count else float('nan'),
+            'min': self.length_min[kind] if count else float('nan'),
+            'max': self.length_max[kind] if count else float('nan'),
+            'p10': self.length_percentile(kind, 10),
+            'p50': self.length_percentile(kind, 50),
+            'p90': self.length_percentile(kind, 90),
+            'bin_width': LENGTH_BIN_WIDTH,
+            'histogram': self.length_histogram[kind]
+        }
+
+    def summary(self):
+        connections = self.water + self.sewer
+        return {
+            'rows': self.rows,
+            'skipped_rows': self.skipped,
+            'unpriced_rows': self.unpriced,
+            'connections': connections,
+            'water_connections': self.water,
+            'sewer_connections': self.sewer,
+            'prob_water': 100 * self.water / connections if connections else float('nan'),
+            'prob_25mm': 100 * self.water_25mm / self.water if self.water else float('nan'),
+            'prob_mainline': 100 * self.sewer_mainline / self.sewer if self.sewer else float('nan'),
+            'avg_value_per_connection': self.value / connections if connections else float('nan'),
+            'avg_cost_per_connection': self.cost / connections if connections else float('nan'),
+            'avg_forecast_cost_per_connection': self.forecast_cost / connections if connections else float('nan'),
+            'total_value': self.value,
+            'total_cost': self.cost,
+            'total_forecast_cost': self.forecast_cost,
+            'water_length': self.length_distribution('water'),
+            'sewer_length': self.length_distribution('sewer')
+        }
+
+
+def ingest_ledger(source, water_params=None, sewer_params=None, chunk_size=50_000, file_format=None, progress=None):
+    # progress(rows, None, partial) is called after every chunk with the
+    # summary so far; the total row count is not known until the end
+    ledger = LedgerSummary()
+    for chunk in read_ledger_chunks(source, chunk_size, file_format):
+        missing = [c for c in ('connection_type', 'length') if c not in chunk]
+        if missing:
+            raise ValueError(f"Ledger is missing required columns: {', '.join(missing)}")
+        ledger.add(chunk, water_params, sewer_params)
+        if progress is not None:
+            progress(ledger.rows, None, ledger.summary())
+    return ledger.summary()
+
+
+def _range_for_mean(distribution):
+    # calculate_break_even prices the midpoint of min/max, so pick a range
+    # centred on the actual mean that keeps the observed P10-P90 spread
+    mean = distribution['mean']
+    half_width = (distribution['p90'] - distribution['p10']) / 2
+    low = max(0.0, mean - half_width)
+    return low, mean + (mean - low)
+
+
+def calculation_inputs(summary, water_params, sewer_params):
+    # Forecast inputs updated with what the ledger shows: mix probabilities
+    # and length ranges, ready to pass back into calculate_break_even
+    water_params = dict(water_params)
+    sewer_params = dict(sewer_params)
+    inputs = {'water_params': water_params, 'sewer_params': sewer_params}
+    if summary['connections']:
+        inputs['prob_water'] = summary['prob_water']
+    if summary['water_connections']:
+        inputs['prob_25mm'] = summary['prob_25mm']
+        water_params['min_length'], water_params['max_length'] = _range_for_mean(summary['water_length'])
+    if summary['sewer_connections']:
+        # calculate_break_even takes prob_mainline as a fraction, not a percentage
+        inputs['prob_mainline'] = summary['prob_mainline'] / 100
+        sewer_params['min_length'], sewer_params['max_length'] = _range_for_mean(summary['sewer_length'])
+    return inputs
+
+
+def compare_to_forecast(summary, result, prob_water, prob_25mm, prob_mainline):
+    # Actual-versus-forecast variance for a calculate_break_even result and the
+    # probabilities it was run with (prob_mainline as passed, i.e. a fraction)
+    rows = [
+        ('Value per connection (SAR)', result['avg_value_per_connection'], summary['avg_value_per_connection']),
+        ('Material cost per connection (SAR)', result['avg_material_cost_per_connection'], summary['avg_cost_per_connection']),
+        ('Water connections (%)', prob_water, summary['prob_water']),
+        ('25mm water connections (%)', prob_25mm, summary['prob_25mm']),
+        ('Mainline sewer connections (%)', 100 * prob_mainline, summary['prob_mainline'])
+    ]
+    return [
+        {
+            'measure': measure,
+            'forecast': forecast,
+            'actual': actual,
+            'variance': actual - forecast,
+            'variance_percent': 100 * (actual - forecast) / forecast if forecast else float('nan')
+        }
+        for measure, forecast, actual in rows
+    ]
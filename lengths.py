@@ -0,0 +1,136 @@
+import numpy as np
+
+import rates as tariffs
+from rates import water_prices, sewer_prices
+
+
+class LengthDistribution:
+    # Connection lengths as sorted, non-overlapping bins with a count each. A
+    # surveyed length is a bin of zero width; histogram bins spread their
+    # count evenly between their edges. Prefix sums of counts and of length
+    # totals answer "how many connections, and how many meters, lie above a
+    # threshold" with one binary search, so pricing against any tariff is
+    # O(log n) however many lengths were surveyed.
+
+    def __init__(self, lows, highs, counts):
+        lows = np.asarray(lows, dtype=float)
+        highs = np.asarray(highs, dtype=float)
+        counts = np.asarray(counts, dtype=float)
+        keep = (counts > 0) & ~np.isnan(lows) & ~np.isnan(highs)
+        lows, highs, counts = lows[keep], highs[keep], counts[keep]
+        if lows.size == 0:
+            raise ValueError("A length distribution needs at least one length")
+        if (lows < 0).any() or (highs < lows).any():
+            raise ValueError("Lengths must be positive, and every bin's upper edge must be at least its lower edge")
+        order = np.argsort(lows, kind='stable')
+        self.lows, self.highs, self.counts = lows[order], highs[order], counts[order]
+        if (self.lows[1:] < self.highs[:-1]).any():
+            raise ValueError("Length bins must not overlap")
+        totals = self.counts * (self.lows + self.highs) / 2
+        self._cumulative_counts = np.concatenate([[0.0], np.cumsum(self.counts)])
+        self._cumulative_totals = np.concatenate([[0.0], np.cumsum(totals)])
+        self.count = float(self._cumulative_counts[-1])
+        self.total = float(self._cumulative_totals[-1])
+        self.mean = self.total / self.count
+
+    def __len__(self):
+        return self.lows.size
+
+    @classmethod
+    def from_lengths(cls, lengths, counts=None):
+        # Individual surveyed lengths, optionally with how often each occurs
+        lengths = np.asarray(lengths, dtype=float)
+        counts = np.ones(lengths.shape) if counts is None else np.asarray(counts, dtype=float)
+        values, inverse = np.unique(lengths, return_inverse=True)
+        return cls(values, values, np.bincount(inverse.ravel(), weights=counts.ravel(), minlength=values.size))
+
+    @classmethod
+    def from_histogram(cls, edges, counts):
+        edges = np.asarray(edges, dtype=float)
+        return cls(edges[:-1], edges[1:], counts)
+
+    @classmethod
+    def from_ledger(cls, distribution):
+        # A water_length/sewer_length entry of a ledger summary; its last bin
+        # collects every longer connection and ends at the longest one seen
+        histogram = distribution['histogram']
+        edges = np.arange(histogram.size + 1) * distribution['bin_width']
+        edges[-1] = max(edges[-2], distribution['max'])
+        return cls.from_histogram(edges, histogram)
+
+    def split(self, threshold):
+        # (count, total length) of the connections at or below `threshold` and
+        # of those above it; a histogram bin containing the threshold is split
+        # in proportion to the part of the bin on each side
+        i = int(np.searchsorted(self.lows, threshold, side='right'))
+        count_above = self.count - self._cumulative_counts[i]
+        total_above = self.total - self._cumulative_totals[i]
+        if i > 0 and self.highs[i - 1] > threshold:
+            low, high, count = self.lows[i - 1], self.highs[i - 1], self.counts[i - 1]
+            share = (high - threshold) / (high - low)
+            count_above += count * share
+            total_above += count * share * (threshold + high) / 2
+        return self.count - count_above, self.total - total_above, count_above, total_above
+
+    def share_above(self, threshold):
+        return self.split(threshold)[2] / self.count
+
+    def mean_below(self, threshold):
+        count, total, _, _ = self.split(threshold)
+        return total / count if count else float('nan')
+
+    def mean_above(self, threshold):
+        _, _, count, total = self.split(threshold)
+        return total / count if count else float('nan')
+
+    def expected_excess(self, threshold):
+        # Mean of max(0, length - threshold) over all connections
+        _, _, count_above, total_above = self.split(threshold)
+        return (total_above - threshold * count_above) / self.count
+
+
+def expected_water_value(size, distribution, rates=None):
+    # Mean of water_connection_value over the distribution, exactly
+    rates = rates or tariffs.RATES
+    base, rate = water_prices(size, rates)
+    return base + rate * distribution.expected_excess(rates['included_length'])
+
+
+def expected_sewer_value(type_, distribution, rates=None):
+    rates = rates or tariffs.RATES
+    base, rate = sewer_prices(type_, rates)
+    return base + rate * distribution.expected_excess(rates['included_length'])
+
+
+def read_lengths(source):
+    # Length survey as CSV (path or file-like): either one row per connection
+    # with a `length` column, or histogram rows with `low`, `high` and `count`.
+    # An optional `count` weights surveyed lengths, and an optional
+    # `connection_type` column (water/sewer) gives each its own distribution.
+    # Returns {'water': LengthDistribution, 'sewer': LengthDistribution}.
+    import pandas as pd
+    survey = pd.read_csv(source)
+    survey.columns = [str(c).strip().lower() for c in survey.columns]
+    if 'length' not in survey and not {'low', 'high', 'count'} <= set(survey.columns):
+        raise ValueError("Length survey needs a length column, or low, high and count columns")
+    if 'connection_type' in survey:
+        kinds = survey['connection_type'].astype(str).str.strip().str.lower()
+        parts = {kind: survey[kinds == kind] for kind in ('water', 'sewer')}
+    else:
+        parts = {'water': survey, 'sewer': survey}
+    distributions = {}
+    for kind, part in parts.items():
+        if part.empty:
+            raise ValueError(f"Length survey has no {kind} connections")
+        counts = pd.to_numeric(part['count'], errors='coerce').fillna(0).to_numpy() if 'count' in part else None
+        if 'length' in part:
+            lengths = pd.to_numeric(part['length'], errors='coerce').to_numpy(dtype=float)
+            usable = ~np.isnan(lengths)
+            distributions[kind] = LengthDistribution.from_lengths(lengths[usable], None if counts is None else counts[usable])
+        else:
+            distributions[kind] = LengthDistribution(
+                pd.to_numeric(part['low'], errors='coerce').to_numpy(dtype=float),
+                pd.to_numeric(part['high'], errors='coerce').to_numpy(dtype=float),
+                counts
+            )
+    return distributions
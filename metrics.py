@@ -0,0 +1,149 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+METRICS_ENV = "BREAK_EVEN_METRICS"
+
+logger = logging.getLogger("break_even.metrics")
+
+# The recorder set for the running code (e.g. one Streamlit session's), see set_recorder
+_RECORDER = contextvars.ContextVar("break_even_metrics", default=None)
+
+
+class Metrics:
+    # Timings and counters for the calculation stages: METRICS for the whole
+    # process, or one per Streamlit session with diagnostics on. The hooks
+    # record into recorder(); with nothing to record into they cost one
+    # context variable lookup. lap() only updates per-stage
+    # totals, so it is cheap enough for the scalar calculation; timer() also
+    # keeps a structured event (with any extra fields, e.g. the connection
+    # count a figure was built for) for the diagnostics log.
+
+    def __init__(self, enabled=False, max_events=1000):
+        self.enabled = enabled
+        self._stages = {}
+        self._counters = {}
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def _record(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                self._stages[stage] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = min(stats[2], seconds)
+                stats[3] = max(stats[3], seconds)
+
+    def lap(self, stage, start):
+        # Records the time since `start` (a perf_counter value) and returns a
+        # new start for the next stage
+        now = time.perf_counter()
+        self._record(stage, now - start)
+        return now
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def timer(self, stage, **fields):
+        return _Timer(self, stage, fields) if self.enabled else _NOT_TIMED
+
+    def event(self, stage, seconds, **fields):
+        self._record(stage, seconds)
+        event = {'time': datetime.now().isoformat(timespec='milliseconds'), 'stage': stage, 'ms': seconds * 1000, **fields}
+        with self._lock:
+            self._events.append(event)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(event, default=str))
+
+    def stats(self):
+        with self._lock:
+            stages = {
+                stage: {'count': count, 'total_ms': total * 1000, 'mean_ms': total / count * 1000, 'min_ms': low * 1000, 'max_ms': high * 1000}
+                for stage, (count, total, low, high) in self._stages.items()
+            }
+            return {'stages': stages, 'counters': dict(self._counters)}
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def to_jsonl(self):
+        # Structured log: one JSON object per timed event, then one summary
+        # line per stage and the counters
+        lines = [json.dumps(event, default=str) for event in self.events()]
+        stats = self.stats()
+        lines += [json.dumps({'summary': stage, **values}) for stage, values in stats['stages'].items()]
+        lines.append(json.dumps({'counters': stats['counters']}))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._events.clear()
+
+
+class _Timer:
+
+    def __init__(self, metrics, stage, fields):
+        self.metrics = metrics
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.event(self.stage, time.perf_counter() - self.start, **self.fields)
+        return False
+
+
+class _NotTimed:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOT_TIMED = _NotTimed()
+
+METRICS = Metrics(enabled=os.environ.get(METRICS_ENV, "") not in ("", "0"))
+
+
+def set_recorder(metrics):
+    # Records this thread's timings (and those of the threads it starts with
+    # a copy of its context) into `metrics`; None falls back to METRICS
+    _RECORDER.set(metrics)
+
+
+def recorder():
+    # Where the hooks record: the recorder set for this context, else METRICS
+    # while it is enabled, else None (nothing is timed)
+    metrics = _RECORDER.get()
+    if metrics is None and METRICS.enabled:
+        return METRICS
+    return metrics
+
+
+def timer(stage, **fields):
+    metrics = recorder()
+    return metrics.timer(stage, **fields) if metrics is not None else _NOT_TIMED
+
+
+def count(name, n=1):
+    metrics = recorder()
+    if metrics is not None:
+        metrics.count(name, n)
@@ -0,0 +1,197 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from calculations import START_DATE, connection_economics, evaluate_record, record_error, scenario_kwargs
+from cashflow import CashFlowSchedule, build_schedule
+from records import InvalidRecord, read_records
+
+DEFAULT_HORIZON = 120
+
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+NUMERIC_COLUMNS = [
+    'net_current_expenses', 'avg_value_per_connection', 'total_cost_per_connection', 'connection_rate',
+    'break_even_connections', 'break_even_months', 'total_expenses_at_break_even', 'total_revenue_at_break_even',
+    'cash_flow_break_even_months', 'max_cash_exposure'
+]
+
+
+def load_projects(source):
+    # Project definitions as a JSON array / JSON lines or a CSV file (path or
+    # text stream), one scenario per project in the format accepted by cli.py.
+    # A project may list "variants": dicts of fields overriding the base scenario.
+    if isinstance(source, str):
+        with open(source) as f:
+            projects = list(read_records(f))
+    else:
+        projects = list(read_records(source))
+    records = []
+    for i, project in enumerate(projects):
+        if isinstance(project, InvalidRecord):
+            raise ValueError(f"Project {i}: {project.error}")
+        project = dict(project)
+        project.setdefault('id', i)
+        variants = project.pop('variants', None) or [{}]
+        for j, overrides in enumerate(variants):
+            record = {**project, **overrides}
+            record['variant'] = overrides.get('variant', 'base' if j == 0 and not overrides else f"variant {j}")
+            records.append(record)
+    return records
+
+
+def _project_schedule(record, result, horizon):
+    if record.get('connection_rates') is not None:
+        rates = np.asarray(record['connection_rates'], dtype=float)
+        direct = np.asarray(record.get('direct_costs', np.full(len(rates), float(record['monthly_direct_cost']))), dtype=float)
+        indirect = np.asarray(record.get('indirect_costs', np.full(len(rates), float(record['monthly_indirect_cost']))), dtype=float)
+    else:
+        rates, direct, indirect = build_schedule(
+            int(record.get('months') or horizon), result['connection_rate'],
+            float(record['monthly_direct_cost']), float(record['monthly_indirect_cost'])
+        )
+    return CashFlowSchedule(result['net_current_expenses'], result['avg_value_per_connection'],
+                            result['avg_material_cost_per_connection'], rates, direct, indirect)
+
+
+def _loss_making(record):
+    # A rate-mode project whose connections do not pay for themselves still
+    # has a cash flow (it never breaks even); the figures to build it, or
+    # None if the record is unreadable, invalid, or in duration mode (no rate)
+    if record_error(record):
+        return None
+    kwargs = scenario_kwargs(record)
+    if kwargs.get('connection_rate') is None:
+        return None
+    economics = connection_economics(**kwargs)
+    if "error" in economics:
+        return None
+    return {**economics, 'connection_rate': kwargs['connection_rate']}
+
+
+def _evaluate_chunk(records, horizon):
+    # Runs in a worker process: evaluates a block of projects and returns
+    # their columns plus the summed monthly net position per variant.
+    # Loss-making projects count towards the combined timeline too.
+    n = len(records)
+    columns = {name: np.full(n, np.nan) for name in NUMERIC_COLUMNS}
+    errors = np.full(n, None, dtype=object)
+    in_timeline = np.zeros(n, dtype=bool)
+    timelines = {}
+    for i, record in enumerate(records):
+        result = evaluate_record(record)
+        if "error" in result:
+            errors[i] = result["error"]
+            result = _loss_making(record)
+            if result is None:
+                continue
+            for name in ('net_current_expenses', 'avg_value_per_connection', 'connection_rate'):
+                columns[name][i] = result[name]
+        else:
+            for name in NUMERIC_COLUMNS[:8]:
+                columns[name][i] = result[name]
+        try:
+            schedule = _project_schedule(record, result, horizon)
+        except ValueError as e:
+            errors[i] = errors[i] or str(e)
+            continue
+        cash_flow = schedule.break_even()
+        if "error" not in cash_flow:
+            columns['cash_flow_break_even_months'][i] = cash_flow['break_even_months']
+            columns['max_cash_exposure'][i] = cash_flow['max_cash_exposure']
+        else:
+            columns['max_cash_exposure'][i] = -float(schedule.net.min(initial=-schedule.net_current_expenses))
+        # After its schedule ends a project's net position stays where it
+        # finished; a project without any months stays at its current expenses
+        net = schedule.net[:horizon]
+        timeline = timelines.setdefault(record['variant'], np.zeros(horizon))
+        timeline[:len(net)] += net
+        timeline[len(net):] += net[-1] if len(net) else -schedule.net_current_expenses
+        in_timeline[i] = True
+    return columns, errors, timelines, in_timeline
+
+
+def evaluate_portfolio(records, workers=None, chunk_size=250, horizon=DEFAULT_HORIZON, progress=None):
+    # Evaluates every project/variant record with calculate_break_even and
+    # its monthly cash flow, fanning chunks of records out to a process pool.
+    # Results are held column-wise: one array per field, one row per record.
+    # progress(records_done, records_total) is called after every chunk.
+    # Callers that run several evaluations at once (e.g. as background jobs)
+    # should pass a share of the CPUs as `workers`; the default uses them all.
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    parts = []
+
+    def report():
+        if progress is not None:
+            progress(min(len(parts) * chunk_size, len(records)), len(records))
+
+    if workers > 1 and len(chunks) > 1:
+        # Workers are not forked from this process, which may be running threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD)) as pool:
+            futures = [pool.submit(_evaluate_chunk, chunk, horizon) for chunk in chunks]
+            try:
+                for future in futures:
+                    parts.append(future.result())
+                    report()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    else:
+        for chunk in chunks:
+            parts.append(_evaluate_chunk(chunk, horizon))
+            report()
+
+    results = {
+        'project': np.array([r.get('id') for r in records], dtype=object),
+        'variant': np.array([r['variant'] for r in records], dtype=object),
+        'error': np.concatenate([p[1] for p in parts]) if parts else np.array([], dtype=object)
+    }
+    results['ok'] = np.array([e is None for e in results['error']], dtype=bool)
+    # Projects in the combined timelines: the feasible ones and those that
+    # never break even but have a cash flow
+    results['in_timeline'] = np.concatenate([p[3] for p in parts]) if parts else np.array([], dtype=bool)
+    for name in NUMERIC_COLUMNS:
+        results[name] = np.concatenate([p[0][name] for p in parts]) if parts else np.array([])
+    timelines = {}
+    for _, _, part, _ in parts:
+        for variant, timeline in part.items():
+            timelines[variant] = timelines.get(variant, 0) + timeline
+    results['timelines'] = timelines
+    return results
+
+
+def portfolio_summary(results):
+    # Combined figures per variant: when the whole portfolio's cumulative net
+    # position turns positive and how deep it goes before that. They include
+    # the projects that never break even; only projects without a cash flow
+    # (invalid inputs, or duration mode with no feasible rate) are left out,
+    # and counted as 'excluded_projects'. A project that does not break even
+    # within its schedule makes the latest break-even infinite.
+    summary = []
+    for variant in dict.fromkeys(results['variant']):
+        rows = results['variant'] == variant
+        feasible = rows & results['ok']
+        included = rows & results['in_timeline']
+        timeline = results['timelines'].get(variant, np.zeros(0))
+        running_best = np.maximum.accumulate(timeline) if len(timeline) else timeline
+        month = int(np.searchsorted(running_best, 0.0, side='left'))
+        exposure = results['max_cash_exposure'][included]
+        break_even = results['cash_flow_break_even_months'][included]
+        summary.append({
+            'variant': variant,
+            'projects': int(rows.sum()),
+            'infeasible_projects': int(rows.sum() - feasible.sum()),
+            'excluded_projects': int(rows.sum() - included.sum()),
+            'net_current_expenses': float(np.nansum(results['net_current_expenses'][included])),
+            'max_project_exposure': float(np.nanmax(exposure)) if np.isfinite(exposure).any() else float('nan'),
+            'combined_cash_exposure': max(0.0, -float(timeline.min(initial=0.0))),
+            # Month in which the portfolio as a whole first covers its costs
+            'combined_break_even_date': (START_DATE + relativedelta(months=month)).strftime('%B %Y') if month < len(timeline) else None,
+            'latest_project_break_even_months': float(np.nan_to_num(break_even, nan=np.inf).max()) if break_even.size else float('nan')
+        })
+    return summary
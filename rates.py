@@ -0,0 +1,138 @@
+import json
+import os
+
+import numpy as np
+
+DEFAULT_TARIFF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tariffs.json")
+TARIFF_PATH_ENV = "BREAK_EVEN_TARIFFS"
+
+
+def load_rate_table(path=None):
+    # Reads a versioned tariff file into flat arrays. Water services are
+    # indexed by their position in the sorted `water_sizes` array and sewer
+    # connections by their position in `sewer_types`; one extra NaN row at
+    # the end of every price array prices unknown sizes and types as NaN, so
+    # they cannot pass for free connections.
+    path = path or os.environ.get(TARIFF_PATH_ENV) or DEFAULT_TARIFF_PATH
+    with open(path) as f:
+        tariff = json.load(f)
+
+    if "version" not in tariff:
+        raise ValueError(f"Tariff file {path} has no version")
+    water = sorted((float(size), prices) for size, prices in tariff['water'].items())
+    sewer = list(tariff['sewer'].items())
+
+    return {
+        'version': str(tariff['version']),
+        'path': path,
+        'included_length': float(tariff['included_length']),
+        'water_sizes': np.array([size for size, _ in water]),
+        'water_base': np.array([p['connection'] + p['water_meter'] + p['meter_box'] for _, p in water] + [np.nan], dtype=float),
+        'water_extra_rate': np.array([p['extra_length_rate'] for _, p in water] + [np.nan], dtype=float),
+        'sewer_types': [type_ for type_, _ in sewer],
+        'sewer_codes': {type_: code for code, (type_, _) in enumerate(sewer)},
+        'sewer_base': np.array([p['connection'] + p['cleanout'] for _, p in sewer] + [np.nan], dtype=float),
+        'sewer_extra_rate': np.array([p['extra_length_rate'] for _, p in sewer] + [np.nan], dtype=float),
+        # Plain-float copies for pricing one connection without array overhead
+        'water_prices': {size: (float(p['connection'] + p['water_meter'] + p['meter_box']), float(p['extra_length_rate'])) for size, p in water},
+        'sewer_prices': {type_: (float(p['connection'] + p['cleanout']), float(p['extra_length_rate'])) for type_, p in sewer},
+        'material': {k: float(v) for k, v in tariff['material'].items()}
+    }
+
+
+RATES = load_rate_table()
+
+
+def set_rate_table(table):
+    global RATES
+    RATES = table
+
+
+def _result(value):
+    return float(value) if np.ndim(value) == 0 else value
+
+
+def water_prices(size, rates=None):
+    # (base price, rate per extra meter) for one water service size
+    rates = rates or RATES
+    prices = rates['water_prices'].get(float(size))
+    if prices is None:
+        sizes = ", ".join(f"{s:g}" for s in rates['water_sizes'])
+        raise ValueError(f"Tariff {rates['version']} has no price for {size} mm water connections (sizes: {sizes})")
+    return prices
+
+
+def sewer_prices(type_, rates=None):
+    rates = rates or RATES
+    prices = rates['sewer_prices'].get(type_)
+    if prices is None:
+        raise ValueError(f"Tariff {rates['version']} has no price for {type_} sewer connections (types: {', '.join(rates['sewer_types'])})")
+    return prices
+
+
+def water_size_code(size, rates=None):
+    rates = rates or RATES
+    sizes = rates['water_sizes']
+    size = np.asarray(size, dtype=float)
+    code = np.minimum(np.searchsorted(sizes, size), len(sizes) - 1)
+    return np.where(sizes[code] == size, code, len(sizes))
+
+
+def sewer_type_code(type_, rates=None):
+    # Accepts type names ("mainline", "manhole", ...) or integer codes
+    rates = rates or RATES
+    codes = rates['sewer_codes']
+    unknown = len(rates['sewer_types'])
+    type_ = np.asarray(type_)
+    if type_.dtype.kind in "iu":
+        return np.where((type_ >= 0) & (type_ < unknown), type_, unknown)
+    if type_.ndim == 0:
+        return np.asarray(codes.get(type_.item(), unknown))
+    names, inverse = np.unique(type_, return_inverse=True)
+    return np.array([codes.get(name, unknown) for name in names.tolist()], dtype=np.intp)[inverse].reshape(type_.shape)
+
+
+def water_connection_value(size, length, rates=None):
+    rates = rates or RATES
+    included = rates['included_length']
+    if np.isscalar(size) and np.isscalar(length):
+        base, rate = water_prices(size, rates)
+        return base + (length - included) * rate if length > included else base
+    code = water_size_code(size, rates)
+    length = np.asarray(length, dtype=float)
+    value = np.where(length > included, rates['water_base'][code] + (length - included) * rates['water_extra_rate'][code], rates['water_base'][code])
+    return _result(value)
+
+
+def sewer_connection_value(type_, length, rates=None):
+    rates = rates or RATES
+    included = rates['included_length']
+    if isinstance(type_, str) and np.isscalar(length):
+        base, rate = sewer_prices(type_, rates)
+        return base + (length - included) * rate if length > included else base
+    code = sewer_type_code(type_, rates)
+    length = np.asarray(length, dtype=float)
+    value = np.where(length > included, rates['sewer_base'][code] + (length - included) * rates['sewer_extra_rate'][code], rates['sewer_base'][code])
+    return _result(value)
+
+
+def water_connection_material_cost(size, length, pipe_cost, meter_cost, asphalt_cost, bedding_cost, rates=None):
+    m = (rates or RATES)['material']
+    total_length = length + m['extra_pipe_length']
+    pipe_cost = total_length * pipe_cost
+    fitting_cost = m['fitting_ratio'] * pipe_cost
+    asphalt_cost = m['trench_width'] * m['trench_depth'] * length * m['asphalt_factor'] * asphalt_cost
+    bedding_cost = ((size / 1000) + m['bedding_depth']) * m['trench_width'] * length * m['bedding_rate']
+    total_cost = (pipe_cost + meter_cost + fitting_cost + asphalt_cost + bedding_cost) * m['markup']
+    return _result(total_cost)
+
+
+def sewer_connection_material_cost(length, pipe_cost, asphalt_cost, bedding_cost, rates=None):
+    m = (rates or RATES)['material']
+    total_length = length + m['extra_pipe_length']
+    pipe_cost = total_length * pipe_cost
+    fitting_cost = m['fitting_ratio'] * pipe_cost
+    asphalt_cost = m['trench_width'] * m['trench_depth'] * length * m['asphalt_factor'] * asphalt_cost
+    bedding_cost = m['bedding_depth'] * m['trench_width'] * length * m['bedding_rate']
+    total_cost = (pipe_cost + fitting_cost + asphalt_cost + bedding_cost) * m['markup']
+    return _result(total_cost)
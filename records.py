@@ -0,0 +1,78 @@
+import csv
+import itertools
+import json
+import re
+
+WHITESPACE = re.compile(r'\s*')
+
+
+class InvalidRecord:
+    # Stands in for input that could not be decoded, so a stream of records
+    # can report it as an error row (see calculations.record_error) and go on
+    def __init__(self, error):
+        self.error = error
+
+    def __repr__(self):
+        return f"InvalidRecord({self.error!r})"
+
+
+def read_json_records(lines):
+    # Accepts a JSON array, or any number of JSON values one after another
+    # (JSON lines or pretty-printed). Values, including the elements of an
+    # array, are yielded as soon as they parse; only the value being read is
+    # held in memory. Text that is not valid JSON is yielded as an
+    # InvalidRecord, and reading goes on from the next line.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    # Position in buffer, and the input line it is on
+    pos = 0
+    line = 1
+    in_array = False
+    for text in itertools.chain(lines, [None]):
+        buffer = buffer[pos:] + (text or "")
+        pos = 0
+        while True:
+            start = pos
+            pos = WHITESPACE.match(buffer, pos).end()
+            line += buffer.count("\n", start, pos)
+            if in_array and buffer[pos:pos + 1] in (",", "]"):
+                in_array = buffer[pos] == ","
+                pos += 1
+                continue
+            if not in_array and buffer[pos:pos + 1] == "[":
+                in_array = True
+                pos += 1
+                continue
+            if pos == len(buffer):
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                # Input ends mid-value: wait for the next line, unless there is none
+                if e.pos >= len(buffer) and text is not None:
+                    break
+                end = buffer.find("\n", e.pos)
+                end = len(buffer) if end < 0 else end
+                error_line = line + buffer.count("\n", pos, e.pos)
+                yield InvalidRecord(f"Invalid JSON on line {error_line}: {e.msg}")
+            else:
+                yield record
+            line += buffer.count("\n", pos, end)
+            pos = end
+        if text is None:
+            break
+    if in_array:
+        yield InvalidRecord(f"Invalid JSON on line {line}: array is not closed")
+
+
+def read_records(stream, input_format="auto"):
+    lines = iter(stream)
+    first = next(lines, "")
+    while first and not first.strip():
+        first = next(lines, "")
+    lines = itertools.chain([first], lines)
+    if input_format == "auto":
+        input_format = "json" if first.lstrip()[:1] in ("[", "{") else "csv"
+    if input_format == "csv":
+        return csv.DictReader(lines)
+    return read_json_records(lines)
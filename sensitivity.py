@@ -0,0 +1,109 @@
+import numpy as np
+
+from batch import calculate_break_even_batch, ERROR_MESSAGES, ERROR_NONE
+from calculations import SCENARIO_KEYS
+from solver import UNKNOWNS, input_value
+
+# Scale of an input whose base value is 0, so it can still be moved by
+# `step`: amounts netted off the current expenses move by a share of those,
+# probabilities by their full range, everything else by one unit
+ZERO_BASE_SCALES = {'invoices_received': 'current_expenses', 'store_stock_value': 'current_expenses',
+                    'prob_water': 100.0, 'prob_25mm': 100.0, 'prob_mainline': 1.0}
+
+# Valid range of each input; prob_water and prob_25mm are percentages, while
+# prob_mainline is a fraction (see calculate_break_even). Others are only
+# bounded below.
+INPUT_BOUNDS = {'prob_water': (0.0, 100.0), 'prob_25mm': (0.0, 100.0), 'prob_mainline': (0.0, 1.0)}
+
+
+def _zero_base_step(scenario, name, step):
+    scale = ZERO_BASE_SCALES.get(name, 1.0)
+    if isinstance(scale, str):
+        scale = abs(float(input_value(scenario, scale) or 0.0)) or 1.0
+    return step * scale
+
+
+def sensitivity_analysis(scenario, step=0.1, metric=None, inputs=None):
+    # Moves every numeric input of calculate_break_even down and up by `step`
+    # (relative) and prices all 2N + 1 scenarios in one batch call. Returns
+    # one row per input, sorted by swing (the spread of `metric` between the
+    # low and high case), with its elasticity around the base scenario.
+    # Inputs at 0 are moved up by an absolute amount instead. Both cases are
+    # clamped to the input's valid range, so an input at a bound (0, or 100%)
+    # has that side equal to the base case and a one-sided difference. Inputs
+    # for which either case is infeasible are listed separately under
+    # 'infeasible'.
+    # Probabilities left out of the scenario take calculate_break_even's defaults
+    scenario = {'prob_water': 50, 'prob_25mm': 50, 'prob_mainline': 50, **scenario}
+    if metric is None:
+        metric = 'connection_rate' if scenario.get('duration_months') is not None else 'break_even_months'
+    names = [name for name in (inputs or UNKNOWNS) if input_value(scenario, name) is not None]
+    base = {name: float(input_value(scenario, name)) for name in names}
+    rows = 2 * len(names) + 1
+
+    columns = {name: np.full(rows, value) for name, value in base.items()}
+    for j, name in enumerate(names):
+        lower, upper = INPUT_BOUNDS.get(name, (0.0, np.inf))
+        if base[name] == 0:
+            columns[name][2 + 2 * j] = min(upper, _zero_base_step(scenario, name, step))
+        elif lower <= base[name] <= upper:
+            columns[name][1 + 2 * j] = max(lower, base[name] * (1 - step))
+            columns[name][2 + 2 * j] = min(upper, base[name] * (1 + step))
+        else:
+            # Out of range already, so the base case reports the error
+            columns[name][1 + 2 * j] = base[name] * (1 - step)
+            columns[name][2 + 2 * j] = base[name] * (1 + step)
+
+    kwargs = {k: scenario.get(k) for k in SCENARIO_KEYS}
+    kwargs['water_params'] = dict(scenario['water_params'])
+    kwargs['sewer_params'] = dict(scenario['sewer_params'])
+    for name, column in columns.items():
+        if name in SCENARIO_KEYS:
+            kwargs[name] = column
+        elif name.startswith('water_'):
+            kwargs['water_params'][name[len('water_'):]] = column
+        else:
+            kwargs['sewer_params'][name[len('sewer_'):]] = column
+    result = calculate_break_even_batch(**kwargs)
+
+    values = np.where(result['error_code'] == ERROR_NONE, result[metric], np.nan)
+    if result['error_code'][0] != ERROR_NONE:
+        return {"error": "Base scenario is infeasible: " + ERROR_MESSAGES[int(result['error_code'][0])]}
+    base_metric = float(values[0])
+    low = values[1::2]
+    high = values[2::2]
+    base_values = np.array([base[name] for name in names])
+    moved = np.array([columns[name][2 + 2 * j] - columns[name][1 + 2 * j] for j, name in enumerate(names)])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Relative change of the metric per relative change of the input;
+        # undefined for inputs at 0
+        elasticity = np.where((base_values == 0) | (moved == 0), np.nan, (high - low) / base_metric / (moved / base_values))
+    swing = np.abs(high - low)
+
+    def row(j):
+        return {
+            'input': names[j],
+            'base_value': base[names[j]],
+            'low_value': float(columns[names[j]][1 + 2 * j]),
+            'high_value': float(columns[names[j]][2 + 2 * j]),
+            'low': float(low[j]),
+            'high': float(high[j]),
+            'swing': float(swing[j]),
+            'elasticity': float(elasticity[j])
+        }
+
+    feasible = ~np.isnan(swing)
+    order = np.flatnonzero(feasible)[np.argsort(-swing[feasible], kind='stable')]
+    infeasible = []
+    for j in np.flatnonzero(~feasible):
+        codes = result['error_code'][[1 + 2 * j, 2 + 2 * j]]
+        infeasible.append({**row(j), 'error': "; ".join(
+            f"{side} case: {ERROR_MESSAGES[int(code)]}" for side, code in zip(('Low', 'High'), codes) if code != ERROR_NONE
+        )})
+    return {
+        'metric': metric,
+        'step': step,
+        'base': base_metric,
+        'rows': [row(j) for j in order],
+        'infeasible': infeasible
+    }
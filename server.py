@@ -0,0 +1,174 @@
+import json
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import rates
+from calculations import evaluate_record, record_error
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class BreakEvenHandler(BaseHTTPRequestHandler):
+    # GET /health, and POST /break-even with one scenario object or a list of them
+    protocol_version = "HTTP/1.1"
+    # Keep-alive connections idle for longer than this are closed
+    timeout = 30
+    # Headers and body go out in separate writes; without this, delayed ACKs cap each keep-alive connection at ~25 requests/sec
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # Serves the requests the client has already sent, then returns; a
+        # connection kept alive waits for its next request in the server's
+        # idle watcher instead of holding a worker
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._request_waiting():
+            self.handle_one_request()
+
+    def _request_waiting(self):
+        # Without blocking: is there (pipelined) data in the read buffer or on the socket?
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "tariff_version": rates.RATES['version']})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/break-even":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be found, so neither can the next request
+            self.close_connection = True
+            self._send_json(400, {"error": "Content-Length must be a non-negative integer"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": f"Request body larger than {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(payload, (list, dict)):
+            self._send_json(400, {"error": "Expected a scenario object or a list of scenarios"})
+            return
+        records = payload if isinstance(payload, list) else [payload]
+        for i, record in enumerate(records):
+            error = record_error(record)
+            if error:
+                self._send_json(400, {"error": f"Scenario {i}: {error}" if isinstance(payload, list) else error})
+                return
+        try:
+            results = [evaluate_record(record) for record in records]
+        except Exception as e:
+            self.close_connection = True
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            raise
+        self._send_json(200, results if isinstance(payload, list) else results[0])
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    # Hands each request to a fixed-size thread pool instead of one thread per
+    # connection. Between requests, keep-alive connections are parked in a
+    # selector watched by one thread, so idle clients never hold a worker.
+
+    def __init__(self, server_address, handler_class=BreakEvenHandler, workers=8, verbose=False):
+        super().__init__(server_address, handler_class)
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self._idle = selectors.DefaultSelector()
+        self._idle_lock = threading.Lock()
+        self._closing = False
+        self._watcher = threading.Thread(target=self._watch_idle, name="break-even-idle", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process_request(self, request, client_address):
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        if handler.close_connection or self._closing:
+            self.shutdown_request(request)
+        else:
+            with self._idle_lock:
+                self._idle.register(request, selectors.EVENT_READ, (client_address, time.monotonic()))
+
+    def _watch_idle(self):
+        # Sends a parked connection back to the pool once its next request
+        # arrives, and closes those idle for longer than the handler timeout
+        while not self._closing:
+            ready = self._idle.select(timeout=0.5)
+            expired = []
+            with self._idle_lock:
+                for key, _ in ready:
+                    self._idle.unregister(key.fileobj)
+                now = time.monotonic()
+                for key in list(self._idle.get_map().values()):
+                    if now - key.data[1] > self.RequestHandlerClass.timeout:
+                        self._idle.unregister(key.fileobj)
+                        expired.append(key.fileobj)
+            for key, _ in ready:
+                self.pool.submit(self._process_request, key.fileobj, key.data[0])
+            for request in expired:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._closing = True
+        self._watcher.join()
+        self.pool.shutdown(wait=True)
+        with self._idle_lock:
+            parked = [key.fileobj for key in self._idle.get_map().values()]
+            for request in parked:
+                self._idle.unregister(request)
+        for request in parked:
+            self.shutdown_request(request)
+        self._idle.close()
+
+
+def serve(host="127.0.0.1", port=8502, workers=8):
+    server = PooledHTTPServer((host, port), workers=workers, verbose=True)
+    print(f"Serving break-even calculations on http://{host}:{server.server_port}/break-even with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,186 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calculations import calculate_break_even
+from batch import format_break_even_dates
+from rates import water_connection_value, sewer_connection_value, water_connection_material_cost, sewer_connection_material_cost, sewer_type_code
+
+PERCENTILES = (10, 50, 90)
+
+
+def sample_connections(rng, shape, model):
+    # Draws connection type, size and length for every slot in `shape` and
+    # returns (value, material_cost) arrays priced like calculate_break_even.
+    # A connection is either water or sewer, so the size/sewer-type draw and
+    # the length draw are shared between the two branches.
+    is_water = rng.random(shape) < model['prob_water']
+    subtype = rng.random(shape)
+    u = rng.random(shape)
+    is_25mm = subtype < model['prob_25mm']
+    is_mainline = subtype < model['prob_mainline']
+    water_length = model['water_min_length'] + u * (model['water_max_length'] - model['water_min_length'])
+    sewer_length = model['sewer_min_length'] + u * (model['sewer_max_length'] - model['sewer_min_length'])
+
+    size = np.where(is_25mm, 25, 32)
+    water_value = water_connection_value(size, water_length)
+    water_material_cost = water_connection_material_cost(
+        size, water_length,
+        np.where(is_25mm, model['pipe_cost_25'], model['pipe_cost_32']),
+        np.where(is_25mm, model['meter_cost_25'], model['meter_cost_32']),
+        model['water_asphalt_cost'], model['water_bedding_cost']
+    )
+    sewer_type = np.where(is_mainline, sewer_type_code("mainline"), sewer_type_code("manhole"))
+    sewer_value = sewer_connection_value(sewer_type, sewer_length)
+    sewer_material_cost = sewer_connection_material_cost(
+        sewer_length, model['sewer_pipe_cost'], model['sewer_asphalt_cost'], model['sewer_bedding_cost']
+    )
+    value = np.where(is_water, water_value, sewer_value)
+    material_cost = np.where(is_water, water_material_cost, sewer_material_cost)
+    return value, material_cost
+
+
+def _simulate_chunk(seed, trials, model, chunk_size, max_connections):
+    # Runs `trials` independent projects, drawing connections in blocks of at
+    # most chunk_size samples until each project's cumulative net revenue
+    # covers the net current expenses. Returns the break-even connection count
+    # per trial (inf if it never breaks even within max_connections).
+    rng = np.random.default_rng(seed)
+    target = model['net_current_expenses']
+    per_connection_cost = model['direct_cost_per_connection'] + model['indirect_cost_per_connection']
+    break_even = np.full(trials, np.inf)
+    if target <= 0:
+        return np.zeros(trials), 0, 0.0, 0.0
+
+    cumulative = np.zeros(trials)
+    remaining = np.arange(trials)
+    drawn = 0
+    simulated = 0
+    value_sum = 0.0
+    material_sum = 0.0
+    while remaining.size and drawn < max_connections:
+        block = max(1, min(chunk_size // remaining.size, max_connections - drawn))
+        value, material_cost = sample_connections(rng, (remaining.size, block), model)
+        path = cumulative[remaining, None] + np.cumsum(value - material_cost - per_connection_cost, axis=1)
+        crossed = path >= target
+        hit = crossed.any(axis=1)
+        break_even[remaining[hit]] = drawn + crossed[hit].argmax(axis=1) + 1
+        cumulative[remaining] = path[:, -1]
+        remaining = remaining[~hit]
+        drawn += block
+        simulated += value.size
+        value_sum += value.sum()
+        material_sum += material_cost.sum()
+    return break_even, simulated, value_sum, material_sum
+
+
+def simulate_break_even(current_expenses, invoices_received, store_stock_value, water_params, sewer_params, monthly_direct_cost, monthly_indirect_cost, connection_rate=None, duration_months=None, prob_water=50, prob_25mm=50, prob_mainline=50, trials=10000, chunk_size=1_000_000, seed=None, workers=None, max_connections=None, progress=None):
+    # Monte Carlo version of calculate_break_even: instead of pricing the
+    # midpoint length with fixed weights, every connection gets its own type,
+    # size and uniformly distributed length. Trials are split into fixed-size
+    # chunks with their own child seeds, so results depend only on `seed`,
+    # never on `workers`.
+    result = calculate_break_even(
+        current_expenses, invoices_received, store_stock_value, water_params, sewer_params,
+        monthly_direct_cost, monthly_indirect_cost, connection_rate, duration_months,
+        prob_water, prob_25mm, prob_mainline
+    )
+    if "error" in result:
+        return result
+
+    model = {
+        'prob_water': prob_water / 100,
+        'prob_25mm': prob_25mm / 100,
+        # Same scale as calculate_break_even, which uses prob_mainline as given
+        'prob_mainline': prob_mainline,
+        'water_min_length': water_params['min_length'],
+        'water_max_length': water_params['max_length'],
+        'pipe_cost_25': water_params['pipe_cost_25'],
+        'pipe_cost_32': water_params['pipe_cost_32'],
+        'meter_cost_25': water_params['meter_cost_25'],
+        'meter_cost_32': water_params['meter_cost_32'],
+        'water_asphalt_cost': water_params['asphalt_cost'],
+        'water_bedding_cost': water_params['bedding_cost'],
+        'sewer_min_length': sewer_params['min_length'],
+        'sewer_max_length': sewer_params['max_length'],
+        'sewer_pipe_cost': sewer_params['pipe_cost'],
+        'sewer_asphalt_cost': sewer_params['asphalt_cost'],
+        'sewer_bedding_cost': sewer_params['bedding_cost'],
+        'net_current_expenses': result['net_current_expenses'],
+        'direct_cost_per_connection': result['direct_cost_per_connection'],
+        'indirect_cost_per_connection': result['indirect_cost_per_connection']
+    }
+    if max_connections is None:
+        max_connections = 10 * math.ceil(result['break_even_connections']) + 1000
+
+    # Each chunk holds enough trials to fill chunk_size samples on its first block
+    trials_per_chunk = max(1, min(trials, chunk_size // max(1, math.ceil(result['break_even_connections']))))
+    sizes = [min(trials_per_chunk, trials - start) for start in range(0, trials, trials_per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, n, model, chunk_size, max_connections) for s, n in zip(seeds, sizes)]
+
+    # progress(done, total, partial) gets the summary of the trials finished
+    # so far, about 20 times per run so summarizing stays cheap
+    chunks = []
+    report_every = max(1, len(args) // 20)
+
+    def report():
+        if progress is not None and (len(chunks) % report_every == 0 or len(chunks) == len(args)):
+            progress(len(chunks), len(args), _summarize(result, chunks))
+
+    if workers and workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_simulate_chunk, *a) for a in args]
+            try:
+                for future in futures:
+                    chunks.append(future.result())
+                    report()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    else:
+        for a in args:
+            chunks.append(_simulate_chunk(*a))
+            report()
+    return _summarize(result, chunks)
+
+
+def percentiles(samples, q):
+    # np.percentile (linear interpolation), except that a percentile reaching
+    # into the trials that never break even (inf) is inf, where np.percentile
+    # gives NaN
+    position = np.asarray(q, dtype=float) / 100 * (samples.size - 1)
+    low = np.floor(position).astype(int)
+    high = np.ceil(position).astype(int)
+    ordered = np.partition(samples, np.union1d(low, high))
+    fraction = position - low
+    with np.errstate(invalid='ignore'):
+        interpolated = ordered[low] + (ordered[high] - ordered[low]) * fraction
+    return np.where(fraction == 0, ordered[low], np.where(np.isinf(ordered[high]), np.inf, interpolated))
+
+
+def _summarize(result, chunks):
+    break_even_connections = np.concatenate([c[0] for c in chunks])
+    simulated = sum(c[1] for c in chunks)
+    connection_rate = result['connection_rate']
+    connections = percentiles(break_even_connections, PERCENTILES)
+    months = connections / connection_rate
+    dates = format_break_even_dates(months)
+
+    summary = {
+        'trials': break_even_connections.size,
+        'simulated_connections': simulated,
+        'connection_rate': connection_rate,
+        'mean_value_per_connection': float(sum(c[2] for c in chunks) / simulated) if simulated else float('nan'),
+        'mean_material_cost_per_connection': float(sum(c[3] for c in chunks) / simulated) if simulated else float('nan'),
+        'midpoint_break_even_connections': result['break_even_connections'],
+        'never_break_even': int(np.isinf(break_even_connections).sum()),
+        'break_even_connections_samples': break_even_connections
+    }
+    for p, n, m, d in zip(PERCENTILES, connections, months, dates):
+        summary[f'break_even_connections_p{p}'] = float(n)
+        summary[f'break_even_months_p{p}'] = float(m)
+        summary[f'break_even_date_p{p}'] = d if d is not None else "Never"
+    return summary
@@ -0,0 +1,155 @@
+import numpy as np
+
+from batch import calculate_break_even_batch, ERROR_NONE
+from calculations import calculate_break_even, SCENARIO_KEYS, WATER_PARAM_KEYS, SEWER_PARAM_KEYS
+
+UNKNOWNS = SCENARIO_KEYS + ['water_' + k for k in WATER_PARAM_KEYS] + ['sewer_' + k for k in SEWER_PARAM_KEYS]
+# A scenario gives either a connection rate or a duration; only the one it
+# gives can be solved for, and the metric to reach depends on which it is:
+# the break-even time for a rate, the connection rate needed for a duration
+RATE_UNKNOWNS = [name for name in UNKNOWNS if name != 'duration_months']
+DURATION_UNKNOWNS = [name for name in UNKNOWNS if name != 'connection_rate']
+
+# Metrics where an infeasible scenario means "never breaks even" (or, for
+# the connection rate a duration needs, "no rate is enough")
+NEVER_METRICS = ('break_even_months', 'break_even_connections', 'break_even_connections_rounded', 'connection_rate')
+
+
+def scenario_mode(scenario):
+    # (inputs that can be solved for, default metric) for a scenario
+    if scenario.get('duration_months') is not None and scenario.get('connection_rate') is None:
+        return DURATION_UNKNOWNS, 'connection_rate'
+    return RATE_UNKNOWNS, 'break_even_months'
+
+
+def _with_unknown(scenario, unknown, value):
+    kwargs = dict(scenario)
+    for prefix, params in (('water_', 'water_params'), ('sewer_', 'sewer_params')):
+        if unknown.startswith(prefix) and unknown not in SCENARIO_KEYS:
+            kwargs[params] = {**scenario[params], unknown[len(prefix):]: value}
+            return kwargs
+    kwargs[unknown] = value
+    return kwargs
+
+
+def input_value(scenario, unknown):
+    for prefix, params in (('water_', 'water_params'), ('sewer_', 'sewer_params')):
+        if unknown.startswith(prefix) and unknown not in SCENARIO_KEYS:
+            return scenario[params][unknown[len(prefix):]]
+    return scenario.get(unknown)
+
+
+def _evaluate(scenario, unknown, candidates, metric, target):
+    result = calculate_break_even_batch(**_with_unknown(scenario, unknown, candidates))
+    valid = result['error_code'] == ERROR_NONE
+    gap = np.where(valid, result[metric] - target, np.inf if metric in NEVER_METRICS else np.nan)
+    return gap, valid
+
+
+def _valid(scenario, unknown, candidates):
+    return calculate_break_even_batch(**_with_unknown(scenario, unknown, candidates))['error_code'] == ERROR_NONE
+
+
+def _valid_edge(scenario, unknown, inside, outside, candidates, tolerance, max_iterations):
+    # Narrows the boundary between a valid value `inside` and an invalid one
+    # `outside` like the main search; returns the last valid value found
+    evaluations = 0
+    for _ in range(max_iterations):
+        if abs(outside - inside) <= tolerance * max(1.0, abs(inside)):
+            break
+        grid = np.linspace(inside, outside, candidates)
+        valid = _valid(scenario, unknown, grid)
+        evaluations += grid.size
+        i = int(np.argmin(valid))
+        if i == 0:
+            break
+        inside, outside = float(grid[i - 1]), float(grid[i])
+    return inside, evaluations
+
+
+def _first_crossing(gap):
+    # Index i of the first pair (i, i + 1) where the gap changes sign or hits zero
+    sign = np.sign(gap)
+    crossing = (sign[:-1] * sign[1:] <= 0) & ~np.isnan(gap[:-1]) & ~np.isnan(gap[1:])
+    index = np.flatnonzero(crossing)
+    return int(index[0]) if index.size else None
+
+
+def goal_seek(scenario, unknown, target, metric=None, lower=0.0, upper=None, candidates=64, tolerance=1e-6, max_iterations=60):
+    # Finds the value of `unknown` (any calculate_break_even argument, with
+    # water/sewer parameters named like "water_meter_cost_25") at which
+    # `metric` reaches `target`. Each iteration prices `candidates` evenly
+    # spaced values of the current bracket in one batch call and keeps the
+    # sub-interval where the gap changes sign, shrinking the bracket by a
+    # factor of candidates - 1 per call. `metric` defaults to the one that
+    # the scenario's mode leaves open (see scenario_mode).
+    unknowns, default_metric = scenario_mode(scenario)
+    metric = metric or default_metric
+    if unknown not in unknowns:
+        return {"error": f"Cannot solve for {unknown} in this scenario; choose one of {', '.join(unknowns)}"}
+    if candidates < 3:
+        return {"error": "At least 3 candidates per iteration are needed"}
+
+    evaluations = 0
+    if upper is None:
+        # Grow the search range geometrically from the current value in a single call
+        start = max(abs(input_value(scenario, unknown) or 0.0), 1.0)
+        grid = np.concatenate([[lower], lower + np.geomspace(start / 16, start * 2.0 ** 20, candidates - 1)])
+    else:
+        grid = np.linspace(lower, upper, candidates)
+    gap, valid = _evaluate(scenario, unknown, grid, metric, target)
+    evaluations += grid.size
+    # Smallest and largest values in the searched range that give a valid
+    # scenario, with the edges refined like the target itself
+    valid_range = None
+    if valid.any():
+        first, last = np.flatnonzero(valid)[[0, -1]]
+        low_edge, high_edge = float(grid[first]), float(grid[last])
+        if first > 0:
+            low_edge, n = _valid_edge(scenario, unknown, low_edge, float(grid[first - 1]), candidates, tolerance, max_iterations)
+            evaluations += n
+        if last < grid.size - 1:
+            high_edge, n = _valid_edge(scenario, unknown, high_edge, float(grid[last + 1]), candidates, tolerance, max_iterations)
+            evaluations += n
+        valid_range = (low_edge, high_edge)
+
+    i = _first_crossing(gap)
+    if i is None:
+        return {
+            "error": f"{metric} does not reach {target:,.2f} for {unknown} between {grid[0]:,.2f} and {grid[-1]:,.2f}",
+            'valid_range': valid_range,
+            'evaluations': evaluations
+        }
+    low, high = float(grid[i]), float(grid[i + 1])
+    gap_low, gap_high = float(gap[i]), float(gap[i + 1])
+
+    iterations = 1
+    while high - low > tolerance * max(1.0, abs(low)) and iterations < max_iterations and gap_low != 0 and gap_high != 0:
+        grid = np.linspace(low, high, candidates)
+        gap, _ = _evaluate(scenario, unknown, grid, metric, target)
+        evaluations += grid.size
+        iterations += 1
+        i = _first_crossing(gap)
+        if i is None:
+            break
+        low, high = float(grid[i]), float(grid[i + 1])
+        gap_low, gap_high = float(gap[i]), float(gap[i + 1])
+
+    # Report the bracket end that meets the target (metric at or below it),
+    # i.e. the highest affordable value when the metric grows with the unknown
+    increasing = gap_high > gap_low
+    value = low if gap_low <= 0 else high
+    result = calculate_break_even(**_with_unknown(scenario, unknown, value))
+    return {
+        'unknown': unknown,
+        'value': value,
+        'metric': metric,
+        'target': target,
+        'achieved': result.get(metric),
+        'direction': 'maximum' if increasing else 'minimum',
+        'bracket': (low, high),
+        'valid_range': valid_range,
+        'iterations': iterations,
+        'evaluations': evaluations,
+        'result': result
+    }
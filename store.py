@@ -0,0 +1,225 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from cache import normalize
+from calculations import SCENARIO_KEYS, WATER_PARAM_KEYS, SEWER_PARAM_KEYS
+
+# Next to the app rather than in whatever directory it was started from
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.db")
+STORE_PATH_ENV = "BREAK_EVEN_STORE"
+# Upserts (INSERT ... ON CONFLICT DO UPDATE) need SQLite 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+# Result fields copied into their own indexed columns for filtering and sorting
+METRIC_COLUMNS = ['break_even_months', 'break_even_connections', 'connection_rate', 'net_current_expenses',
+                  'total_cost_per_connection', 'net_revenue_per_connection']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    tariff_version TEXT NOT NULL,
+    scenario_key TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    result TEXT NOT NULL,
+    error TEXT,
+    {', '.join(f'{name} REAL' for name in METRIC_COLUMNS)}
+);
+CREATE UNIQUE INDEX IF NOT EXISTS scenarios_key ON scenarios (scenario_key, project);
+CREATE INDEX IF NOT EXISTS scenarios_project ON scenarios (project, created_at);
+CREATE INDEX IF NOT EXISTS scenarios_created_at ON scenarios (created_at);
+""" + "".join(f"CREATE INDEX IF NOT EXISTS scenarios_{name} ON scenarios ({name});\n" for name in METRIC_COLUMNS)
+
+LIST_COLUMNS = ['id', 'project', 'created_at', 'tariff_version', 'error'] + METRIC_COLUMNS
+
+
+def stored_key(tariff_version, inputs):
+    # Same normalization as the in-memory cache, hashed so it fits an index
+    text = json.dumps([tariff_version, normalize(inputs)], default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def flatten_inputs(inputs):
+    # One level of scenario fields, with water/sewer parameters prefixed as in cli.py CSV rows
+    flat = {k: inputs.get(k) for k in SCENARIO_KEYS}
+    flat.update({'water_' + k: inputs['water_params'].get(k) for k in WATER_PARAM_KEYS})
+    flat.update({'sewer_' + k: inputs['sewer_params'].get(k) for k in SEWER_PARAM_KEYS})
+    return flat
+
+
+class ScenarioStore:
+    # Saved scenario inputs and results in a local SQLite file. One row per
+    # project and distinct scenario, so re-running the same inputs finds the
+    # stored result instead of recomputing it. A single connection is shared
+    # by all threads behind a lock, like ResultCache.
+
+    def __init__(self, path=None):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(f"The scenario store needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or later; "
+                               f"this Python uses SQLite {sqlite3.sqlite_version}")
+        self.path = path or os.environ.get(STORE_PATH_ENV) or DEFAULT_STORE_PATH
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            if self.path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def save(self, inputs, result, tariff_version, project="Default", created_at=None):
+        # Returns the row id; saving a scenario already stored for the project
+        # replaces its result and timestamp
+        return self.save_many([(inputs, result)], tariff_version, project, created_at)[0]
+
+    def save_many(self, runs, tariff_version, project="Default", created_at=None):
+        created_at = (created_at or datetime.now()).isoformat(timespec='seconds')
+        rows = []
+        for inputs, result in runs:
+            metrics = [result.get(name) for name in METRIC_COLUMNS]
+            rows.append((
+                project, created_at, tariff_version, stored_key(tariff_version, inputs),
+                json.dumps(inputs), json.dumps(result), result.get('error'),
+                *[float(m) if m is not None and math.isfinite(m) else None for m in metrics]
+            ))
+        columns = ['project', 'created_at', 'tariff_version', 'scenario_key', 'inputs', 'result', 'error'] + METRIC_COLUMNS
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns[1:] if c != 'scenario_key')
+        sql = (f"INSERT INTO scenarios ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+               f"ON CONFLICT (scenario_key, project) DO UPDATE SET {updates}")
+        # The id is looked up again rather than taken from RETURNING, which needs SQLite 3.35
+        ids = []
+        with self._lock, self._connection:
+            for row in rows:
+                self._connection.execute(sql, row)
+                ids.append(self._connection.execute(
+                    "SELECT id FROM scenarios WHERE scenario_key = ? AND project = ?", (row[3], row[0])
+                ).fetchone()[0])
+        return ids
+
+    def _scenario(self, row):
+        if row is None:
+            return None
+        scenario = {c: row[c] for c in LIST_COLUMNS}
+        scenario['inputs'] = json.loads(row['inputs'])
+        scenario['result'] = json.loads(row['result'])
+        return scenario
+
+    def load(self, scenario_id):
+        # A saved scenario with its inputs and stored result; nothing is recomputed
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM scenarios WHERE id = ?", (scenario_id,)).fetchone()
+        return self._scenario(row)
+
+    def find(self, inputs, tariff_version, project="Default"):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM scenarios WHERE scenario_key = ? AND project = ?",
+                (stored_key(tariff_version, inputs), project)
+            ).fetchone()
+        return self._scenario(row)
+
+    def get_or_compute(self, inputs, tariff_version, compute, project="Default"):
+        # Stored result for these inputs, or compute() saved for next time
+        stored = self.find(inputs, tariff_version, project)
+        if stored is not None:
+            return stored['result']
+        result = compute()
+        self.save(inputs, result, tariff_version, project)
+        return result
+
+    def list(self, project=None, since=None, until=None, feasible=None, order_by='created_at', descending=True, limit=100, offset=0, **ranges):
+        # Summary rows (no inputs or results) of saved scenarios. `since` and
+        # `until` bound the save time; keyword arguments named after
+        # METRIC_COLUMNS take a (low, high) pair, either end may be None.
+        if order_by not in LIST_COLUMNS:
+            raise ValueError(f"Cannot order by {order_by}; choose one of {', '.join(LIST_COLUMNS)}")
+        conditions, params = [], []
+        if project is not None:
+            conditions.append("project = ?")
+            params.append(project)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since.isoformat(timespec='seconds') if isinstance(since, datetime) else since)
+        if until is not None:
+            conditions.append("created_at <= ?")
+            params.append(until.isoformat(timespec='seconds') if isinstance(until, datetime) else until)
+        if feasible is not None:
+            conditions.append("error IS NULL" if feasible else "error IS NOT NULL")
+        for name, (low, high) in ranges.items():
+            if name not in METRIC_COLUMNS:
+                raise ValueError(f"Cannot filter on {name}; choose one of {', '.join(METRIC_COLUMNS)}")
+            if low is not None:
+                conditions.append(f"{name} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{name} <= ?")
+                params.append(high)
+        sql = f"SELECT {', '.join(LIST_COLUMNS)} FROM scenarios"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}, id {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._connection.execute(sql, params + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def projects(self):
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT project FROM scenarios ORDER BY project")]
+
+    def delete(self, scenario_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM scenarios WHERE id = ?", (scenario_id,))
+
+    def diff(self, first_id, second_id):
+        # Inputs and result fields that differ between two saved scenarios
+        first, second = self.load(first_id), self.load(second_id)
+        missing = [str(i) for i, s in ((first_id, first), (second_id, second)) if s is None]
+        if missing:
+            raise KeyError(f"No saved scenario with id {', '.join(missing)}")
+        return diff_scenarios(first, second)
+
+
+def diff_scenarios(first, second):
+    rows = []
+    for section, a, b in (('input', flatten_inputs(first['inputs']), flatten_inputs(second['inputs'])),
+                          ('result', first['result'], second['result'])):
+        for field in list(a) + [k for k in b if k not in a]:
+            old, new = a.get(field), b.get(field)
+            if old == new:
+                continue
+            numeric = isinstance(old, (int, float)) and isinstance(new, (int, float))
+            rows.append({
+                'section': section,
+                'field': field,
+                'first': old,
+                'second': new,
+                'change': new - old if numeric else None,
+                'change_percent': 100 * (new - old) / old if numeric and old else None
+            })
+    return rows
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def open_store(path=None):
+    # One shared ScenarioStore per file for the whole process
+    path = path or os.environ.get(STORE_PATH_ENV) or DEFAULT_STORE_PATH
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = ScenarioStore(path)
+        return _STORES[path]
@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+from batch import batch_row, calculate_break_even_batch
+from calculations import SEWER_PARAM_KEYS, WATER_PARAM_KEYS, calculate_break_even
+
+WATER_PARAMS = {'min_length': 2, 'max_length': 12, 'pipe_cost_25': 10, 'pipe_cost_32': 12, 'meter_cost_25': 300,
+                'meter_cost_32': 400, 'asphalt_cost': 30, 'bedding_cost': 20}
+SEWER_PARAMS = {'min_length': 3, 'max_length': 15, 'pipe_cost': 40, 'asphalt_cost': 50, 'bedding_cost': 50}
+
+
+def random_scenarios(rows, seed=0):
+    # A mix of feasible and infeasible scenarios, half by rate and half by duration
+    rng = np.random.default_rng(seed)
+    scenarios = []
+    for i in range(rows):
+        water = {k: float(v * rng.uniform(0.5, 1.5)) for k, v in WATER_PARAMS.items()}
+        sewer = {k: float(v * rng.uniform(0.5, 1.5)) for k, v in SEWER_PARAMS.items()}
+        water['max_length'] = max(water['max_length'], water['min_length'])
+        sewer['max_length'] = max(sewer['max_length'], sewer['min_length'])
+        scenario = {
+            'current_expenses': float(rng.uniform(1e6, 5e6)),
+            'invoices_received': float(rng.uniform(0, 1e6)),
+            'store_stock_value': float(rng.uniform(0, 1e6)),
+            'water_params': water,
+            'sewer_params': sewer,
+            'monthly_direct_cost': float(rng.uniform(0, 2e5)),
+            'monthly_indirect_cost': float(rng.uniform(0, 1e5)),
+            'prob_water': float(rng.uniform(0, 100)),
+            'prob_25mm': float(rng.uniform(0, 100)),
+            'prob_mainline': float(rng.choice([0, 0.5, 1])),
+        }
+        if i % 2:
+            scenario['duration_months'] = float(rng.uniform(1, 60))
+        else:
+            scenario['connection_rate'] = float(rng.uniform(1, 100))
+        scenarios.append(scenario)
+    return scenarios
+
+
+def run_batch(scenarios):
+    def column(name):
+        return np.array([s.get(name, np.nan) for s in scenarios], dtype=float)
+
+    return calculate_break_even_batch(
+        column('current_expenses'), column('invoices_received'), column('store_stock_value'),
+        {k: np.array([s['water_params'][k] for s in scenarios]) for k in WATER_PARAM_KEYS},
+        {k: np.array([s['sewer_params'][k] for s in scenarios]) for k in SEWER_PARAM_KEYS},
+        column('monthly_direct_cost'), column('monthly_indirect_cost'),
+        column('connection_rate'), column('duration_months'),
+        column('prob_water'), column('prob_25mm'), column('prob_mainline')
+    )
+
+
+def test_batch_matches_calculate_break_even():
+    scenarios = random_scenarios(400)
+    result = run_batch(scenarios)
+    feasible = 0
+    for i, scenario in enumerate(scenarios):
+        expected = calculate_break_even(**scenario)
+        row = batch_row(result, i)
+        assert ('error' in row) == ('error' in expected), (i, row, expected)
+        if 'error' in expected:
+            continue
+        feasible += 1
+        for key, value in expected.items():
+            if isinstance(value, str):
+                assert row[key] == value, (i, key)
+            else:
+                assert row[key] == pytest.approx(value, rel=1e-9, abs=1e-6), (i, key)
+    # Both branches are exercised
+    assert 0 < feasible < len(scenarios)
+
+
+def test_batch_flags_rows_with_neither_rate_nor_duration():
+    scenario = random_scenarios(1)[0]
+    del scenario['connection_rate']
+    result = run_batch([scenario])
+    assert batch_row(result, 0)['error'] == calculate_break_even(**scenario)['error']
+    assert math.isnan(result['break_even_months'][0])
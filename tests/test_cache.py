@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+
+from cache import ResultCache, approximate_size, scenario_key
+
+
+def test_keys_ignore_order_and_number_spelling():
+    assert scenario_key({'a': 50, 'b': [1, 2]}, rate=3) == scenario_key({'b': (1.0, 2.0), 'a': 50.0}, rate=3.0)
+    assert scenario_key({'a': 1}) != scenario_key({'a': 2})
+
+
+def test_evicts_least_recently_used_by_count():
+    cache = ResultCache(maxsize=2)
+    for key in 'abc':
+        cache.get_or_compute(key, lambda: key)
+        cache.get_or_compute('a', lambda: 'recomputed')
+    assert cache.get_or_compute('a', lambda: 'recomputed') == 'a'
+    assert cache.get_or_compute('b', lambda: 'recomputed') == 'recomputed'
+    assert cache.stats()['entries'] == 2
+
+
+def test_evicts_by_size_and_skips_oversize_values():
+    cache = ResultCache(maxbytes=10_000)
+    for key in range(5):
+        cache.get_or_compute(key, lambda: np.zeros(500))
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == (2, 8000)
+    big = cache.get_or_compute('big', lambda: np.zeros(5000))
+    assert big.size == 5000 and cache.stats()['entries'] == 2
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+
+
+def test_approximate_size_counts_nested_arrays():
+    assert approximate_size({'x': np.zeros(1000), 'y': [np.zeros(10)]}) > 8080
+
+
+def test_concurrent_misses_compute_and_agree():
+    cache = ResultCache()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', lambda: 42))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8 and cache.stats()['entries'] == 1
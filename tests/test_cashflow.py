@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from cashflow import CashFlowSchedule, build_schedule
+
+FIELDS = ('cumulative_connections', 'cumulative_revenue', 'cumulative_expenses', 'net')
+
+
+def make_schedule(rates, direct, indirect):
+    return CashFlowSchedule(2e6, 9000, 3000, rates, direct, indirect)
+
+
+def assert_same(schedule, expected):
+    for field in FIELDS:
+        np.testing.assert_allclose(getattr(schedule, field), getattr(expected, field), rtol=1e-12, atol=1e-6)
+    incremental, full = schedule.break_even(), expected.break_even()
+    assert incremental.keys() == full.keys()
+    for key, value in full.items():
+        if isinstance(value, str):
+            assert incremental[key] == value
+        else:
+            assert incremental[key] == pytest.approx(value, rel=1e-12, abs=1e-6)
+
+
+def test_update_matches_full_recompute():
+    rng = np.random.default_rng(1)
+    rates, direct, indirect = build_schedule(120, 40, 1e5, 5e4, ramp_up_months=6, slow_months=(7, 8))
+    schedule = make_schedule(rates, direct, indirect)
+    for _ in range(200):
+        month = int(rng.integers(0, len(schedule)))
+        span = int(rng.integers(1, len(schedule) - month + 1))
+        changes = {}
+        for name in ('connection_rate', 'direct_cost', 'indirect_cost'):
+            if rng.random() < 0.5:
+                changes[name] = rng.uniform(0, 80 if name == 'connection_rate' else 2e5, span)
+        if not changes:
+            changes['connection_rate'] = float(rng.uniform(0, 80))
+        schedule.update(month, **changes)
+        assert_same(schedule, make_schedule(schedule.connection_rates, schedule.direct_costs, schedule.indirect_costs))
+
+
+def test_update_can_remove_and_restore_break_even():
+    rates, direct, indirect = build_schedule(36, 40, 1e5, 5e4)
+    schedule = make_schedule(rates, direct, indirect)
+    assert 'error' not in schedule.break_even()
+    schedule.update(0, connection_rate=np.zeros(36))
+    assert 'error' in schedule.break_even()
+    schedule.update(10, connection_rate=np.full(26, 40.0))
+    assert_same(schedule, make_schedule(schedule.connection_rates, direct, indirect))
+
+
+def test_update_rejects_months_outside_the_schedule():
+    schedule = make_schedule(*build_schedule(12, 40, 1e5, 5e4))
+    with pytest.raises(ValueError):
+        schedule.update(10, connection_rate=[1, 2, 3])
+    with pytest.raises(ValueError):
+        schedule.update(0, direct_cost=-1)
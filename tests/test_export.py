@@ -0,0 +1,55 @@
+import importlib.util
+import io
+import math
+
+import pytest
+
+from calculations import evaluate_record
+from cli import RESULT_FIELDS
+from export import available_formats, record_chunks, result_schema, write_parquet
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+SCENARIO = {
+    'current_expenses': 3e6, 'invoices_received': 2e5, 'store_stock_value': 1e5,
+    'monthly_direct_cost': 1e5, 'monthly_indirect_cost': 5e4, 'connection_rate': 40, 'prob_mainline': 0.5,
+    'water_params': {'min_length': 2, 'max_length': 12, 'pipe_cost_25': 10, 'pipe_cost_32': 12, 'meter_cost_25': 300,
+                     'meter_cost_32': 400, 'asphalt_cost': 30, 'bedding_cost': 20},
+    'sewer_params': {'min_length': 3, 'max_length': 15, 'pipe_cost': 40, 'asphalt_cost': 50, 'bedding_cost': 50},
+}
+
+
+def records(rows, failing):
+    for i in range(rows):
+        record = dict(SCENARIO, id=str(i))
+        if i in failing:
+            record['connection_rate'] = -1
+        yield evaluate_record(record)
+
+
+def test_parquet_export_with_errors_only_in_later_chunks():
+    failing = {7, 9}
+    target = io.BytesIO()
+    rows = write_parquet(record_chunks(records(10, failing), chunk_rows=3, columns=RESULT_FIELDS), target,
+                         schema=result_schema(RESULT_FIELDS))
+    assert rows == 10
+    target.seek(0)
+    parquet = pq.ParquetFile(target)
+    assert parquet.metadata.num_row_groups == 4
+    table = parquet.read().to_pydict()
+    assert table['id'] == [str(i) for i in range(10)]
+    for i in range(10):
+        if i in failing:
+            assert table['error'][i] == "Connection rate must be positive"
+            assert table['break_even_months'][i] is None or math.isnan(table['break_even_months'][i])
+        else:
+            assert table['error'][i] is None
+            assert table['break_even_months'][i] > 0
+            assert table['break_even_months'][i] == pytest.approx(table['break_even_months'][0])
+            assert table['break_even_date'][i] == table['break_even_date'][0]
+
+
+def test_formats_without_their_package_are_not_offered(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: None if name == 'openpyxl' else find_spec(name))
+    assert available_formats() == ['csv', 'parquet']
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, keep_finished=2)
+    yield manager
+    manager.shutdown()
+
+
+def wait(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, f"job {job.key} still {job.status}"
+        time.sleep(0.005)
+    return job
+
+
+def gated(gate, steps=3):
+    # A job that reports `steps` chunks, waiting for `gate` before each one
+    def run(progress):
+        for i in range(steps):
+            gate.wait(5)
+            progress(i + 1, steps, partial=i + 1)
+        return "result"
+    return run
+
+
+def test_progress_and_result(manager):
+    gate = threading.Event()
+    job = manager.submit('a', gated(gate))
+    assert job.progress in (None, 0)
+    gate.set()
+    wait(job)
+    assert (job.status, job.result, job.partial, job.progress) == ('done', "result", 3, 1.0)
+
+
+def test_same_key_shares_one_job_until_nobody_wants_it(manager):
+    gate = threading.Event()
+    job = manager.submit('a', gated(gate))
+    assert manager.submit('a', gated(gate)) is job
+    assert job.subscribers == 2
+    manager.release(job)
+    assert not job._cancelled.is_set()
+    manager.release(job)
+    gate.set()
+    assert wait(job).status == 'cancelled'
+
+
+def test_jobs_queue_behind_the_workers(manager):
+    gate = threading.Event()
+    running = manager.submit('a', gated(gate))
+    queued = [manager.submit(key, gated(gate)) for key in ('b', 'c')]
+    assert [manager.queue_position(job) for job in queued] == [1, 2]
+    assert manager.stats()['queued'] == 2
+    manager.cancel(queued[0])
+    assert queued[0].status == 'cancelled'
+    gate.set()
+    assert wait(running).status == wait(queued[1]).status == 'done'
+    assert queued[0].started_at is None
+
+
+def test_failed_and_cancelling_jobs_are_started_again(manager):
+    def fail(progress):
+        raise RuntimeError("boom")
+
+    failed = wait(manager.submit('a', fail))
+    assert failed.status == 'failed' and failed.error == "RuntimeError: boom" and "boom" in failed.traceback
+    gate = threading.Event()
+    retried = manager.submit('a', gated(gate))
+    assert retried is not failed
+    manager.cancel(retried)
+    # Still running until its next progress report, but no longer reused
+    fresh = manager.submit('a', gated(gate))
+    assert fresh is not retried
+    gate.set()
+    assert wait(retried).status == 'cancelled'
+    assert wait(fresh).status == 'done'
+
+
+def test_old_finished_jobs_are_forgotten(manager):
+    for key in 'abcd':
+        wait(manager.submit(key, lambda progress: key))
+    manager.submit('e', lambda progress: 'e')
+    assert manager.get('a') is None and manager.get('b') is None
+    assert manager.get('d').result == 'd'
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculations import calculate_break_even
+from ledger import calculation_inputs, compare_to_forecast, ingest_ledger
+from rates import sewer_connection_value, water_connection_value
+from test_records import SCENARIO
+
+
+def make_ledger(rows=1000, seed=3):
+    rng = np.random.default_rng(seed)
+    ledger = pd.DataFrame({
+        'connection_type': rng.choice(['water', 'Sewer ', 'WATER', 'gas'], rows, p=[0.45, 0.4, 0.1, 0.05]),
+        'size': rng.choice([25, 32, 40], rows, p=[0.6, 0.35, 0.05]),
+        'sewer_type': rng.choice(['mainline', 'manhole', 'lateral'], rows, p=[0.5, 0.45, 0.05]),
+        'length': np.round(rng.gamma(3, 3, rows), 2),
+        'cost': np.round(rng.uniform(1000, 6000, rows), 2)
+    })
+    ledger.loc[::97, 'length'] = -1
+    ledger.loc[::89, 'cost'] = np.nan
+    return ledger
+
+
+def brute_force(ledger):
+    kind = ledger['connection_type'].str.strip().str.lower()
+    sewer_type = ledger['sewer_type'].str.strip().str.lower()
+    water = (kind == 'water') & ledger['size'].isin([25, 32])
+    sewer = (kind == 'sewer') & sewer_type.isin(['mainline', 'manhole'])
+    valid = (ledger['length'] >= 0) & ledger['cost'].notna()
+    value = sum(water_connection_value(s, l) for s, l in ledger.loc[water & valid, ['size', 'length']].itertuples(index=False))
+    value += sum(sewer_connection_value(t, l) for t, l in zip(sewer_type[sewer & valid], ledger.loc[sewer & valid, 'length']))
+    return {
+        'water_connections': int((water & valid).sum()),
+        'sewer_connections': int((sewer & valid).sum()),
+        'unpriced_rows': int(((kind == 'water') & ~ledger['size'].isin([25, 32])).sum() + ((kind == 'sewer') & ~sewer).sum()),
+        'skipped_rows': int(len(ledger) - ((water | sewer) & valid).sum()),
+        'total_value': value,
+        'total_cost': ledger.loc[(water | sewer) & valid, 'cost'].sum(),
+        'water_mean_length': ledger.loc[water & valid, 'length'].mean(),
+    }
+
+
+@pytest.mark.parametrize('chunk_size', [37, 100_000])
+def test_summary_matches_row_by_row_pricing(tmp_path, chunk_size):
+    ledger = make_ledger()
+    path = tmp_path / "ledger.csv"
+    ledger.to_csv(path, index=False)
+    summary = ingest_ledger(str(path), chunk_size=chunk_size)
+    expected = brute_force(ledger)
+    assert summary['rows'] == len(ledger)
+    for key in ('water_connections', 'sewer_connections', 'unpriced_rows', 'skipped_rows'):
+        assert summary[key] == expected[key], key
+    assert summary['total_value'] == pytest.approx(expected['total_value'])
+    assert summary['total_cost'] == pytest.approx(expected['total_cost'])
+    assert summary['water_length']['mean'] == pytest.approx(expected['water_mean_length'])
+    assert summary['water_length']['histogram'].sum() == expected['water_connections']
+
+
+def test_parquet_ledger_matches_csv(tmp_path):
+    pytest.importorskip('pyarrow')
+    ledger = make_ledger(300)
+    ledger.to_csv(tmp_path / "ledger.csv", index=False)
+    ledger.to_parquet(tmp_path / "ledger.parquet")
+    from_csv = ingest_ledger(str(tmp_path / "ledger.csv"), chunk_size=50)
+    from_parquet = ingest_ledger(str(tmp_path / "ledger.parquet"), chunk_size=50)
+    for key in ('connections', 'unpriced_rows', 'total_value', 'total_cost'):
+        assert from_parquet[key] == pytest.approx(from_csv[key])
+
+
+def test_actuals_feed_back_into_the_forecast(tmp_path):
+    path = tmp_path / "ledger.csv"
+    make_ledger().to_csv(path, index=False)
+    summary = ingest_ledger(str(path), SCENARIO['water_params'], SCENARIO['sewer_params'])
+    inputs = calculation_inputs(summary, SCENARIO['water_params'], SCENARIO['sewer_params'])
+    assert 0 < inputs['prob_mainline'] < 1
+    assert inputs['water_params']['min_length'] <= summary['water_length']['mean'] <= inputs['water_params']['max_length']
+    result = calculate_break_even(**{**SCENARIO, **inputs})
+    assert 'error' not in result
+    comparison = compare_to_forecast(summary, result, inputs['prob_water'], inputs['prob_25mm'], inputs['prob_mainline'])
+    mix = {row['measure']: row for row in comparison}
+    assert mix['Mainline sewer connections (%)']['variance'] == pytest.approx(0)
+    assert summary['avg_forecast_cost_per_connection'] > 0
+
+
+def test_missing_columns(tmp_path):
+    path = tmp_path / "ledger.csv"
+    pd.DataFrame({'connection_type': ['water'], 'size': [25]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="length"):
+        ingest_ledger(str(path))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from lengths import LengthDistribution, expected_sewer_value, expected_water_value
+from rates import sewer_connection_value, water_connection_value
+
+
+def test_surveyed_lengths_match_brute_force():
+    rng = np.random.default_rng(2)
+    lengths = np.round(rng.gamma(3, 4, 5000), 1)
+    distribution = LengthDistribution.from_lengths(lengths)
+    assert distribution.mean == pytest.approx(lengths.mean())
+    # Thresholds between, below, above and exactly at surveyed lengths
+    for threshold in [0, 0.05, 4, lengths[0], lengths[1], 12.35, 30, lengths.max(), lengths.max() + 1]:
+        below = lengths[lengths <= threshold]
+        above = lengths[lengths > threshold]
+        count_below, total_below, count_above, total_above = distribution.split(threshold)
+        assert (count_below, count_above) == (below.size, above.size)
+        assert total_below == pytest.approx(below.sum(), abs=1e-6)
+        assert total_above == pytest.approx(above.sum(), abs=1e-6)
+        assert distribution.expected_excess(threshold) == pytest.approx(np.maximum(lengths - threshold, 0).mean(), abs=1e-9)
+
+
+def test_weighted_lengths_match_repeated_lengths():
+    weighted = LengthDistribution.from_lengths([3, 8, 15], counts=[4, 1, 2])
+    repeated = LengthDistribution.from_lengths([3, 3, 3, 3, 8, 15, 15])
+    for threshold in (0, 3, 5, 8, 20):
+        assert weighted.split(threshold) == pytest.approx(repeated.split(threshold))
+
+
+def test_histogram_matches_fine_sample():
+    edges = np.array([0, 5, 10, 12, 20, 40])
+    counts = np.array([10, 30, 5, 20, 3])
+    distribution = LengthDistribution.from_histogram(edges, counts)
+    # Lengths spread evenly within each bin, as the distribution assumes
+    per_unit = 2000
+    sample = np.concatenate([low + (np.arange(count * per_unit) + 0.5) / (count * per_unit) * (high - low)
+                             for low, high, count in zip(edges[:-1], edges[1:], counts)])
+    assert distribution.mean == pytest.approx(sample.mean(), rel=1e-9)
+    for threshold in (0, 2.5, 5, 11, 13.7, 39, 45):
+        expected = np.maximum(sample - threshold, 0).mean()
+        assert distribution.expected_excess(threshold) == pytest.approx(expected, rel=1e-4, abs=1e-6)
+        assert distribution.share_above(threshold) == pytest.approx((sample > threshold).mean(), abs=1e-4)
+
+
+def test_expected_values_match_pricing_every_length():
+    lengths = np.array([1, 4, 6, 6, 9.5, 14, 22, 35])
+    distribution = LengthDistribution.from_lengths(lengths)
+    for size in (25, 32):
+        expected = np.mean([water_connection_value(size, length) for length in lengths])
+        assert expected_water_value(size, distribution) == pytest.approx(expected)
+    for type_ in ('mainline', 'manhole'):
+        expected = np.mean([sewer_connection_value(type_, length) for length in lengths])
+        assert expected_sewer_value(type_, distribution) == pytest.approx(expected)
+
+
+def test_rejects_overlapping_or_empty_bins():
+    with pytest.raises(ValueError):
+        LengthDistribution([0, 4], [5, 8], [1, 1])
+    with pytest.raises(ValueError):
+        LengthDistribution.from_lengths([])
@@ -0,0 +1,73 @@
+import io
+import json
+import math
+
+import numpy as np
+import pytest
+
+from calculations import calculate_break_even, connection_economics
+from cashflow import CashFlowSchedule, build_schedule, schedule_from_result
+from portfolio import evaluate_portfolio, load_projects, portfolio_summary
+from test_records import SCENARIO
+
+HORIZON = 120
+
+
+def projects():
+    return load_projects(io.StringIO("\n".join(json.dumps(p) for p in [
+        dict(SCENARIO, id='profitable'),
+        # Each connection costs more than it brings in, so it never breaks even
+        dict(SCENARIO, id='loss-making', connection_rate=2),
+        dict(SCENARIO, id='invalid', current_expenses=-1),
+    ])))
+
+
+def net_position(scenario):
+    result = calculate_break_even(**scenario)
+    schedule = schedule_from_result(result, *build_schedule(HORIZON, result['connection_rate'], scenario['monthly_direct_cost'],
+                                                            scenario['monthly_indirect_cost']))
+    return schedule.net
+
+
+def test_loss_making_projects_count_towards_the_combined_figures():
+    results = evaluate_portfolio(projects(), workers=1, horizon=HORIZON)
+    assert results['ok'].tolist() == [True, False, False]
+    assert results['in_timeline'].tolist() == [True, True, False]
+
+    # The loss-making project's cash flow, priced without the feasibility check
+    economics = connection_economics(**dict(SCENARIO, connection_rate=2))
+    losses = CashFlowSchedule(economics['net_current_expenses'], economics['avg_value_per_connection'],
+                              economics['avg_material_cost_per_connection'], *build_schedule(
+                                  HORIZON, 2, SCENARIO['monthly_direct_cost'], SCENARIO['monthly_indirect_cost']))
+    assert (np.diff(losses.net) < 0).all()
+    timeline = results['timelines']['base']
+    np.testing.assert_allclose(timeline, net_position(SCENARIO) + losses.net)
+    assert results['max_cash_exposure'][1] == pytest.approx(-losses.net[-1])
+
+    summary, = portfolio_summary(results)
+    assert (summary['projects'], summary['infeasible_projects'], summary['excluded_projects']) == (3, 2, 1)
+    assert summary['combined_cash_exposure'] == pytest.approx(-timeline.min())
+    assert summary['combined_break_even_date'] is None
+    assert math.isinf(summary['latest_project_break_even_months'])
+
+
+def test_profitable_portfolio_breaks_even():
+    results = evaluate_portfolio(projects()[:1], workers=1, horizon=HORIZON)
+    np.testing.assert_allclose(results['timelines']['base'], net_position(SCENARIO))
+    summary, = portfolio_summary(results)
+    assert summary['combined_break_even_date'] is not None
+    assert summary['latest_project_break_even_months'] == pytest.approx(results['cash_flow_break_even_months'][0])
+
+
+def test_process_pool_matches_a_single_process():
+    records = projects() * 4
+    single = evaluate_portfolio(records, workers=1, chunk_size=2, horizon=HORIZON)
+    pooled = evaluate_portfolio(records, workers=2, chunk_size=2, horizon=HORIZON)
+    for name in ('max_cash_exposure', 'break_even_months', 'in_timeline'):
+        np.testing.assert_array_equal(single[name], pooled[name])
+    np.testing.assert_allclose(single['timelines']['base'], pooled['timelines']['base'])
+
+
+def test_unreadable_project_is_reported():
+    with pytest.raises(ValueError, match="Project 1"):
+        load_projects(io.StringIO('{"id": 1}\n{bad json\n'))
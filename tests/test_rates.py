@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+import rates
+from rates import (load_rate_table, sewer_connection_value, sewer_type_code, water_connection_material_cost,
+                   water_connection_value, water_size_code)
+
+LENGTHS = [0.0, 3.0, 5.0, 5.5, 12.0, 40.0]
+
+
+def test_tariff_prices():
+    # 2200 + 750 + 170 up to the included 5 m, then 190 per meter
+    assert water_connection_value(25, 4) == 3120
+    assert water_connection_value(25, 7) == 3120 + 2 * 190
+    assert sewer_connection_value('manhole', 5) == 5800
+    assert sewer_connection_value('mainline', 6) == 6300 + 360
+
+
+@pytest.mark.parametrize('size', [25, 32])
+def test_array_pricing_matches_scalar_pricing(size):
+    values = water_connection_value(np.full(len(LENGTHS), size), LENGTHS)
+    np.testing.assert_array_equal(values, [water_connection_value(size, length) for length in LENGTHS])
+
+
+@pytest.mark.parametrize('type_', ['mainline', 'manhole'])
+def test_sewer_codes_and_names_price_alike(type_):
+    by_name = sewer_connection_value(np.array([type_] * len(LENGTHS)), LENGTHS)
+    by_code = sewer_connection_value(np.full(len(LENGTHS), sewer_type_code(type_)), LENGTHS)
+    np.testing.assert_array_equal(by_name, [sewer_connection_value(type_, length) for length in LENGTHS])
+    np.testing.assert_array_equal(by_code, by_name)
+
+
+def test_unknown_sizes_and_types_are_not_free():
+    with pytest.raises(ValueError, match="40 mm"):
+        water_connection_value(40, 10)
+    with pytest.raises(ValueError, match="lateral"):
+        sewer_connection_value('lateral', 10)
+    assert np.isnan(water_connection_value([25, 40], [10, 10])).tolist() == [False, True]
+    assert np.isnan(sewer_connection_value(['manhole', 'lateral'], [10, 10])).tolist() == [False, True]
+    assert np.isnan(sewer_connection_value(np.array([0, 7, -1]), [10, 10, 10])).tolist() == [False, True, True]
+    assert water_size_code([25, 32, 30, 100]).tolist() == [0, 1, 2, 2]
+
+
+def test_material_cost_is_linear_in_length():
+    cost = [water_connection_material_cost(25, length, 10, 300, 30, 20) for length in (2, 4, 6)]
+    assert cost[2] - cost[1] == pytest.approx(cost[1] - cost[0])
+    np.testing.assert_allclose(water_connection_material_cost(25, np.array([2, 4, 6]), 10, 300, 30, 20), cost)
+
+
+def test_custom_tariff_file(tmp_path):
+    with open(rates.DEFAULT_TARIFF_PATH) as f:
+        tariff = json.load(f)
+    tariff['version'] = 'test'
+    tariff['water']['25']['extra_length_rate'] = 1000
+    path = tmp_path / "tariffs.json"
+    path.write_text(json.dumps(tariff))
+    table = load_rate_table(str(path))
+    assert water_connection_value(25, 6, rates=table) == 3120 + 1000
+    assert water_connection_value(25, 6) == 3120 + 190
+    del tariff['version']
+    path.write_text(json.dumps(tariff))
+    with pytest.raises(ValueError, match="no version"):
+        load_rate_table(str(path))
@@ -0,0 +1,63 @@
+import io
+import json
+
+from calculations import evaluate_record, record_error
+from records import InvalidRecord, read_json_records, read_records
+
+SCENARIO = {
+    'current_expenses': 3e6, 'invoices_received': 2e5, 'store_stock_value': 1e5,
+    'monthly_direct_cost': 1e5, 'monthly_indirect_cost': 5e4, 'connection_rate': 40, 'prob_mainline': 0.5,
+    'water_params': {'min_length': 2, 'max_length': 12, 'pipe_cost_25': 10, 'pipe_cost_32': 12, 'meter_cost_25': 300,
+                     'meter_cost_32': 400, 'asphalt_cost': 30, 'bedding_cost': 20},
+    'sewer_params': {'min_length': 3, 'max_length': 15, 'pipe_cost': 40, 'asphalt_cost': 50, 'bedding_cost': 50},
+}
+
+
+def read(text):
+    return list(read_json_records(io.StringIO(text)))
+
+
+def test_bad_line_does_not_stop_later_records():
+    records = read('{"id": 1}\n{bad json\n{"id": 2}\n')
+    assert records[0] == {'id': 1} and records[2] == {'id': 2}
+    assert isinstance(records[1], InvalidRecord)
+    assert records[1].error.startswith("Invalid JSON on line 2")
+
+
+def test_array_elements_are_yielded_as_they_arrive():
+    def lines():
+        yield '[{"id": 1},\n'
+        yield '{"id": 2},\n'
+        raise AssertionError("read past the second element")
+
+    records = read_json_records(lines())
+    assert next(records) == {'id': 1}
+    assert next(records) == {'id': 2}
+
+
+def test_pretty_printed_values_and_arrays():
+    text = json.dumps([SCENARIO, SCENARIO], indent=2) + "\n" + json.dumps(SCENARIO, indent=2)
+    assert read(text) == [SCENARIO] * 3
+
+
+def test_truncated_input_is_reported():
+    records = read('[{"id": 1},\n{"id": 2')
+    assert records[0] == {'id': 1}
+    assert [type(r) for r in records[1:]] == [InvalidRecord, InvalidRecord]
+
+
+def test_read_records_detects_csv():
+    records = list(read_records(io.StringIO("\nid,current_expenses\na,1\n")))
+    assert records == [{'id': 'a', 'current_expenses': '1'}]
+
+
+def test_unreadable_records_are_told_apart_from_infeasible_ones():
+    assert record_error(SCENARIO) is None
+    assert record_error(dict(SCENARIO, connection_rate=0.01)) is None
+    assert 'error' in evaluate_record(dict(SCENARIO, connection_rate=0.01))
+    assert record_error({'id': 1}).startswith("Missing scenario fields")
+    assert record_error(dict(SCENARIO, current_expenses="abc")) == "current_expenses must be a number, not 'abc'"
+    assert record_error(dict(SCENARIO, connection_rate=[1, 2])) == "connection_rate must be a number, not [1, 2]"
+    assert record_error([SCENARIO]) == "A scenario must be an object"
+    assert evaluate_record(InvalidRecord("Invalid JSON on line 3: x")) == {'error': "Invalid JSON on line 3: x"}
+    assert evaluate_record(dict(SCENARIO, id='a'))['id'] == 'a'
@@ -0,0 +1,69 @@
+import math
+
+import pytest
+
+from calculations import calculate_break_even
+from sensitivity import sensitivity_analysis
+
+SCENARIO = {
+    'current_expenses': 3e6, 'invoices_received': 0.0, 'store_stock_value': 0.0,
+    'water_params': {'min_length': 2.0, 'max_length': 12.0, 'pipe_cost_25': 10.0, 'pipe_cost_32': 12.0,
+                     'meter_cost_25': 300.0, 'meter_cost_32': 400.0, 'asphalt_cost': 30.0, 'bedding_cost': 20.0},
+    'sewer_params': {'min_length': 2.0, 'max_length': 12.0, 'pipe_cost': 40.0, 'asphalt_cost': 30.0, 'bedding_cost': 20.0},
+    'monthly_direct_cost': 5e4, 'monthly_indirect_cost': 2e4, 'connection_rate': 50.0,
+    'prob_water': 50.0, 'prob_25mm': 50.0, 'prob_mainline': 0.5
+}
+
+
+def rows_by_input(analysis):
+    return {row['input']: row for row in analysis['rows']}
+
+
+def test_cases_match_calculate_break_even():
+    analysis = sensitivity_analysis(SCENARIO)
+    assert analysis['base'] == pytest.approx(calculate_break_even(**SCENARIO)['break_even_months'])
+    row = rows_by_input(analysis)['monthly_direct_cost']
+    assert (row['low_value'], row['high_value']) == pytest.approx((4.5e4, 5.5e4))
+    for value, months in ((row['low_value'], row['low']), (row['high_value'], row['high'])):
+        assert months == pytest.approx(calculate_break_even(**dict(SCENARIO, monthly_direct_cost=value))['break_even_months'])
+    swings = [row['swing'] for row in analysis['rows']]
+    assert swings == sorted(swings, reverse=True)
+
+
+@pytest.mark.parametrize('name, value, low, high', [
+    ('prob_mainline', 0.0, 0.0, 0.1),
+    ('prob_mainline', 1.0, 0.9, 1.0),
+    ('prob_water', 100.0, 90.0, 100.0),
+    ('prob_25mm', 100.0, 90.0, 100.0),
+    ('prob_25mm', 0.0, 0.0, 10.0),
+])
+def test_inputs_at_a_bound_move_one_way(name, value, low, high):
+    analysis = sensitivity_analysis(dict(SCENARIO, **{name: value}))
+    assert analysis['infeasible'] == []
+    row = rows_by_input(analysis)[name]
+    assert (row['low_value'], row['high_value']) == pytest.approx((low, high))
+    if value == 0:
+        assert math.isnan(row['elasticity'])
+    else:
+        # One-sided difference over the part of the range that was moved
+        relative_change = (high - low) / value
+        assert row['elasticity'] == pytest.approx((row['high'] - row['low']) / analysis['base'] / relative_change)
+
+
+def test_zero_amounts_move_by_a_share_of_current_expenses():
+    row = rows_by_input(sensitivity_analysis(SCENARIO))['invoices_received']
+    assert (row['low_value'], row['high_value']) == (0.0, pytest.approx(3e5))
+    assert row['low'] > row['high']
+
+
+def test_infeasible_cases_are_listed_apart():
+    # At 34 connections/month the project barely pays its way; 10% fewer does not
+    analysis = sensitivity_analysis(dict(SCENARIO, connection_rate=34.0, monthly_direct_cost=1e5, monthly_indirect_cost=5e4))
+    infeasible = {row['input']: row for row in analysis['infeasible']}
+    assert 'connection_rate' in infeasible
+    assert infeasible['connection_rate']['error'].startswith("Low case:")
+    assert 'connection_rate' not in rows_by_input(analysis)
+
+
+def test_infeasible_base_scenario():
+    assert 'error' in sensitivity_analysis(dict(SCENARIO, invoices_received=4e6))
@@ -0,0 +1,60 @@
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from server import PooledHTTPServer
+from test_records import SCENARIO
+
+
+@pytest.fixture
+def port():
+    server = PooledHTTPServer(('127.0.0.1', 0), workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def post(port, payload):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.request('POST', '/break-even', body=json.dumps(payload))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_feasible_and_infeasible_scenarios_get_200(port):
+    status, result = post(port, SCENARIO)
+    assert status == 200 and 'break_even_months' in result
+    status, result = post(port, [SCENARIO, dict(SCENARIO, connection_rate=0.01)])
+    assert status == 200 and 'error' in result[1]
+
+
+@pytest.mark.parametrize('payload', [
+    {'current_expenses': 1},
+    dict(SCENARIO, current_expenses="abc"),
+    dict(SCENARIO, connection_rate=[1, 2]),
+    [SCENARIO, 5],
+    "scenario",
+])
+def test_malformed_scenarios_get_400(port, payload):
+    status, result = post(port, payload)
+    assert status == 400 and result['error']
+
+
+@pytest.mark.parametrize('length', ['abc', '-5'])
+def test_bad_content_length_gets_400(port, length):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as client:
+        client.sendall(f"POST /break-even HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+        assert client.recv(4096).startswith(b"HTTP/1.1 400")
+
+
+def test_keep_alive_connection_serves_several_requests(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    for _ in range(3):
+        connection.request('GET', '/health')
+        response = connection.getresponse()
+        assert response.status == 200 and json.loads(response.read())['status'] == 'ok'
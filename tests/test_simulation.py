@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+import pytest
+
+from simulation import percentiles, simulate_break_even
+from test_records import SCENARIO
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 1000, 1001])
+def test_percentiles_match_numpy_for_finite_samples(size):
+    samples = np.random.default_rng(size).random(size) * 100
+    q = (0, 10, 50, 90, 100)
+    np.testing.assert_allclose(percentiles(samples, q), np.percentile(samples, q))
+
+
+def test_percentiles_reaching_never_are_infinite():
+    samples = np.array([3.0, np.inf, 1.0, np.inf, 2.0])
+    np.testing.assert_allclose(percentiles(samples, (10, 50, 60, 100)), [1.4, 3.0, np.inf, np.inf])
+
+
+def test_simulation_reports_never_for_percentiles_that_do_not_break_even():
+    with np.errstate(all='raise'):
+        simulation = simulate_break_even(**SCENARIO, trials=1000, seed=1, max_connections=2300)
+    assert 0 < simulation['never_break_even'] < 500
+    assert math.isfinite(simulation['break_even_connections_p10'])
+    assert simulation['break_even_date_p10'] != "Never"
+    assert math.isinf(simulation['break_even_connections_p90'])
+    assert math.isinf(simulation['break_even_months_p90'])
+    assert simulation['break_even_date_p90'] == "Never"
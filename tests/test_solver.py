@@ -0,0 +1,47 @@
+import pytest
+
+from calculations import calculate_break_even
+from solver import goal_seek, scenario_mode
+from test_records import SCENARIO
+
+
+def test_highest_cost_that_meets_a_target_time():
+    solved = goal_seek(SCENARIO, 'monthly_indirect_cost', 48)
+    assert solved['direction'] == 'maximum'
+    assert solved['achieved'] == pytest.approx(48, abs=1e-4)
+    assert solved['achieved'] <= 48
+    again = calculate_break_even(**dict(SCENARIO, monthly_indirect_cost=solved['value']))
+    assert again['break_even_months'] == pytest.approx(solved['achieved'])
+
+
+def test_lowest_connection_rate_that_meets_a_target_time():
+    solved = goal_seek(SCENARIO, 'connection_rate', 36)
+    assert solved['direction'] == 'minimum'
+    assert solved['achieved'] == pytest.approx(36, abs=1e-4)
+    # Below the rate where each connection stops paying for itself, there is no break even
+    economics = calculate_break_even(**SCENARIO)
+    costs = SCENARIO['monthly_direct_cost'] + SCENARIO['monthly_indirect_cost']
+    lowest_rate = costs / (economics['avg_value_per_connection'] - economics['avg_material_cost_per_connection'])
+    assert solved['valid_range'][0] == pytest.approx(lowest_rate, rel=1e-5)
+
+
+def test_water_parameters_can_be_solved_for():
+    solved = goal_seek(SCENARIO, 'water_meter_cost_25', 60)
+    assert solved['achieved'] == pytest.approx(60, abs=1e-4)
+    assert solved['result']['break_even_months'] == solved['achieved']
+
+
+def test_duration_scenarios_solve_for_the_connection_rate():
+    scenario = dict(SCENARIO, connection_rate=None, duration_months=36)
+    assert scenario_mode(scenario)[1] == 'connection_rate'
+    solved = goal_seek(scenario, 'monthly_direct_cost', 45)
+    assert solved['metric'] == 'connection_rate'
+    assert solved['achieved'] == pytest.approx(45, abs=1e-4)
+    assert 'error' in goal_seek(scenario, 'connection_rate', 45)
+    assert 'error' in goal_seek(SCENARIO, 'duration_months', 45)
+
+
+def test_unreachable_target():
+    solved = goal_seek(SCENARIO, 'monthly_indirect_cost', 0.5)
+    assert solved['error'].startswith("break_even_months does not reach 0.50")
+    assert solved['valid_range'][0] == 0
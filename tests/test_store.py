@@ -0,0 +1,95 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from calculations import calculate_break_even
+from store import ScenarioStore, open_store
+from test_records import SCENARIO
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ScenarioStore(str(tmp_path / "scenarios.db"))
+    yield store
+    store.close()
+
+
+def run(**changes):
+    inputs = dict(SCENARIO, **changes)
+    return inputs, calculate_break_even(**inputs)
+
+
+def test_save_load_and_find(store):
+    inputs, result = run()
+    scenario_id = store.save(inputs, result, "2025-07", project="North")
+    saved = store.load(scenario_id)
+    assert saved['inputs'] == inputs and saved['result'] == result
+    assert saved['break_even_months'] == pytest.approx(result['break_even_months'])
+    # Key order and int/float spelling do not make a different scenario
+    reordered = dict(reversed(list(dict(inputs, connection_rate=40.0).items())))
+    assert store.find(reordered, "2025-07", project="North")['id'] == scenario_id
+    assert store.find(inputs, "2026-01", project="North") is None
+    assert store.find(inputs, "2025-07") is None
+
+
+def test_saving_again_replaces_the_row(store):
+    inputs, result = run()
+    first = store.save(inputs, result, "2025-07", created_at=datetime(2025, 1, 1))
+    second = store.save(inputs, {**result, 'break_even_months': 1.0}, "2025-07", created_at=datetime(2025, 2, 1))
+    assert first == second and len(store) == 1
+    assert store.load(first)['result']['break_even_months'] == 1.0
+    assert store.load(first)['created_at'] == "2025-02-01T00:00:00"
+
+
+def test_list_filters_and_orders(store):
+    runs = [run(connection_rate=rate) for rate in (35, 40, 50, 60, 0.01)]
+    ids = store.save_many(runs, "2025-07", project="South")
+    assert len(set(ids)) == 5
+    assert [row['connection_rate'] for row in store.list(feasible=True, order_by='connection_rate', descending=False)] == [35, 40, 50, 60]
+    assert [row['id'] for row in store.list(feasible=False)] == [ids[4]]
+    assert len(store.list(connection_rate=(38, 55))) == 2
+    assert len(store.list(break_even_months=(None, 60))) == 2
+    assert len(store.list(limit=2, offset=4)) == 1
+    assert store.projects() == ["South"]
+    with pytest.raises(ValueError):
+        store.list(order_by="inputs; DROP TABLE scenarios")
+    with pytest.raises(ValueError):
+        store.list(inputs=(0, 1))
+
+
+def test_get_or_compute_only_computes_once(store):
+    inputs, result = run()
+    calls = []
+    compute = lambda: calls.append(1) or result
+    assert store.get_or_compute(inputs, "2025-07", compute) == result
+    assert store.get_or_compute(inputs, "2025-07", compute) == result
+    assert len(calls) == 1
+
+
+def test_diff(store):
+    first = store.save(*run(), "2025-07")
+    second = store.save(*run(connection_rate=50, water_params=dict(SCENARIO['water_params'], pipe_cost_25=11)), "2025-07")
+    rows = {(row['section'], row['field']): row for row in store.diff(first, second)}
+    assert rows[('input', 'connection_rate')]['change'] == 10
+    assert rows[('input', 'water_pipe_cost_25')]['change_percent'] == pytest.approx(10)
+    assert ('result', 'break_even_months') in rows
+    assert ('input', 'current_expenses') not in rows
+    store.delete(first)
+    with pytest.raises(KeyError):
+        store.diff(first, second)
+
+
+def test_shared_store_is_safe_across_threads(tmp_path):
+    store = open_store(str(tmp_path / "shared.db"))
+    assert open_store(str(tmp_path / "shared.db")) is store
+
+    def save(rate):
+        store.save(*run(connection_rate=rate), "2025-07")
+
+    threads = [threading.Thread(target=save, args=(40 + i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store) == 8